@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 """Add Coupon_Applicable column to Skincare _ SHISEIDO.csv with randomized distribution:
-   SAVE10 50%, SAVE15 25%, SAVE20 15%, blank 10%."""
-import csv
-import random
+   SAVE10 50%, SAVE15 25%, SAVE20 15%, blank 10%.
+
+Rows are ranked by a hash of ``--seed`` and their Name_URL, and the ranks are
+cut at the exact per-code counts. So the same feed always gets the same codes,
+re-running leaves the file unchanged, and adding or removing a row only moves
+the rows next to a count boundary."""
+import argparse
 from pathlib import Path
 
+from csv_transforms import AssignFromDistribution, run_pipeline
+
 ROOT = Path(__file__).resolve().parent
 CSV_PATH = ROOT / "Skincare _ SHISEIDO.csv"
 COLUMN_NAME = "Coupon_Applicable"
+KEY_COLUMN = "Name_URL"
+COUPON_SEED = "shiseido-coupons"
 
 # Ratios: SAVE10 50%, SAVE15 25%, SAVE20 15%, blank 10%
 COUPON_DISTRIBUTION = [
@@ -18,55 +26,17 @@ COUPON_DISTRIBUTION = [
 ]
 
 
-def main():
-    with open(CSV_PATH, "r", encoding="utf-8", newline="") as f:
-        reader = csv.reader(f)
-        header = next(reader)
-        rows = list(reader)
-
-    n = len(rows)
-    if n == 0:
-        print("No data rows found.")
-        return
-
-    # Build list of coupon values by count (round so total = n)
-    counts = []
-    remainder = n
-    for code, ratio in COUPON_DISTRIBUTION[:-1]:
-        c = round(n * ratio)
-        counts.append((code, c))
-        remainder -= c
-    # Last bucket gets the remainder so sum is exactly n
-    counts.append((COUPON_DISTRIBUTION[-1][0], remainder))
-
-    coupon_values = []
-    for code, count in counts:
-        coupon_values.extend([code] * count)
-    random.shuffle(coupon_values)
-
-    # Append new column to header and each row
-    if COLUMN_NAME not in header:
-        header.append(COLUMN_NAME)
-
-    for i, row in enumerate(rows):
-        value = coupon_values[i] if i < len(coupon_values) else ""
-        row.append(value)
-        rows[i] = row
+def build_stage(seed=COUPON_SEED):
+    # Exact counts per code (rounded so the total is n), cut from a seeded ranking of the rows.
+    return AssignFromDistribution(COLUMN_NAME, COUPON_DISTRIBUTION, seed=seed, key_column=KEY_COLUMN)
 
-    with open(CSV_PATH, "w", encoding="utf-8", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(header)
-        writer.writerows(rows)
 
-    # Report
-    from collections import Counter
-    actual = Counter(coupon_values)
-    print(f"Added column '{COLUMN_NAME}' to {CSV_PATH}")
-    print(f"Total data rows: {n}")
-    for code, count in counts:
-        label = repr(code) if code else "(blank)"
-        print(f"  {label}: {count} ({100 * count / n:.1f}%)")
-    print("Actual distribution:", dict(actual))
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assign coupon codes to the CSV.")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH)
+    parser.add_argument("--seed", default=COUPON_SEED, help=f"assignment seed (default: {COUPON_SEED})")
+    args = parser.parse_args(argv)
+    run_pipeline(args.csv, [build_stage(args.seed)])
 
 
 if __name__ == "__main__":
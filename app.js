@@ -1,4 +1,5 @@
 const STATIC_CATALOG_PATH = "./shiseido-catalog.json";
+const CATALOG_SHARDS_PATH = "./shiseido-catalog.shards/";
 const IS_GITHUB_PAGES =
   typeof window !== "undefined" && /github\.io$/i.test(window.location.hostname);
 const APP_CONFIG =
@@ -64,6 +65,9 @@ const searchButton = document.getElementById("searchButton");
 const scrollToBottomBtn = document.getElementById("scrollToBottom");
 
 let allProducts = [];
+let productsById = new Map();
+let productDetailPaths = new Map();
+const productDetailRequests = new Map();
 let activeFilter = null;
 let lastQuery = "";
 let lastResultProducts = [];
@@ -192,20 +196,28 @@ function rotateImages(images = [], offset = 1) {
   return normalized.slice(shift).concat(normalized.slice(0, shift));
 }
 
-function getProductCarouselImages(product, fallbackImage) {
+function getImageDerivative(product, imagePath, size) {
+  // image_meta is written by `catalog_adapter.py --derivatives`; without it the original is used.
+  const meta = (product?.image_meta || []).find((entry) => entry.src === imagePath);
+  const derivative = (meta?.derivatives || []).find((entry) => entry.size === size);
+  return derivative?.src || imagePath;
+}
+
+function getProductCarouselImages(product, fallbackImage, size = "pdp") {
   const gallery = Array.isArray(product?.image_gallery)
     ? product.image_gallery.filter((image) => isRenderableImagePath(image))
     : [];
-  const baseImages = gallery.length
+  const baseImages = (gallery.length
     ? gallery
-    : [product?.image_url].filter((image) => isRenderableImagePath(image));
+    : [product?.image_url].filter((image) => isRenderableImagePath(image))
+  ).map((image) => getImageDerivative(product, image, size));
   const normalized = baseImages.length ? baseImages : [fallbackImage];
   return rotateImages(normalized, 1);
 }
 
 function getPrimaryProductImage(product, fallbackIndex = 0) {
   const fallbackImage = getFallbackImageUrl(product?.name, fallbackIndex);
-  const carouselImages = getProductCarouselImages(product, fallbackImage);
+  const carouselImages = getProductCarouselImages(product, fallbackImage, "plp");
   const primaryImage = carouselImages[0] || fallbackImage;
   const isPlaceholder =
     typeof primaryImage === "string" && primaryImage.includes("placehold.co");
@@ -246,7 +258,7 @@ function formatCartColor(value) {
 
 function getPlpPrimaryImage(product, fallbackIndex = 0) {
   const fallbackImage = getFallbackImageUrl(product?.name, fallbackIndex);
-  const carouselImages = getProductCarouselImages(product, fallbackImage);
+  const carouselImages = getProductCarouselImages(product, fallbackImage, "plp");
   const primaryImage = carouselImages[0] || fallbackImage;
   const isPlaceholder =
     typeof primaryImage === "string" && primaryImage.includes("placehold.co");
@@ -2060,12 +2072,16 @@ function openProductPdp(product) {
   if (!product) return;
   activePdpProduct = product;
   addBubble("user", product.name);
+  // The detail shard downloads while the loading bubble shows.
+  const detailReady = loadProductDetail(product).then((detail) => Object.assign(product, detail));
   runWithLatency(() => {
-    const pdpBubble = createPdpBubble(product);
-    chatEl.append(pdpBubble);
-    setupPdpSticky(pdpBubble);
-    scrollChatElementIntoView(pdpBubble);
-    updateScrollButton();
+    detailReady.then(() => {
+      const pdpBubble = createPdpBubble(product);
+      chatEl.append(pdpBubble);
+      setupPdpSticky(pdpBubble);
+      scrollChatElementIntoView(pdpBubble);
+      updateScrollButton();
+    });
   });
 }
 
@@ -3229,7 +3245,14 @@ function scorePairingCandidate(sourceProduct, candidate, preferredRoles) {
   return score;
 }
 
+// similar_ids / pairing_ids are ranked by catalog_adapter.py with the same
+// weights as the scorers above; scan only for catalogs built without them.
+function getPrecomputedCandidates(ids) {
+  return ids.map((id) => productsById.get(String(id))).filter(Boolean);
+}
+
 function getPairingCandidates(product) {
+  if (Array.isArray(product?.pairing_ids)) return getPrecomputedCandidates(product.pairing_ids);
   const preferredRoles = getSuggestedPairingRoles(product);
   return allProducts
     .map((candidate) => ({
@@ -3267,6 +3290,7 @@ function scoreSimilarCandidate(sourceProduct, candidate) {
 }
 
 function getSimilarCandidates(product) {
+  if (Array.isArray(product?.similar_ids)) return getPrecomputedCandidates(product.similar_ids);
   return allProducts
     .map((candidate) => ({
       product: candidate,
@@ -3278,6 +3302,14 @@ function getSimilarCandidates(product) {
     .slice(0, 10);
 }
 
+function getCartUpsellPool(source, state) {
+  // Union of the build-time pairing lists of the source and the cart items; null when the catalog has none.
+  const ids = [source, ...(state?.items || []).map((item) => productsById.get(String(item.id)))]
+    .filter((product) => Array.isArray(product?.pairing_ids))
+    .flatMap((product) => product.pairing_ids.map(String));
+  return ids.length ? getPrecomputedCandidates([...new Set(ids)]) : null;
+}
+
 function getCartUpsellCandidates(sourceProduct, state, preferredRoles) {
   const source = sourceProduct || null;
   if (!source) return [];
@@ -3285,7 +3317,14 @@ function getCartUpsellCandidates(sourceProduct, state, preferredRoles) {
     ? preferredRoles
     : getSuggestedPairingRoles(source);
   const cartIds = new Set((state?.items || []).map((item) => String(item.id)));
-  return allProducts
+  const pool = getCartUpsellPool(source, state);
+  const results = pool ? rankCartUpsells(pool, source, roles, cartIds) : [];
+  // Without pairing lists, or when none holds the requested roles, score the whole catalog.
+  return results.length ? results : rankCartUpsells(allProducts, source, roles, cartIds);
+}
+
+function rankCartUpsells(candidates, source, roles, cartIds) {
+  return candidates
     .map((candidate) => ({
       product: candidate,
       score: scorePairingCandidate(source, candidate, roles),
@@ -4769,7 +4808,7 @@ function createCarouselBubble(products, message) {
       }
     });
     const fallbackImage = getFallbackImageUrl(product.name, index);
-    const carouselImages = getProductCarouselImages(product, fallbackImage);
+    const carouselImages = getProductCarouselImages(product, fallbackImage, "plp");
     const primaryImage = carouselImages[0] || fallbackImage;
     const isPlaceholder =
       typeof primaryImage === "string" && primaryImage.includes("placehold.co");
@@ -6512,6 +6551,51 @@ function extractCatalogProducts(payload) {
   return [];
 }
 
+async function fetchJson(url) {
+  const response = await fetch(url);
+  if (!response.ok) throw new Error(`Could not load ${url}`);
+  return response.json();
+}
+
+async function loadShardedCatalog() {
+  const manifest = await fetchJson(`${CATALOG_SHARDS_PATH}manifest.json`);
+  const pages = await Promise.all(
+    (manifest.listing || []).map((page) => fetchJson(`${CATALOG_SHARDS_PATH}${page.path}`))
+  );
+  productDetailPaths = new Map(Object.entries(manifest.details || {}));
+  return pages.flatMap((page) => extractCatalogProducts(page));
+}
+
+async function loadCatalogProducts() {
+  try {
+    return await loadShardedCatalog();
+  } catch {
+    // No shards deployed: fall back to the single catalog file, which has every field.
+    productDetailPaths = new Map();
+    return extractCatalogProducts(await fetchJson(STATIC_CATALOG_PATH));
+  }
+}
+
+function loadProductDetail(product) {
+  const productId = String(product?.id ?? "");
+  const detailPath = productDetailPaths.get(productId);
+  if (!detailPath) return Promise.resolve({});
+  if (!productDetailRequests.has(productId)) {
+    const request = fetchJson(`${CATALOG_SHARDS_PATH}${detailPath}`)
+      .then((detail) => {
+        const catalogProduct = productsById.get(productId);
+        if (catalogProduct) Object.assign(catalogProduct, detail);
+        return detail;
+      })
+      .catch(() => {
+        productDetailRequests.delete(productId);
+        return {};
+      });
+    productDetailRequests.set(productId, request);
+  }
+  return productDetailRequests.get(productId);
+}
+
 async function requestAgentResponse(query, intentFilters) {
   if (IS_GITHUB_PAGES && !API_BASE_URL) {
     throw new Error("Static deployment does not expose the chat API.");
@@ -6722,16 +6806,11 @@ function setupEvents() {
   observer.observe(chatEl, { childList: true });
 }
 
-fetch(STATIC_CATALOG_PATH)
-  .then((response) => {
-    if (!response.ok) throw new Error("Catalog not found");
-    return response.json();
-  })
-  .then((catalog) => {
-    allProducts = extractCatalogProducts(catalog).map((product) =>
-      normalizeCatalogProduct(product)
-    );
+loadCatalogProducts()
+  .then((products) => {
+    allProducts = products.map((product) => normalizeCatalogProduct(product));
     allProducts = shuffle(allProducts);
+    productsById = new Map(allProducts.map((product) => [String(product.id), product]));
     setupEvents();
     addIntroSection();
     updateScrollButton();
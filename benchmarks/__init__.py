@@ -0,0 +1 @@
+"""Benchmarks for the catalog pipeline (catalog_adapter.py and the CSV column scripts)."""
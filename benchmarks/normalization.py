@@ -0,0 +1,129 @@
+"""Scalar vs batch text normalisation: equivalence check and timings.
+
+``--check`` runs every cell of the real feed plus generated edge cases
+(CR/LF mixes, tabs, no-break and exotic Unicode spaces, the batch
+separator itself) through ``normalize_block``/``normalize_inline`` with each
+engine and reports any difference. Timings stream a synthetic feed through
+``parse_row`` and ``apply_row`` chunk by chunk, so a 1M-row run needs one
+chunk of memory, and compare the products each engine builds.
+
+    python3 -m benchmarks.normalization --check
+    python3 -m benchmarks.normalization --rows 1000000
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import random
+import time
+
+import catalog_adapter
+from benchmarks.synthetic import iter_synthetic_rows, load_templates
+
+FUZZ_ALPHABET = ["a", "b", " ", "  ", "\t", "\n", "\r", "\r\n", "\xa0", " ", "　", "\x0b", "\x1c", "\x00", "."]
+
+
+def fuzz_values(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return ["".join(rng.choices(FUZZ_ALPHABET, k=rng.randint(1, 40))) for _ in range(count)]
+
+
+def check_equivalence(rows: list, extra_values: list) -> int:
+    """Compare both engines over ``rows`` (primed as a batch) and ``extra_values``; returns mismatches."""
+    values = list(dict.fromkeys(
+        [value for row in rows for value in row.values() if isinstance(value, str)] + extra_values
+    ))
+    catalog_adapter.set_normalizer("scalar")
+    blocks = [catalog_adapter.normalize_block(value) for value in values]
+    inlines = [catalog_adapter.normalize_inline(value) for value in values]
+    reinlined = [catalog_adapter.normalize_inline(block) for block in blocks]
+
+    mismatches = 0
+    batch_blocks = catalog_adapter.normalize_block_batch(values)
+    mismatches += sum(1 for got, want in zip(batch_blocks, blocks) if got != want)
+    batch_inlines = catalog_adapter.normalize_inline_batch(blocks)
+    mismatches += sum(1 for got, want in zip(batch_inlines, inlines) if got != want)
+
+    try:
+        catalog_adapter.set_normalizer("batch").prime(rows)
+        for value, block, inline, again in zip(values, blocks, inlines, reinlined):
+            if catalog_adapter.normalize_block(value) != block:
+                mismatches += 1
+            if catalog_adapter.normalize_inline(value) != inline:
+                mismatches += 1
+            if catalog_adapter.normalize_inline(block) != again:
+                mismatches += 1
+    finally:
+        catalog_adapter.set_normalizer("scalar")
+    print(f"Checked {len(values)} distinct values: {mismatches} mismatches")
+    return mismatches
+
+
+def reparsed(chunk: list, header: list) -> list:
+    """Round-trip rows through the csv module so cells are fresh strings, as ``read_rows`` yields them."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=header)
+    writer.writerows(chunk)
+    buffer.seek(0)
+    return list(csv.DictReader(buffer, fieldnames=header))
+
+
+def time_engine(engine: str, rows: int, seed: int, chunk_size: int, image_index: dict) -> dict:
+    header, _ = load_templates()
+    memo = catalog_adapter.set_normalizer(engine)
+    digest = hashlib.sha1()
+    seconds = 0.0
+    try:
+        for chunk in catalog_adapter.iter_chunks(iter_synthetic_rows(rows, seed), chunk_size):
+            chunk = reparsed(chunk, header)
+            started = time.perf_counter()
+            catalog_adapter.prime_text(chunk)
+            products_by_key = {}
+            for row in chunk:
+                fields = catalog_adapter.parse_row(row, image_index)
+                if fields:
+                    catalog_adapter.apply_row(products_by_key, fields)
+            if memo is not None:
+                memo.clear()
+            seconds += time.perf_counter() - started
+            products = {key: dict(product) for key, product in products_by_key.items()}
+            digest.update(json.dumps(products, sort_keys=True).encode("utf-8"))
+    finally:
+        catalog_adapter.set_normalizer("scalar")
+    return {"engine": engine, "seconds": seconds, "rows_per_sec": rows / seconds, "digest": digest.hexdigest()}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the scalar and batch normalisation engines.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="synthetic rows to time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=catalog_adapter.NORMALIZE_BATCH_ROWS)
+    parser.add_argument("--check", action="store_true", help="only run the equivalence check")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rows = list(catalog_adapter.read_rows(catalog_adapter.CSV_PATH))
+    if check_equivalence(rows, fuzz_values(20_000, args.seed)):
+        raise SystemExit(1)
+    if args.check:
+        return
+
+    image_index = catalog_adapter.build_image_index(catalog_adapter.IMAGES_ROOT)
+    results = [
+        time_engine(engine, args.rows, args.seed, args.chunk_size, image_index)
+        for engine in catalog_adapter.NORMALIZE_ENGINES
+    ]
+    print(f"{'engine':<8} {'seconds':>9} {'rows/sec':>10}")
+    for result in results:
+        print(f"{result['engine']:<8} {result['seconds']:>9.2f} {result['rows_per_sec']:>10.0f}")
+    scalar, batch = results
+    print(f"Speedup {scalar['seconds'] / batch['seconds']:.2f}x, products identical: {scalar['digest'] == batch['digest']}")
+    if scalar["digest"] != batch["digest"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
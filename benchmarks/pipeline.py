@@ -0,0 +1,193 @@
+"""Stage-by-stage benchmark of the catalog pipeline on synthetic feeds.
+
+Each feed size runs in a fresh interpreter so peak RSS belongs to that size
+alone. Stage times come from ``catalog_adapter.Profiler`` and are exclusive,
+so ``normalize_inline`` inside ``extract_features`` counts once, under
+normalisation.
+
+    python3 -m benchmarks.pipeline --rows 1000 100000
+    python3 -m benchmarks.pipeline --rows 1000 --update-baseline
+
+Results go to stdout as JSON (or to ``--output``). Any stage whose time per
+row regressed past ``--tolerance`` against ``benchmarks/baseline.json`` is
+reported, and the exit status is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import add_coupon_column
+import add_promotions_column
+import catalog_adapter
+import clean_overview_columns
+from benchmarks.synthetic import write_synthetic_csv
+from csv_transforms import run_pipeline
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+STAGES = list(catalog_adapter.PROFILE_STAGES)
+
+
+def run_adapter(csv_path: Path, output_path: Path) -> dict:
+    catalog_adapter.set_normalizer("batch")
+    profiler = catalog_adapter.Profiler().install()
+    started = time.perf_counter()
+    try:
+        image_index = catalog_adapter.build_image_index(catalog_adapter.IMAGES_ROOT)
+        groups = catalog_adapter.group_rows(catalog_adapter.read_rows(csv_path))
+        products_by_key = catalog_adapter.build_groups(groups, image_index)
+        finalized = catalog_adapter.finalize_products(products_by_key)
+        catalog_adapter.write_catalog((product for _, product in finalized), output_path)
+    finally:
+        profiler.uninstall()
+    total = time.perf_counter() - started
+    return {
+        "total_seconds": total,
+        "products": len(finalized),
+        "stages": {
+            stage: {"seconds": totals["wall"], "cpu_seconds": totals["cpu"], "calls": totals["calls"]}
+            for stage, totals in profiler.stage_totals().items()
+        },
+    }
+
+
+def run_column_scripts(csv_path: Path) -> dict:
+    """Time each column script on its own copy of the feed, with output silenced."""
+    results = {}
+    for module in (add_coupon_column, add_promotions_column, clean_overview_columns):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            copy = Path(tmp_dir) / csv_path.name
+            shutil.copyfile(csv_path, copy)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_pipeline(copy, [module.build_stage()])
+            results[module.__name__] = {"seconds": time.perf_counter() - started}
+    return results
+
+
+def run_size(rows: int, seed: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="catalog-bench-") as tmp_dir:
+        csv_path = write_synthetic_csv(Path(tmp_dir) / "feed.csv", rows, seed)
+        result = {"rows": rows, "feed_bytes": csv_path.stat().st_size}
+        result.update(run_adapter(csv_path, Path(tmp_dir) / "catalog.json"))
+        result["rows_per_sec"] = rows / result["total_seconds"]
+        result["column_scripts"] = run_column_scripts(csv_path)
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def run_isolated(rows: int, seed: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.pipeline", "--single", str(rows), "--seed", str(seed)],
+        cwd=Path(catalog_adapter.ROOT),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def best_of(runs: list) -> dict:
+    """Combine repeated runs of one size, keeping each timing's fastest value."""
+    best = dict(runs[0])
+    best["total_seconds"] = min(run["total_seconds"] for run in runs)
+    best["rows_per_sec"] = best["rows"] / best["total_seconds"]
+    best["peak_rss_kb"] = max(run["peak_rss_kb"] for run in runs)
+    best["stages"] = {
+        stage: min((run["stages"][stage] for run in runs), key=lambda data: data["seconds"])
+        for stage in best["stages"]
+    }
+    best["column_scripts"] = {
+        name: min((run["column_scripts"][name] for run in runs), key=lambda data: data["seconds"])
+        for name in best["column_scripts"]
+    }
+    best["repeats"] = len(runs)
+    return best
+
+
+def per_row_timings(result: dict) -> dict:
+    rows = result["rows"]
+    timings = {stage: data["seconds"] / rows for stage, data in result["stages"].items()}
+    timings["total"] = result["total_seconds"] / rows
+    for name, data in result.get("column_scripts", {}).items():
+        timings[name] = data["seconds"] / rows
+    return timings
+
+
+def find_regressions(results: list, baseline: dict, tolerance: float, min_seconds: float) -> list:
+    """Stages whose per-row time exceeds the baseline by more than ``tolerance``."""
+    regressions = []
+    for result in results:
+        reference = baseline.get(str(result["rows"]))
+        if not reference:
+            continue
+        current = per_row_timings(result)
+        previous = per_row_timings(reference)
+        for stage, seconds in current.items():
+            before = previous.get(stage)
+            # Stages too short to time reliably are skipped.
+            if not before or before * result["rows"] < min_seconds:
+                continue
+            if seconds > before * (1 + tolerance):
+                regressions.append(
+                    f"{result['rows']} rows: {stage} {seconds * 1e6:.1f}us/row "
+                    f"vs baseline {before * 1e6:.1f}us/row"
+                )
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the catalog pipeline on synthetic feeds.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000], help="feed sizes, e.g. 1000 100000 1000000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size; the fastest timings are kept")
+    parser.add_argument("--output", type=Path, help="write results JSON here instead of stdout")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown per stage (0.25 = 25%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.01, help="ignore stages faster than this")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.single:
+        print(json.dumps(run_size(args.single, args.seed)))
+        return
+
+    results = [
+        best_of([run_isolated(rows, args.seed) for _ in range(args.repeat)]) for rows in args.rows
+    ]
+    report = json.dumps({"results": results}, indent=2)
+    if args.output:
+        args.output.write_text(report, encoding="utf-8")
+    else:
+        print(report)
+
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+        baseline.update({str(result["rows"]): result for result in results})
+        args.baseline.write_text(json.dumps(baseline, indent=2), encoding="utf-8")
+        print(f"Updated baseline {args.baseline}", file=sys.stderr)
+        return
+
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = find_regressions(results, baseline, args.tolerance, args.min_seconds)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
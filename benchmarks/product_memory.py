@@ -0,0 +1,111 @@
+"""Memory per product while a feed is merged: plain dicts vs ``catalog_adapter.Product`` records.
+
+A synthetic feed streams through ``parse_row`` and ``apply_row`` chunk by
+chunk, as ``--stream`` does, but every product stays in memory as it does
+in a default build. Retained bytes are summed with ``sys.getsizeof`` over
+everything reachable from the products. An object shared by several
+products counts once. For ``slots`` the interning vocabularies are
+counted too. Both models must give identical ``compact()`` output.
+
+    python3 -m benchmarks.product_memory --rows 1000000
+"""
+import argparse
+import hashlib
+import json
+import sys
+import time
+
+import catalog_adapter
+from benchmarks.normalization import reparsed
+from benchmarks.synthetic import iter_synthetic_rows, load_templates
+
+
+def retained_bytes(roots) -> int:
+    """``sys.getsizeof`` summed over every object reachable from ``roots``, each counted once."""
+    seen = set()
+    total = 0
+    stack = list(roots)
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        total += sys.getsizeof(value)
+        if isinstance(value, dict):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, catalog_adapter.Product):
+            stack.extend(getattr(value, name) for name in catalog_adapter.PRODUCT_FIELDS)
+    return total
+
+
+def measure(model: str, rows: int, seed: int, chunk_size: int, image_index: dict) -> dict:
+    header, _ = load_templates()
+    catalog_adapter.set_product_model(model)
+    catalog_adapter.clear_vocabularies()
+    memo = catalog_adapter.set_normalizer("batch")
+    products_by_key = {}
+    seconds = 0.0
+    try:
+        for chunk in catalog_adapter.iter_chunks(iter_synthetic_rows(rows, seed), chunk_size):
+            chunk = reparsed(chunk, header)
+            started = time.perf_counter()
+            catalog_adapter.prime_text(chunk)
+            for row in chunk:
+                fields = catalog_adapter.parse_row(row, image_index)
+                if fields:
+                    catalog_adapter.apply_row(products_by_key, fields)
+            memo.clear()
+            seconds += time.perf_counter() - started
+    finally:
+        catalog_adapter.set_product_model("slots")
+        catalog_adapter.set_normalizer("scalar")
+    roots = list(products_by_key.values())
+    if model == "slots":
+        roots += catalog_adapter.PRODUCT_VOCABULARIES.values()
+    total = retained_bytes(roots)
+    digest = hashlib.sha1()
+    for product in products_by_key.values():
+        digest.update(json.dumps(catalog_adapter.compact(product)).encode("utf-8"))
+    return {
+        "model": model,
+        "products": len(products_by_key),
+        "seconds": seconds,
+        "mb": total / 2**20,
+        "bytes_per_product": total / max(1, len(products_by_key)),
+        "digest": digest.hexdigest(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare retained memory per product for each product model.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="synthetic feed rows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=catalog_adapter.NORMALIZE_BATCH_ROWS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    image_index = catalog_adapter.build_image_index(catalog_adapter.IMAGES_ROOT)
+    results = [
+        measure(model, args.rows, args.seed, args.chunk_size, image_index)
+        for model in catalog_adapter.PRODUCT_MODELS
+    ]
+    print(f"{args.rows} rows, {results[0]['products']} products")
+    print(f"{'model':<6} {'merge s':>8} {'retained MB':>12} {'bytes/product':>14}")
+    for result in results:
+        print(f"{result['model']:<6} {result['seconds']:>8.1f} {result['mb']:>12.1f} {result['bytes_per_product']:>14.0f}")
+    before, after = results
+    print(
+        f"{before['bytes_per_product'] / after['bytes_per_product']:.2f}x less memory per product, "
+        f"compact() output identical: {before['digest'] == after['digest']}"
+    )
+    if before["digest"] != after["digest"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Size of the shopper agent's prompt: full descriptions vs build-time ``prompt_summary`` text.
+
+For each request of the ``benchmarks.query_service`` workload,
+``catalog_query.load_service`` loads the catalog as server.js does and
+ranks the candidates. The user message ``buildAgentResponse`` would send is
+then built from ``buildPromptCandidate``'s objects. ``legacy`` sends each
+full description. ``summary`` replaces it with the summary cut to each
+budget, as server.js does when the catalog has one. Summaries are cut from
+the adapter's products, as a build writes them.
+Tokens are ``catalog_adapter.approx_tokens``.
+
+    python3 -m benchmarks.prompt_size --requests 1000 --budgets 32 64 96
+"""
+import argparse
+import json
+import statistics
+
+import catalog_adapter
+import catalog_query
+from benchmarks.query_service import workload
+from catalog_search import load_products
+
+PROMPT_CANDIDATES = 12
+PROMPT_PREFIX = "Return JSON that matches the schema exactly.\n"
+
+
+def js_number(value):
+    """``JSON.stringify`` writes integral floats without a fraction."""
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def legacy_candidate(product: dict) -> dict:
+    """``buildPromptCandidate`` in server.js without a ``prompt_summary``, over a ``normalize_catalog_product`` result."""
+    return {
+        "id": product["id"],
+        "name": product["name"],
+        "category": product["category"],
+        "productType": product["product_type"],
+        "price": js_number(product["price"]),
+        "rating": js_number(product["rating"]),
+        "concerns": product["concerns"],
+        "benefits": product["benefits"],
+        "collections": product["collections"],
+        "coupon": product["coupon_applicable"],
+        "promotions": product["promotions"],
+        "description": product["description"],
+    }
+
+
+def user_message(request: dict, candidates: list) -> str:
+    payload = {
+        "shopperMessage": request["query"],
+        "activeFilter": request["activeFilter"],
+        "refinementIds": request["refinementIds"],
+        "currentIntentFilters": request["intentFilters"],
+        "recentConversation": [],
+        "candidateProducts": candidates,
+    }
+    return PROMPT_PREFIX + json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def measure(requests: list, ranked: list, candidate) -> dict:
+    messages = [
+        user_message(request, [candidate(product) for product in products])
+        for request, products in zip(requests, ranked)
+    ]
+    tokens = [catalog_adapter.approx_tokens(message) for message in messages]
+    return {
+        "bytes": statistics.mean(len(message.encode("utf-8")) for message in messages),
+        "tokens": statistics.mean(tokens),
+        "max_tokens": max(tokens),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare prompt sizes with full candidates and prompt summaries.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[32, catalog_adapter.PROMPT_SUMMARY_TOKENS, 96])
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    products = load_products(catalog_adapter.OUTPUT_PATH)
+    service = catalog_query.load_service()
+    by_id = {product["id"]: product for product in service.products}
+    requests = workload(args.requests, args.seed)
+    ranked = [
+        [by_id[product_id] for product_id in service.candidates(
+            request["query"], request["activeFilter"], request["intentFilters"], request["refinementIds"]
+        )[:PROMPT_CANDIDATES]]
+        for request in requests
+    ]
+    rows = [("legacy", measure(requests, ranked, legacy_candidate))]
+    for budget in sorted(set(args.budgets)):
+        summaries = {product["id"]: catalog_adapter.prompt_summary(product, budget) for product in products}
+        summary = lambda product, summaries=summaries: dict(
+            legacy_candidate(product), description=summaries[product["id"]] or product["description"]
+        )
+        rows.append((f"summary {budget}", measure(requests, ranked, summary)))
+
+    print(f"{len(products)} products, {len(requests)} requests, up to {PROMPT_CANDIDATES} candidates each")
+    print(f"{'candidates':<12} {'mean bytes':>10} {'mean tokens':>11} {'max tokens':>10} {'vs legacy':>9}")
+    legacy = rows[0][1]["tokens"]
+    for name, row in rows:
+        print(
+            f"{name:<12} {row['bytes']:>10.0f} {row['tokens']:>11.0f} {row['max_tokens']:>10} "
+            f"{row['tokens'] / legacy:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
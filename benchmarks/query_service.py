@@ -0,0 +1,226 @@
+"""Load test for catalog_query.py: latency percentiles and throughput over HTTP.
+
+The workload is a grid of queries, active filters, intent filters and
+refinement ids, sampled with Zipf-like weights so popular requests repeat as
+they do in real traffic. Each Python target runs in its own interpreter,
+so client and server do not share a GIL:
+
+- ``indexed`` is ``QueryService`` with its LRU cache
+- ``uncached`` is the same service with the cache off
+- ``linear`` is a port of server.js's full scan per request
+
+``--js-url`` adds the real JS ranking as a baseline. Point it at
+``/api/chat`` on ``npm start`` with no ``OPENAI_API_KEY`` and no
+``CATALOG_QUERY_URL``, so every request runs ``getRankedCandidates``. The
+``agree`` column counts requests whose top 5 ids match the Python service.
+
+    python3 -m benchmarks.query_service --requests 5000 --concurrency 8
+    python3 -m benchmarks.query_service --products 10000 --targets indexed linear
+    python3 -m benchmarks.query_service --js-url http://localhost:8080/api/chat
+"""
+import argparse
+import http.client
+import itertools
+import json
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import catalog_adapter
+import catalog_query
+from benchmarks.related import synthetic_catalog
+from catalog_search import CHECK_FILTERS, CHECK_INTENTS, decode_search_index
+
+TARGETS = ["indexed", "uncached", "linear"]
+WORKLOAD_QUERIES = [
+    "hydrating serum",
+    "sunscreen for oily skin",
+    "anti aging eye cream",
+    "gentle cleanser sensitive skin",
+    "vitamin c brightening",
+    "gift set",
+    "spf 50+ daily",
+    "moisturizer for dry skin",
+    "something for dark spots",
+    "lightweight day cream",
+    "night repair",
+    "Hydrating   Serum",
+]
+WORKLOAD_REFINEMENTS = [[], [], ["dry-skin"], ["best-rated"], ["with-spf", "under-50"], ["gentle-sensitive"]]
+AGREE_RESULTS = 5
+
+
+class LinearService:
+    """``getRankedCandidates``' full scan per request, behind the same HTTP handler."""
+
+    def __init__(self, products: list):
+        self.products = products
+
+    def candidates(self, query, active_filter=None, intent_filters=None, refinements=()):
+        return tuple(catalog_query.ranked_candidates_linear(
+            self.products, query, active_filter, intent_filters, refinements
+        ))
+
+    def cache_info(self) -> dict:
+        return {"hits": 0, "misses": 0, "size": 0, "max_size": 0}
+
+
+def load_catalog(products: int, seed: int) -> tuple:
+    if not products:
+        catalog = catalog_query.load_server_catalog(catalog_adapter.OUTPUT_PATH, catalog_adapter.CSV_PATH)
+    else:
+        catalog = synthetic_catalog(products, seed)
+    return catalog, decode_search_index(catalog_adapter.build_search_index(catalog))
+
+
+def serve(target: str, products: int, seed: int):
+    """Run one target on a free port and print the port; the parent reads it and starts the load."""
+    catalog, index = load_catalog(products, seed)
+    if target == "linear":
+        service = LinearService(catalog)
+    else:
+        service = catalog_query.QueryService(catalog, index, 0 if target == "uncached" else catalog_query.QUERY_CACHE_SIZE)
+    server = catalog_query.make_server(service, "127.0.0.1", 0)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def workload(count: int, seed: int) -> list:
+    grid = [
+        {"query": query, "activeFilter": active_filter or "", "intentFilters": intent, "refinementIds": refinements}
+        for query, active_filter, intent, refinements in itertools.product(
+            WORKLOAD_QUERIES, CHECK_FILTERS, CHECK_INTENTS, WORKLOAD_REFINEMENTS
+        )
+    ]
+    rng = random.Random(seed)
+    rng.shuffle(grid)
+    weights = [1 / (rank + 1) for rank in range(len(grid))]
+    return rng.choices(grid, weights=weights, k=count)
+
+
+def load_test(url: str, requests: list, concurrency: int) -> dict:
+    """POST every request with ``concurrency`` keep-alive clients; returns latencies and responses."""
+    parts = urlsplit(url)
+    latencies = [0.0] * len(requests)
+    responses = [None] * len(requests)
+    cursor = itertools.count()
+    errors = []
+
+    def client():
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+        try:
+            while (position := next(cursor)) < len(requests):
+                body = json.dumps(requests[position]).encode("utf-8")
+                started = time.perf_counter()
+                connection.request("POST", parts.path, body, {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                payload = response.read()
+                latencies[position] = time.perf_counter() - started
+                if response.status != 200:
+                    errors.append(f"HTTP {response.status}: {payload[:200]!r}")
+                    return
+                responses[position] = json.loads(payload)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise SystemExit(f"{url}: {errors[0]}")
+    return {"latencies": latencies, "responses": responses, "seconds": elapsed}
+
+
+def summarize(name: str, result: dict, cache=None, agree=None) -> dict:
+    latencies = sorted(result["latencies"])
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "target": name,
+        "requests": len(latencies),
+        "p50_ms": 1000 * quantiles[49],
+        "p99_ms": 1000 * quantiles[98],
+        "qps": len(latencies) / result["seconds"],
+        "cache_hit_rate": cache["hits"] / max(1, cache["hits"] + cache["misses"]) if cache else None,
+        "agree": agree,
+    }
+
+
+def health(port: int) -> dict:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("GET", "/health")
+        return json.loads(connection.getresponse().read())["cache"]
+    finally:
+        connection.close()
+
+
+def run_target(target: str, requests: list, args) -> tuple:
+    command = [sys.executable, "-m", "benchmarks.query_service", "--serve", target]
+    command += ["--products", str(args.products), "--seed", str(args.seed)]
+    server = subprocess.Popen(command, cwd=Path(catalog_adapter.ROOT), stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(server.stdout.readline())
+        result = load_test(f"http://127.0.0.1:{port}/candidates", requests, args.concurrency)
+        return result, health(port)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the catalog query service.")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--products", type=int, default=0, help="synthetic catalog size (default: the real catalog)")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--js-url", help="server.js /api/chat URL to use as the baseline")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serve", choices=TARGETS, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve:
+        serve(args.serve, args.products, args.seed)
+        return
+    requests = workload(args.requests, args.seed)
+    rows = []
+    top = {}
+    for target in args.targets:
+        result, cache = run_target(target, requests, args)
+        top[target] = [tuple(response["ids"][:AGREE_RESULTS]) for response in result["responses"]]
+        rows.append(summarize(target, result, cache if target != "linear" else None))
+    if args.js_url:
+        if args.products:
+            raise SystemExit("--js-url ranks server.js's own catalog; drop --products")
+        result = load_test(args.js_url, requests, args.concurrency)
+        js_top = [tuple(response["recommendedProductIds"]) for response in result["responses"]]
+        reference = top.get("indexed") or top.get("uncached") or top.get("linear")
+        agree = sum(left == right for left, right in zip(js_top, reference)) if reference else None
+        rows.append(summarize("server.js", result, agree=agree))
+
+    print(f"{'target':<10} {'requests':>8} {'p50 ms':>8} {'p99 ms':>8} {'QPS':>8} {'cache hits':>10} {'agree':>6}")
+    for row in rows:
+        hits = f"{100 * row['cache_hit_rate']:.0f}%" if row["cache_hit_rate"] is not None else "-"
+        agree = row["agree"] if row["agree"] is not None else "-"
+        print(
+            f"{row['target']:<10} {row['requests']:>8} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+            f"{row['qps']:>8.0f} {hits:>10} {agree:>6}"
+        )
+    mismatched = [target for target in top if top[target] != next(iter(top.values()))]
+    if mismatched:
+        raise SystemExit(f"Targets returned different rankings: {', '.join(mismatched)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Timings for the precomputed similar/pairing lists on synthetic catalogs.
+
+Synthetic catalogs clone products from ``shiseido-catalog.json`` with
+jittered ratings and a random subset of their concerns, so roles, families
+and concern vocabularies stay realistic while signatures multiply. Sizes up
+to ``--linear-max`` are also ranked with the all-pairs reference, and the
+lists must match.
+
+    python3 -m benchmarks.related --products 1000 10000 100000
+"""
+import argparse
+import json
+import random
+import time
+
+import catalog_adapter
+
+
+def synthetic_catalog(count: int, seed: int = 0) -> list:
+    templates = json.loads(catalog_adapter.OUTPUT_PATH.read_text(encoding="utf-8"))["products"]
+    rng = random.Random(seed)
+    products = []
+    for ordinal in range(count):
+        product = dict(rng.choice(templates))
+        product["id"] = f"synthetic-{ordinal + 1}"
+        rating = (product.get("star_rating") or 4) + rng.uniform(-1, 0.5)
+        product["star_rating"] = round(min(5, max(0, rating)), 1)
+        concerns = list(product.get("concerns") or [])
+        rng.shuffle(concerns)
+        product["concerns"] = concerns[: rng.randint(0, len(concerns))]
+        products.append(product)
+    return products
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time related-product ranking on synthetic catalogs.")
+    parser.add_argument("--products", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--linear-max", type=int, default=2000, help="largest size to check against all pairs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"{'products':>9} {'signatures':>10} {'indexed s':>10} {'all-pairs s':>12} identical")
+    failed = False
+    for count in args.products:
+        products = synthetic_catalog(count, args.seed)
+        signatures = len({
+            catalog_adapter.related_signature(catalog_adapter.related_features(product)) for product in products
+        })
+        started = time.perf_counter()
+        related = catalog_adapter.related_products(products)
+        indexed = time.perf_counter() - started
+        linear = identical = "-"
+        if count <= args.linear_max:
+            started = time.perf_counter()
+            same = related == catalog_adapter.related_products_linear(products)
+            linear = f"{time.perf_counter() - started:.2f}"
+            identical = str(same)
+            failed = failed or not same
+        print(f"{count:>9} {signatures:>10} {indexed:>10.2f} {linear:>12} {identical}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
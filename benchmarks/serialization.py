@@ -0,0 +1,97 @@
+"""Catalog serialisation: encode time and peak memory per backend and layout.
+
+Each installed ``catalog_adapter.SERIALIZERS`` backend writes a synthetic
+catalog (see ``benchmarks.related``) through ``write_catalog``, both
+readable and ``--compact``. ``legacy`` is the old single-string write,
+``json.dumps(indent=2)`` followed by ``write_text``. Times are the best of
+``--repeat`` untraced runs, and peak memory is a separate tracemalloc run,
+so the catalog itself is not counted. Backends must write identical bytes.
+
+    python3 -m benchmarks.serialization --products 10000 100000
+"""
+import argparse
+import hashlib
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import catalog_adapter
+from benchmarks.related import synthetic_catalog
+
+
+def write_legacy(products: list, output_path: Path, compact: bool):
+    separators = (",", ":") if compact else None
+    output_path.write_text(
+        json.dumps({"products": products}, indent=None if compact else 2, separators=separators), encoding="utf-8"
+    )
+
+
+def cases() -> list:
+    """``(backend, compact, write)`` for every backend and layout."""
+    found = [("legacy", compact, write_legacy) for compact in (False, True)]
+    for name in catalog_adapter.SERIALIZERS:
+        for compact in (False, True):
+            write = lambda products, path, compact, name=name: catalog_adapter.write_catalog(
+                products, path, serializer=name, compact=compact
+            )
+            found.append((name, compact, write))
+    return found
+
+
+def measure(write, products: list, output_path: Path, compact: bool, repeat: int) -> dict:
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        write(products, output_path, compact)
+        seconds.append(time.perf_counter() - started)
+    tracemalloc.start()
+    write(products, output_path, compact)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "seconds": min(seconds),
+        "peak_mb": peak / 2**20,
+        "bytes": output_path.stat().st_size,
+        "sha1": hashlib.sha1(output_path.read_bytes()).hexdigest(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time catalog serialisation backends on synthetic catalogs.")
+    parser.add_argument("--products", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"{'products':>9} {'backend':<8} {'layout':<8} {'seconds':>8} {'MB/s':>7} {'peak MB':>8} {'file MB':>8}")
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="catalog-serialise-") as tmp_dir:
+        output_path = Path(tmp_dir) / "catalog.json"
+        for count in args.products:
+            products = synthetic_catalog(count, args.seed)
+            digests = {}
+            for name, compact, write in cases():
+                result = measure(write, products, output_path, compact, args.repeat)
+                layout = "compact" if compact else "readable"
+                if name != "legacy":
+                    digests.setdefault(layout, set()).add(result["sha1"])
+                size_mb = result["bytes"] / 2**20
+                print(
+                    f"{count:>9} {name:<8} {layout:<8} {result['seconds']:>8.2f} "
+                    f"{size_mb / result['seconds']:>7.1f} {result['peak_mb']:>8.1f} {size_mb:>8.1f}"
+                )
+            for layout, found in digests.items():
+                if len(found) > 1:
+                    failed = True
+                    print(f"{count:>9} backends wrote different {layout} bytes")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
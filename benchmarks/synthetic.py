@@ -0,0 +1,71 @@
+"""Synthetic feeds with the exact ``Skincare _ SHISEIDO.csv`` schema.
+
+Rows are cloned from the real feed one product group at a time, so text
+lengths, the rows-per-key (duplicate) ratio, variants JSON and image
+references all follow the real data. Every synthetic product gets its own
+``Name_URL`` and a numbered title so keys and sort order stay distinct.
+"""
+import argparse
+import csv
+import random
+from pathlib import Path
+
+from catalog_adapter import CSV_PATH, group_rows, read_rows
+
+COUPON_CODES = ["SAVE10", "SAVE15", "SAVE20", ""]
+COUPON_WEIGHTS = [0.50, 0.25, 0.15, 0.10]
+PROMOTIONS = [
+    "10% off on skin essentials",
+    "15% off on new range",
+    "5% off on new launches",
+]
+
+
+def load_templates(source_csv: Path = CSV_PATH):
+    with open(source_csv, newline="", encoding="utf-8") as handle:
+        header = next(csv.reader(handle))
+    return header, list(group_rows(read_rows(source_csv)).values())
+
+
+def iter_synthetic_rows(rows: int, seed: int = 0, source_csv: Path = CSV_PATH):
+    """Yield ``rows`` synthetic row dicts; deterministic for a given seed."""
+    _, templates = load_templates(source_csv)
+    rng = random.Random(seed)
+    emitted = 0
+    product = 0
+    while emitted < rows:
+        group = rng.choice(templates)
+        product += 1
+        url = f"https://www.shiseido.com/us/en/synthetic-product-{product:07d}.html"
+        for template in group[: rows - emitted]:
+            row = dict(template)
+            row["Name_URL"] = url if rng.random() > 0.02 else f"{url}?cgid=skincare"
+            row["Name"] = f"{template['Name'].strip()} No. {product}"
+            row["product_title"] = f"{template['product_title'].strip()} No. {product}"
+            row["Coupon_Applicable"] = rng.choices(COUPON_CODES, COUPON_WEIGHTS)[0]
+            row["Promotions"] = rng.choice(PROMOTIONS)
+            yield row
+            emitted += 1
+
+
+def write_synthetic_csv(path: Path, rows: int, seed: int = 0, source_csv: Path = CSV_PATH) -> Path:
+    header, _ = load_templates(source_csv)
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.DictWriter(handle, fieldnames=header)
+        writer.writeheader()
+        writer.writerows(iter_synthetic_rows(rows, seed, source_csv))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic Shiseido-schema feed.")
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    write_synthetic_csv(args.output, args.rows, args.seed)
+    print(f"Wrote {args.rows} synthetic rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
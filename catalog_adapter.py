@@ -1,27 +1,306 @@
+import argparse
+import bisect
+import contextlib
 import csv
+import functools
+import hashlib
+import heapq
+import inspect
+import itertools
 import json
+import math
+import os
 import re
+import sqlite3
+import tempfile
+import time
+import unicodedata
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
+from catalog_columnar import columnar_path_for, write_columnar
+from catalog_dedupe import dedupe_log_path_for, describe as describe_dedupe, find_duplicates
+from catalog_images import derivatives_dir_for, verify_products
+from catalog_shards import shards_dir_for, write_shards
+from csv_chunks import ChunkedDictReader
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder writes the same bytes, only slower
+    orjson = None
+
 ROOT = Path(__file__).resolve().parent
 CSV_PATH = ROOT / "Skincare _ SHISEIDO.csv"
 IMAGES_ROOT = ROOT / "Skincare _ SHISEIDO_Images"
 OUTPUT_PATH = ROOT / "shiseido-catalog.json"
+ID_PREFIX = "shiseido-"
+
+MANIFEST_VERSION = 1
+IMAGE_CACHE_VERSION = 1
+SEARCH_INDEX_VERSION = 1
+
+SEARCH_TOKEN_SPLIT = re.compile(r"[^a-z0-9+]+")
+SEARCH_FIELDS = {"blob": 1, "name": 2, "category": 4}
+SEARCH_FACETS = ["concerns", "categories", "collections", "price_bands", "composition"]
+# (band, low, high): low < price <= high; the first band also takes unpriced products.
+PRICE_BANDS = [
+    ("under25", 0, 25),
+    ("25to50", 25, 50),
+    ("50to100", 50, 100),
+    ("over100", 100, float("inf")),
+]
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
 
+INGREDIENT_INDEX_VERSION = 1
+INGREDIENT_LOT_CODE = re.compile(r"<[^>]*>")
+# Drug-facts column labels that run into the first ingredient of a line.
+INGREDIENT_LABEL = re.compile(r"^(?:(?:SUNSCREEN|PURPOSE)\s+)*(?:(?:INACTIVE|ACTIVE)\s+)?(?:INGREDIENTS?\s*:\s*)?")
+INGREDIENT_PERCENT = re.compile(r"\s+\d+(?:\.\d+)?\s*%$")
+INGREDIENT_PUNCTUATION_SPACE = re.compile(r"\s*([()/\[\]])\s*")
+INGREDIENT_LABELS = {"", "SUNSCREEN", "PURPOSE", "ACTIVE INGREDIENTS", "INACTIVE INGREDIENTS"}
+
+RELATED_TOP_K = 10
+
+PROMPT_SUMMARY_TOKENS = 64
+PROMPT_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]+")
+PROMPT_WORD_CHARS = 6
+PROMPT_DIGIT_CHARS = 3
+PROMPT_SYMBOL_CHARS = 2
+
+WRITE_BUFFER_BYTES = 1024 * 1024
+WATCH_DEBOUNCE_SECONDS = 0.5
+
+DERIVATION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Functions and patterns behind the cached derivations; their source is part of the cache fingerprint.
+DERIVATION_CODE = [
+    "derive_cached",
+    "derive_fields",
+    "composition_ingredients",
+    "canonical_ingredient",
+    "INGREDIENT_LOT_CODE",
+    "INGREDIENT_LABEL",
+    "INGREDIENT_PERCENT",
+    "INGREDIENT_PUNCTUATION_SPACE",
+    "INGREDIENT_LABELS",
+    "INLINE_SPACES",
+    "BLOCK_SPACES",
+    "BLOCK_NEWLINES",
+    "normalize_inline",
+    "_normalize_block_text",
+    "extract_lines",
+    "extract_ingredient_list",
+    "extract_ingredients",
+    "extract_features",
+    "infer_product_type",
+    "normalize_category",
+    "infer_benefits",
+    "infer_collections",
+    "infer_concerns",
+    "infer_shop_categories",
+    "extract_spf",
+    "extract_size_ml",
+    "KeywordMatcher",
+    "build_taxonomy_matcher",
+]
+# getProductRoutineRole in app.js; the first matching role wins. JS \b is ASCII-only.
+ROUTINE_ROLES = [
+    ("cleanser", re.compile(r"\bcleanser|cleansing|face wash|foam\b", re.ASCII)),
+    ("sunscreen", re.compile(r"\bsunscreen|spf|sun protector|sun protection\b", re.ASCII)),
+    ("serum", re.compile(r"\bserum|treatment\b", re.ASCII)),
+    ("eye-care", re.compile(r"\beye cream|eye care|eye & lip\b", re.ASCII)),
+    ("moisturizer", re.compile(r"\bmoisturizer|moisturiser|cream|gel-cream|emulsion\b", re.ASCII)),
+]
+# getSuggestedPairingRoles in app.js; "skincare" is its default.
+PAIRING_ROLES = {
+    "cleanser": ["serum", "moisturizer", "sunscreen"],
+    "serum": ["moisturizer", "sunscreen", "cleanser"],
+    "moisturizer": ["cleanser", "serum", "sunscreen"],
+    "sunscreen": ["cleanser", "serum", "moisturizer"],
+    "eye-care": ["serum", "moisturizer", "cleanser"],
+    "skincare": ["cleanser", "serum", "moisturizer"],
+}
+# +1 pairing boosts in scorePairingCandidate: (pattern, text it is tested against).
+PAIRING_BOOSTS = {
+    "sunscreen": (re.compile(r"\bspf\b", re.IGNORECASE | re.ASCII), "description"),
+    "cleanser": (re.compile(r"\bgentle|hydrating|non-stripping\b", re.IGNORECASE | re.ASCII), "blob"),
+    "moisturizer": (re.compile(r"\bhydrat|barrier|moisture\b", re.IGNORECASE | re.ASCII), "blob"),
+}
+
+BLOCK_SPACES = re.compile(r"[ \t]+")
+BLOCK_NEWLINES = re.compile(r"\n{3,}")
+INLINE_SPACES = re.compile(r"\s+")
+NORMALIZE_ENGINES = ("scalar", "batch")
+# Joins a column's cells for the batch engine; none of the patterns match it.
+NORMALIZE_SEPARATOR = "\x00"
+NORMALIZE_BATCH_ROWS = 4096
+# CSV columns parse_row reads as blocks, and as inline text (Description feeds both).
+NORMALIZE_BLOCK_COLUMNS = ["Description", "Text", "how_to_use"]
+NORMALIZE_INLINE_COLUMNS = [
+    "Description",
+    "Name_URL",
+    "product_title",
+    "Name",
+    "URL_Saved_To",
+    "URL",
+    "Coupon_Applicable",
+    "Promotions",
+    "results",
+    "category",
+    "Category",
+    "Collection",
+]
+
+# Module functions timed by Profiler, grouped into the stages it reports.
+PROFILE_STAGES = {
+    "csv_read": ["read_rows"],
+    "normalisation": [
+        "normalize_block",
+        "normalize_inline",
+        "normalize_block_batch",
+        "normalize_inline_batch",
+        "prime_text",
+        "normalize_category",
+        "parse_price",
+        "parse_rating",
+        "parse_review_count",
+        "parse_variants",
+        "parse_row",
+        "row_key",
+    ],
+    "extraction": [
+        "extract_lines",
+        "extract_ingredients",
+        "extract_features",
+        "extract_spf",
+        "extract_size_ml",
+        "link_ingredients",
+        "build_ingredient_index",
+    ],
+    "inference": [
+        "infer_product_type",
+        "infer_benefits",
+        "infer_collections",
+        "infer_concerns",
+        "infer_shop_categories",
+    ],
+    "image_lookup": ["build_image_index"],
+    "dedupe": ["dedupe_groups"],
+    "merge": ["group_rows", "build_group", "apply_row", "new_product", "merge_fields", "add_image"],
+    "incremental": ["load_previous_build", "build_incremental", "write_manifest"],
+    "sort": ["finalize_products", "finalize_stream"],
+    "related": ["related_products", "index_stream"],
+    "serialise": ["write_catalog", "build_search_index", "write_columnar"],
+}
+PROFILE_MAX_TRACE_EVENTS = 1_000_000
+
+
+def _normalize_block_text(value) -> str:
+    text = str(value).replace("\r\n", "\n").replace("\r", "\n").replace("\xa0", " ")
+    text = BLOCK_SPACES.sub(" ", text)
+    text = BLOCK_NEWLINES.sub("\n\n", text)
+    return text.strip()
+
 
 def normalize_block(value: str) -> str:
     if value is None:
         return ""
-    text = str(value).replace("\r\n", "\n").replace("\r", "\n").replace("\xa0", " ")
-    text = re.sub(r"[ \t]+", " ", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
-    return text.strip()
+    if _text_memo is not None:
+        return _text_memo.block(value)
+    return _normalize_block_text(value)
 
 
 def normalize_inline(value: str) -> str:
-    return re.sub(r"\s+", " ", normalize_block(value)).strip()
+    if _text_memo is not None:
+        return _text_memo.inline(value)
+    return INLINE_SPACES.sub(" ", normalize_block(value)).strip()
+
+
+def normalize_block_batch(values: list) -> list:
+    """``normalize_block`` over a column of strings, one pass per pattern over the joined column."""
+    joined = NORMALIZE_SEPARATOR.join(values)
+    if joined.count(NORMALIZE_SEPARATOR) != len(values) - 1:
+        # A cell contains the separator itself; fall back to cell by cell.
+        return [_normalize_block_text(value) for value in values]
+    text = joined.replace("\r\n", "\n").replace("\r", "\n").replace("\xa0", " ")
+    text = BLOCK_SPACES.sub(" ", text)
+    text = BLOCK_NEWLINES.sub("\n\n", text)
+    return [part.strip() for part in text.split(NORMALIZE_SEPARATOR)]
+
+
+def normalize_inline_batch(blocks: list) -> list:
+    """Inline forms of block-normalised strings; ``normalize_block`` is idempotent, so no second block pass."""
+    joined = NORMALIZE_SEPARATOR.join(blocks)
+    if joined.count(NORMALIZE_SEPARATOR) != len(blocks) - 1:
+        return [INLINE_SPACES.sub(" ", block).strip() for block in blocks]
+    return [part.strip() for part in INLINE_SPACES.sub(" ", joined).split(NORMALIZE_SEPARATOR)]
+
+
+class TextMemo:
+    """Block and inline forms of cell values, computed once per distinct value.
+
+    ``prime`` fills the memo a column at a time with the batch functions; a
+    value it didn't see is normalised on first use. A block form is its own
+    block form, so it is stored as a key too, which makes
+    ``normalize_inline`` of an already normalised description a lookup.
+    """
+
+    def __init__(self):
+        self.blocks = {}
+        self.inlines = {}
+
+    def clear(self):
+        self.blocks.clear()
+        self.inlines.clear()
+
+    def block(self, value) -> str:
+        text = self.blocks.get(value)
+        if text is None:
+            text = _normalize_block_text(value)
+            self.blocks[value] = self.blocks[text] = text
+        return text
+
+    def inline(self, value) -> str:
+        if value is None:
+            return ""
+        text = self.inlines.get(value)
+        if text is None:
+            block = self.block(value)
+            text = INLINE_SPACES.sub(" ", block).strip()
+            self.inlines[value] = self.inlines[block] = text
+        return text
+
+    def _distinct(self, rows: list, column: str, seen: dict) -> list:
+        values = dict.fromkeys(row.get(column) for row in rows)
+        return [value for value in values if value and value not in seen]
+
+    def prime(self, rows: list):
+        for column in NORMALIZE_BLOCK_COLUMNS + NORMALIZE_INLINE_COLUMNS:
+            values = self._distinct(rows, column, self.blocks)
+            for value, text in zip(values, normalize_block_batch(values)):
+                self.blocks[value] = self.blocks[text] = text
+        for column in NORMALIZE_INLINE_COLUMNS:
+            values = self._distinct(rows, column, self.inlines)
+            blocks = [self.blocks[value] for value in values]
+            for value, block, text in zip(values, blocks, normalize_inline_batch(blocks)):
+                self.inlines[value] = self.inlines[block] = text
+
+
+_text_memo = None
+
+
+def set_normalizer(engine: str):
+    """Select the text normalisation engine for this process; returns the batch memo, if any."""
+    global _text_memo
+    _text_memo = TextMemo() if engine == "batch" else None
+    return _text_memo
+
+
+def prime_text(rows: list):
+    """Batch-normalise the text columns of ``rows`` ahead of ``parse_row`` (batch engine only)."""
+    if _text_memo is not None:
+        _text_memo.prime(rows)
 
 
 def parse_price(value: str):
@@ -69,7 +348,8 @@ def extract_lines(block: str):
     return lines
 
 
-def extract_ingredients(block: str):
+def extract_ingredient_list(block: str):
+    """Every entry of the ``INGREDIENTS:`` line, as written."""
     if not block:
         return []
     match = re.search(r"ingredients?:\s*(.+)", block, re.IGNORECASE)
@@ -79,7 +359,40 @@ def extract_ingredients(block: str):
     ingredients_text = ingredients_text.replace("\uff65", ",").replace("・", ",").replace("･", ",")
     ingredients_text = re.sub(r"\s+", " ", ingredients_text).strip()
     parts = [part.strip(" .;") for part in re.split(r",|\n|;", ingredients_text)]
-    return [part for part in parts if part][:20]
+    return [part for part in parts if part]
+
+
+def extract_ingredients(block: str):
+    return extract_ingredient_list(block)[:20]
+
+
+def canonical_ingredient(name: str) -> str:
+    """Canonical ingredient name: case, spacing and drug-facts labels folded; "" if it isn't one.
+
+    ``Water (Aqua/Eau)``, ``WATER(AQUA/EAU)`` and ``WATER (AQUA/EAU)`` all
+    become ``WATER(AQUA/EAU)``; ``Sunscreen OCTINOXATE 3.9%`` becomes
+    ``OCTINOXATE``; lot codes such as ``<M109714-712>`` are dropped.
+    """
+    text = unicodedata.normalize("NFKC", name or "").upper()
+    text = INGREDIENT_LOT_CODE.sub("", text)
+    text = INGREDIENT_LABEL.sub("", text)
+    if ":" in text:
+        # Prose such as "Mineral Spring Water: Helps supplement ..."
+        return ""
+    text = INGREDIENT_PERCENT.sub("", text)
+    text = INGREDIENT_PUNCTUATION_SPACE.sub(r"\1", text)
+    text = INLINE_SPACES.sub(" ", text).strip(" .;*")
+    return "" if text in INGREDIENT_LABELS else text
+
+
+def composition_ingredients(composition: str) -> list:
+    """Canonical names of a composition's full ingredient list, first occurrence first."""
+    names = (canonical_ingredient(name) for name in extract_ingredient_list(composition))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def product_ingredients(product: dict) -> list:
+    return derive_cached(composition_ingredients, product.get("composition"))
 
 
 def extract_features(description: str, composition: str):
@@ -90,28 +403,260 @@ def extract_features(description: str, composition: str):
     return features[:3]
 
 
+PRODUCT_TYPE_KEYWORDS = [
+    ("sunscreen", "sunscreen"),
+    ("spf", "sunscreen"),
+    ("serum", "serum"),
+    ("cleanser", "cleanser"),
+    ("lotion", "lotion"),
+    ("moisturizer", "moisturizer"),
+    ("cream", "moisturizer"),
+    ("mask", "mask"),
+    ("eye", "eye care"),
+    ("toner", "toner"),
+    ("essence", "essence"),
+    ("oil", "oil"),
+    ("set", "gift set"),
+    ("kit", "gift set"),
+]
+
+BENEFIT_MAP = [
+    ("hydration", ["hydration", "hydrate", "moisture"]),
+    ("brightening", ["brighten", "radiance", "glow"]),
+    ("firming", ["firm", "lifting", "elasticity"]),
+    ("soothing", ["soothe", "calm", "sensitive"]),
+    ("smoothing", ["smooth", "refine", "texture"]),
+    ("repair", ["repair", "revital", "renew"]),
+    ("sun protection", ["spf", "sun protection", "uv"]),
+]
+
+COLLECTION_MAP = [
+    ("Ultimune", ["ultimune"]),
+    ("Shiseido Eudermine", ["eudermine"]),
+    ("Benefiance", ["benefiance"]),
+    ("Vital Perfection", ["vital perfection"]),
+    ("Future Solution LX", ["future solution lx", "future solution"]),
+    ("Bio-Performance", ["bio-performance", "bio performance"]),
+    ("Essential Energy", ["essential energy"]),
+    ("White Lucent", ["white lucent"]),
+    ("Waso", ["waso"]),
+]
+
+CONCERN_MAP = [
+    (
+        "Anti-Aging",
+        [
+            "anti-aging",
+            "anti aging",
+            "age-defying",
+            "age defying",
+            "age-defiant",
+            "age defiant",
+            "wrinkle",
+            "wrinkles",
+            "firming",
+            "lifting",
+            "sagging",
+            "loss of elasticity",
+        ],
+    ),
+    (
+        "Dullness & Dark Spots",
+        [
+            "dull",
+            "dullness",
+            "dark spot",
+            "dark spots",
+            "hyperpigmentation",
+            "discoloration",
+            "uneven tone",
+            "brighten",
+            "brightening",
+            "radiance",
+            "radiant",
+            "glow",
+            "luminous",
+        ],
+    ),
+    (
+        "Fine Lines & Wrinkles",
+        [
+            "fine line",
+            "fine lines",
+            "wrinkle",
+            "wrinkles",
+            "crow's feet",
+            "crow’s feet",
+        ],
+    ),
+    (
+        "Lifting & Firming",
+        ["lifting", "firming", "elasticity", "contour", "tighten", "tightening"],
+    ),
+    (
+        "Dryness & Dehydration",
+        [
+            "dryness",
+            "dry",
+            "dehydration",
+            "dehydrated",
+            "hydrate",
+            "hydration",
+            "moisture",
+            "moisturize",
+            "moisturizing",
+            "hyaluronic",
+        ],
+    ),
+    ("Oil Control", ["oil control", "oil-control", "oily", "shine", "sebum", "matte"]),
+]
+
+PRODUCT_TYPE_SHOP_CATEGORIES = {
+    "cleanser": "Cleansers & Makeup Removers",
+    "toner": "Softeners",
+    "serum": "Serums & Treatments",
+    "essence": "Serums & Treatments",
+    "oil": "Serums & Treatments",
+    "moisturizer": "Moisturizers & Creams",
+    "eye care": "Eye & Lip Care",
+    "mask": "Masks",
+}
+
+SHOP_CATEGORY_MAP = [
+    (
+        "Cleansers & Makeup Removers",
+        [
+            "cleanser",
+            "cleansing",
+            "makeup remover",
+            "micellar",
+            "cleansing oil",
+            "cleansing water",
+            "remover",
+        ],
+    ),
+    ("Softeners", ["softener", "treatment softener", "skin softener"]),
+    (
+        "Serums & Treatments",
+        ["serum", "treatment", "concentrate", "ampoule", "essence", "booster"],
+    ),
+    (
+        "Moisturizers & Creams",
+        ["moisturizer", "moisturizing", "cream", "gel-cream", "gel cream", "lotion", "emulsion"],
+    ),
+    ("Eye & Lip Care", ["eye", "lip", "eye cream", "eye mask", "lip balm"]),
+    ("Masks", ["mask"]),
+    ("Refillable Skincare", ["refill", "refillable"]),
+    ("Best Sellers", ["best seller", "bestseller", "best-seller"]),
+    ("Last Chance", ["last chance", "last-chance", "final sale", "discontinued"]),
+]
+
+
+class KeywordMatcher:
+    """Tag text against several keyword taxonomies in a single regex pass.
+
+    Every family's tokens are compiled into one trie-shaped pattern wrapped in
+    a lookahead, so ``finditer`` reports the longest token starting at each
+    position of the text. Shorter tokens that are prefixes of a match are
+    filled in from a precomputed table; together that gives exactly the
+    ``token in lowered`` substring semantics of the original per-token scans.
+    """
+
+    def __init__(self, families: dict):
+        self.families = {
+            family: [(label, tuple(tokens)) for label, tokens in entries]
+            for family, entries in families.items()
+        }
+        tokens = {token for entries in self.families.values() for _, group in entries for token in group}
+        self.prefixes = {
+            token: frozenset(other for other in tokens if token.startswith(other)) for token in tokens
+        }
+        self.pattern = re.compile(f"(?=({self._trie_pattern(sorted(tokens))}))")
+
+    @classmethod
+    def _trie_pattern(cls, tokens):
+        branches = {}
+        terminal = False
+        for token in tokens:
+            if not token:
+                terminal = True
+                continue
+            branches.setdefault(token[0], []).append(token[1:])
+        parts = [re.escape(char) + cls._trie_pattern(rest) for char, rest in sorted(branches.items())]
+        if not parts:
+            return ""
+        body = parts[0] if len(parts) == 1 else f"(?:{'|'.join(parts)})"
+        # Greedy optional suffix: the longest token at a position wins.
+        return f"(?:{body})?" if terminal else body
+
+    def match_tokens(self, text: str) -> frozenset:
+        found = set()
+        for match in self.pattern.finditer(text.lower()):
+            token = match.group(1)
+            if token not in found:
+                found.update(self.prefixes[token])
+        return frozenset(found)
+
+    def tag(self, text: str) -> dict:
+        found = self.match_tokens(text)
+        return {
+            family: [label for label, tokens in entries if any(token in found for token in tokens)]
+            for family, entries in self.families.items()
+        }
+
+
+def build_taxonomy_matcher() -> KeywordMatcher:
+    return KeywordMatcher(
+        {
+            "product_type": [(label, [keyword]) for keyword, label in PRODUCT_TYPE_KEYWORDS],
+            "benefits": BENEFIT_MAP,
+            "collections": COLLECTION_MAP,
+            "concerns": CONCERN_MAP,
+            "shop_categories": SHOP_CATEGORY_MAP,
+        }
+    )
+
+
+TAXONOMY_MATCHER = build_taxonomy_matcher()
+
+# Module globals each taxonomy map in a brand config replaces.
+TAXONOMY_GLOBALS = {
+    "product_types": "PRODUCT_TYPE_KEYWORDS",
+    "benefits": "BENEFIT_MAP",
+    "collections": "COLLECTION_MAP",
+    "concerns": "CONCERN_MAP",
+    "shop_categories": "SHOP_CATEGORY_MAP",
+    "product_type_shop_categories": "PRODUCT_TYPE_SHOP_CATEGORIES",
+}
+DEFAULT_TAXONOMY = {name: globals()[variable] for name, variable in TAXONOMY_GLOBALS.items()}
+_taxonomy_overrides = {}
+
+
+def set_taxonomy(taxonomy: dict):
+    """Use another brand's taxonomy maps in this process; maps it leaves out keep the defaults above."""
+    global TAXONOMY_MATCHER, _taxonomy_overrides
+    unknown = set(taxonomy) - set(TAXONOMY_GLOBALS)
+    if unknown:
+        raise ValueError(f"Unknown taxonomy maps: {', '.join(sorted(unknown))}")
+    for name, variable in TAXONOMY_GLOBALS.items():
+        globals()[variable] = taxonomy.get(name, DEFAULT_TAXONOMY[name])
+    _taxonomy_overrides = dict(taxonomy)
+    TAXONOMY_MATCHER = build_taxonomy_matcher()
+    tag_text.cache_clear()
+
+
+@functools.lru_cache(maxsize=16)
+def tag_text(text: str) -> dict:
+    """Cached ``TAXONOMY_MATCHER.tag`` so the infer_* calls on one text share a pass."""
+    return TAXONOMY_MATCHER.tag(text)
+
+
 def infer_product_type(name: str):
     if not name:
         return "skincare"
-    lowered = name.lower()
-    keywords = [
-        ("sunscreen", "sunscreen"),
-        ("spf", "sunscreen"),
-        ("serum", "serum"),
-        ("cleanser", "cleanser"),
-        ("lotion", "lotion"),
-        ("moisturizer", "moisturizer"),
-        ("cream", "moisturizer"),
-        ("mask", "mask"),
-        ("eye", "eye care"),
-        ("toner", "toner"),
-        ("essence", "essence"),
-        ("oil", "oil"),
-        ("set", "gift set"),
-        ("kit", "gift set"),
-    ]
-    for keyword, label in keywords:
-        if keyword in lowered:
+    found = TAXONOMY_MATCHER.match_tokens(name)
+    for keyword, label in PRODUCT_TYPE_KEYWORDS:
+        if keyword in found:
             return label
     return "skincare"
 
@@ -129,176 +674,25 @@ def normalize_category(value: str, product_type: str):
 
 
 def infer_benefits(text: str):
-    lowered = text.lower()
-    benefit_map = [
-        ("hydration", ["hydration", "hydrate", "moisture"]),
-        ("brightening", ["brighten", "radiance", "glow"]),
-        ("firming", ["firm", "lifting", "elasticity"]),
-        ("soothing", ["soothe", "calm", "sensitive"]),
-        ("smoothing", ["smooth", "refine", "texture"]),
-        ("repair", ["repair", "revital", "renew"]),
-        ("sun protection", ["spf", "sun protection", "uv"]),
-    ]
-    benefits = []
-    for label, tokens in benefit_map:
-        if any(token in lowered for token in tokens):
-            benefits.append(label)
-    return benefits[:4]
+    return tag_text(text)["benefits"][:4]
 
 
 def infer_collections(text: str):
-    lowered = text.lower()
-    collection_map = [
-        ("Ultimune", ["ultimune"]),
-        ("Shiseido Eudermine", ["eudermine"]),
-        ("Benefiance", ["benefiance"]),
-        ("Vital Perfection", ["vital perfection"]),
-        ("Future Solution LX", ["future solution lx", "future solution"]),
-        ("Bio-Performance", ["bio-performance", "bio performance"]),
-        ("Essential Energy", ["essential energy"]),
-        ("White Lucent", ["white lucent"]),
-        ("Waso", ["waso"]),
-    ]
-    collections = []
-    for label, tokens in collection_map:
-        if any(token in lowered for token in tokens):
-            collections.append(label)
-    return collections
+    return list(tag_text(text)["collections"])
 
 
 def infer_concerns(text: str):
-    lowered = text.lower()
-    concern_map = [
-        (
-            "Anti-Aging",
-            [
-                "anti-aging",
-                "anti aging",
-                "age-defying",
-                "age defying",
-                "age-defiant",
-                "age defiant",
-                "wrinkle",
-                "wrinkles",
-                "firming",
-                "lifting",
-                "sagging",
-                "loss of elasticity",
-            ],
-        ),
-        (
-            "Dullness & Dark Spots",
-            [
-                "dull",
-                "dullness",
-                "dark spot",
-                "dark spots",
-                "hyperpigmentation",
-                "discoloration",
-                "uneven tone",
-                "brighten",
-                "brightening",
-                "radiance",
-                "radiant",
-                "glow",
-                "luminous",
-            ],
-        ),
-        (
-            "Fine Lines & Wrinkles",
-            [
-                "fine line",
-                "fine lines",
-                "wrinkle",
-                "wrinkles",
-                "crow's feet",
-                "crow’s feet",
-            ],
-        ),
-        (
-            "Lifting & Firming",
-            ["lifting", "firming", "elasticity", "contour", "tighten", "tightening"],
-        ),
-        (
-            "Dryness & Dehydration",
-            [
-                "dryness",
-                "dry",
-                "dehydration",
-                "dehydrated",
-                "hydrate",
-                "hydration",
-                "moisture",
-                "moisturize",
-                "moisturizing",
-                "hyaluronic",
-            ],
-        ),
-        ("Oil Control", ["oil control", "oil-control", "oily", "shine", "sebum", "matte"]),
-    ]
-    concerns = []
-    for label, tokens in concern_map:
-        if any(token in lowered for token in tokens):
-            concerns.append(label)
-    return concerns
+    return list(tag_text(text)["concerns"])
 
 
 def infer_shop_categories(name: str, description: str, category_label: str, product_type: str):
-    text = " ".join(filter(None, [name, description, category_label])).lower()
+    text = " ".join(filter(None, [name, description, category_label]))
     categories = []
-
-    def add(label: str):
+    if product_type in PRODUCT_TYPE_SHOP_CATEGORIES:
+        categories.append(PRODUCT_TYPE_SHOP_CATEGORIES[product_type])
+    for label in tag_text(text)["shop_categories"]:
         if label not in categories:
             categories.append(label)
-
-    if product_type == "cleanser":
-        add("Cleansers & Makeup Removers")
-    if product_type == "toner":
-        add("Softeners")
-    if product_type in ("serum", "essence", "oil"):
-        add("Serums & Treatments")
-    if product_type == "moisturizer":
-        add("Moisturizers & Creams")
-    if product_type == "eye care":
-        add("Eye & Lip Care")
-    if product_type == "mask":
-        add("Masks")
-
-    if any(
-        token in text
-        for token in [
-            "cleanser",
-            "cleansing",
-            "makeup remover",
-            "micellar",
-            "cleansing oil",
-            "cleansing water",
-            "remover",
-        ]
-    ):
-        add("Cleansers & Makeup Removers")
-    if any(token in text for token in ["softener", "treatment softener", "skin softener"]):
-        add("Softeners")
-    if any(
-        token in text
-        for token in ["serum", "treatment", "concentrate", "ampoule", "essence", "booster"]
-    ):
-        add("Serums & Treatments")
-    if any(
-        token in text
-        for token in ["moisturizer", "moisturizing", "cream", "gel-cream", "gel cream", "lotion", "emulsion"]
-    ):
-        add("Moisturizers & Creams")
-    if any(token in text for token in ["eye", "lip", "eye cream", "eye mask", "lip balm"]):
-        add("Eye & Lip Care")
-    if "mask" in text:
-        add("Masks")
-    if any(token in text for token in ["refill", "refillable"]):
-        add("Refillable Skincare")
-    if any(token in text for token in ["best seller", "bestseller", "best-seller"]):
-        add("Best Sellers")
-    if any(token in text for token in ["last chance", "last-chance", "final sale", "discontinued"]):
-        add("Last Chance")
     return categories
 
 
@@ -312,14 +706,118 @@ def extract_size_ml(text: str):
     return int(match.group(1)) if match else None
 
 
-def build_image_index(images_root: Path):
+def image_cache_path_for(images_root: Path) -> Path:
+    return images_root.with_name(f".{images_root.name}.image-index.json")
+
+
+def scan_image_directory(path: str):
+    """One ``os.scandir`` pass: image file names and subdirectory names, in scandir order.
+
+    Mirrors ``Path.rglob``: symlinked directories are not descended into,
+    while symlinks to files count as files.
+    """
+    files = []
+    dirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir() and not entry.is_symlink():
+                    dirs.append(entry.name)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTS:
+                    files.append(entry.name)
+            except OSError:
+                continue
+    return files, dirs
+
+
+def list_image_directory(root: str, rel: str, cached: dict, fresh: dict, scan_started: float):
+    """``(files, dirs)`` for one directory, reusing the cached listing if its mtime is unchanged.
+
+    Directories modified within the last two seconds are stored without an
+    mtime so the next run rescans them; an edit later in the same mtime tick
+    would otherwise go unnoticed.
+    """
+    path = os.path.join(root, rel) if rel else root
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        entry = cached.get(rel)
+        if entry and entry["mtime_ns"] == mtime_ns:
+            files, dirs = entry["files"], entry["dirs"]
+        else:
+            files, dirs = scan_image_directory(path)
+    except OSError:
+        return [], []
+    racy = scan_started - mtime_ns / 1e9 < 2
+    fresh[rel] = {"mtime_ns": None if racy else mtime_ns, "files": files, "dirs": dirs}
+    return files, dirs
+
+
+def walk_image_tree(root: str, rel: str, cached: dict, fresh: dict, scan_started: float):
+    """Pre-order walk in ``rglob`` order; returns ``[(rel_dir, image_names), ...]``."""
+    files, dirs = list_image_directory(root, rel, cached, fresh, scan_started)
+    walked = [(rel, files)]
+    for name in dirs:
+        child = f"{rel}/{name}" if rel else name
+        walked.extend(walk_image_tree(root, child, cached, fresh, scan_started))
+    return walked
+
+
+def load_image_cache(cache_path: Path, images_root: Path) -> dict:
+    try:
+        cache = json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != IMAGE_CACHE_VERSION or cache.get("root") != str(images_root):
+        return {}
+    return cache.get("directories", {})
+
+
+def build_image_index(images_root: Path, use_cache: bool = True, workers: int = 8):
+    """Map image file names to paths relative to ``ROOT``; the first path found wins.
+
+    The directory listing is cached on disk next to ``images_root`` and keyed
+    by directory mtime, so only directories that changed since the last run are
+    rescanned. Top-level subdirectories are walked in parallel threads and
+    merged back in ``rglob`` order, which keeps ``setdefault`` picking the
+    same path for duplicate file names.
+    """
     index = {}
+    images_root = images_root.absolute()
     if not images_root.exists():
         return index
-    for path in images_root.rglob("*"):
-        if path.is_file() and path.suffix.lower() in IMAGE_EXTS:
-            rel_path = path.relative_to(ROOT).as_posix()
-            index.setdefault(path.name, rel_path)
+    cache_path = image_cache_path_for(images_root)
+    cached = load_image_cache(cache_path, images_root) if use_cache else {}
+    scan_started = time.time()
+    root = str(images_root)
+
+    fresh = {}
+    files, top_dirs = list_image_directory(root, "", cached, fresh, scan_started)
+    walked = [("", files)]
+
+    def walk_subtree(name):
+        found = {}
+        return walk_image_tree(root, name, cached, found, scan_started), found
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(top_dirs)))) as pool:
+        for subtree, found in pool.map(walk_subtree, top_dirs):
+            walked.extend(subtree)
+            fresh.update(found)
+
+    try:
+        prefix = images_root.relative_to(ROOT).as_posix()
+    except ValueError:
+        prefix = images_root.as_posix()
+    for rel, files in walked:
+        directory = f"{prefix}/{rel}" if rel else prefix
+        for name in files:
+            index.setdefault(name, f"{directory}/{name}")
+
+    if use_cache and fresh != cached:
+        payload = {"version": IMAGE_CACHE_VERSION, "root": str(images_root), "directories": fresh}
+        try:
+            cache_path.write_text(json.dumps(payload), encoding="utf-8")
+        except OSError:
+            pass
     return index
 
 
@@ -327,108 +825,1735 @@ def compact(product: dict):
     return {key: value for key, value in product.items() if value not in (None, "", [], {})}
 
 
-def main():
-    image_index = build_image_index(IMAGES_ROOT)
-    products_by_key = {}
-
-    with open(CSV_PATH, newline="", encoding="utf-8") as handle:
-        reader = csv.DictReader(handle)
-        for row in reader:
-            name_url = normalize_inline(row.get("Name_URL"))
-            name = normalize_inline(row.get("product_title") or row.get("Name"))
-            description = normalize_block(row.get("Description"))
-            composition = normalize_block(row.get("Text"))
-            how_to_use = normalize_block(row.get("how_to_use"))
-            results_timeline = normalize_inline(row.get("results"))
-            category = normalize_inline(row.get("category") or row.get("Category"))
-            collection = normalize_inline(row.get("Collection"))
-            price = parse_price(row.get("price_current"))
-            star_rating = parse_rating(row.get("star_rating"))
-            reviews = parse_review_count(row.get("Reviews"))
-            variants = parse_variants(row.get("variants"))
-            coupon_applicable = normalize_inline(row.get("Coupon_Applicable", "")).strip().upper() or None
-            promotion = normalize_inline(row.get("Promotions", "")).strip() or None
-
-            key = name_url or name
-            if not key:
-                continue
+PRODUCT_FIELDS = (
+    "id", "name", "category", "product_type", "price", "star_rating", "reviews", "description",
+    "composition", "ingredients", "how_to_use", "results_timeline", "variants", "features", "benefits",
+    "collections", "concerns", "categories", "spf", "size_ml", "image_url", "image_gallery", "tags",
+    "coupon_applicable", "promotions", "prompt_summary",
+)
+PRODUCT_FIELD_SET = frozenset(PRODUCT_FIELDS)
+# Values that repeat across products share one object per distinct value.
+PRODUCT_INTERNED_FIELDS = {
+    "category", "product_type", "price", "star_rating", "reviews", "results_timeline", "spf", "size_ml",
+    "coupon_applicable", "benefits", "collections", "concerns", "categories", "tags", "promotions",
+}
+PRODUCT_INTERNED_ITEMS = {"ingredients", "benefits", "collections", "concerns", "categories", "tags", "promotions"}
+PRODUCT_VOCABULARIES = {name: {} for name in PRODUCT_INTERNED_FIELDS | PRODUCT_INTERNED_ITEMS}
+
+
+def clear_vocabularies():
+    """Forget interned values once a build's products are finalized; the products keep theirs."""
+    for vocabulary in PRODUCT_VOCABULARIES.values():
+        vocabulary.clear()
+
+
+class Product(Mapping):
+    """A product being merged from feed rows, with ``new_product``'s fields in ``__slots__``.
+
+    Reads and writes go through the mapping protocol, so the merge code
+    treats it like the dict it replaces. Lists are stored as tuples.
+    Labels, numbers and label lists are interned in
+    ``PRODUCT_VOCABULARIES``, so a value shared by many products is held
+    once. Reading a list field returns a new list.
+    """
+
+    __slots__ = PRODUCT_FIELDS
 
-            product = products_by_key.get(key)
-            if not product:
-                product_type = infer_product_type(name)
-                category_label = normalize_category(category, product_type)
-                combined_text = " ".join(filter(None, [name, description, composition]))
-                product = {
-                    "id": None,
-                    "name": name,
-                    "category": category_label,
-                    "product_type": product_type,
-                    "price": price,
-                    "star_rating": star_rating,
-                    "reviews": reviews,
-                    "description": normalize_inline(description) or None,
-                    "composition": composition or None,
-                    "ingredients": extract_ingredients(composition),
-                    "how_to_use": how_to_use or None,
-                    "results_timeline": results_timeline or None,
-                    "variants": variants,
-                    "features": extract_features(description, composition),
-                    "benefits": infer_benefits(combined_text),
-                    "collections": [collection] if collection else infer_collections(combined_text),
-                    "concerns": infer_concerns(combined_text),
-                    "categories": infer_shop_categories(
-                        name, normalize_inline(description), category_label, product_type
-                    ),
-                    "spf": extract_spf(combined_text),
-                    "size_ml": extract_size_ml(combined_text),
-                    "image_url": None,
-                    "image_gallery": [],
-                    "tags": [],
-                    "coupon_applicable": coupon_applicable,
-                    "promotions": [promotion] if promotion else [],
-                }
-                products_by_key[key] = product
+    def __init__(self, fields: dict):
+        for name in PRODUCT_FIELDS:
+            self._store(name, fields.get(name))
+
+    def __getitem__(self, name):
+        if name not in PRODUCT_FIELD_SET:
+            raise KeyError(name)
+        value = getattr(self, name)
+        return list(value) if type(value) is tuple else value
+
+    def get(self, name, default=None):
+        return self[name] if name in PRODUCT_FIELD_SET else default
+
+    def __setitem__(self, name, value):
+        if name not in PRODUCT_FIELD_SET:
+            raise KeyError(name)
+        self._store(name, value)
+
+    def _store(self, name: str, value):
+        vocabulary = PRODUCT_VOCABULARIES.get(name)
+        if isinstance(value, list):
+            if name in PRODUCT_INTERNED_ITEMS:
+                value = tuple([vocabulary.setdefault(item, item) for item in value])
             else:
-                if not product.get("description") and description:
-                    product["description"] = normalize_inline(description)
-                if not product.get("price") and price is not None:
-                    product["price"] = price
-                if not product.get("star_rating") and star_rating is not None:
-                    product["star_rating"] = star_rating
-                if not product.get("reviews") and reviews is not None:
-                    product["reviews"] = reviews
-                if not product.get("how_to_use") and how_to_use:
-                    product["how_to_use"] = how_to_use
-                if not product.get("results_timeline") and results_timeline:
-                    product["results_timeline"] = results_timeline
-                if coupon_applicable and not product.get("coupon_applicable"):
-                    product["coupon_applicable"] = coupon_applicable
-                if promotion:
-                    promos = product.setdefault("promotions", [])
-                    if promotion not in promos:
-                        promos.append(promotion)
-
-            image_path = None
-            saved_to = normalize_inline(row.get("URL_Saved_To"))
-            if saved_to:
-                image_path = image_index.get(Path(saved_to).name)
-            if not image_path:
-                image_path = normalize_inline(row.get("URL"))
-
-            if image_path:
-                gallery = product.setdefault("image_gallery", [])
-                if image_path not in gallery:
-                    gallery.append(image_path)
-                if not product.get("image_url"):
-                    product["image_url"] = image_path
-
-    products = []
-    for idx, product in enumerate(sorted(products_by_key.values(), key=lambda p: p.get("name", ""))):
-        product["id"] = f"shiseido-{idx + 1}"
-        products.append(compact(product))
-
-    OUTPUT_PATH.write_text(json.dumps({"products": products}, indent=2), encoding="utf-8")
-    print(f"Wrote {len(products)} products to {OUTPUT_PATH}")
+                value = tuple(value)
+        if name in PRODUCT_INTERNED_FIELDS and value is not None:
+            value = vocabulary.setdefault(value, value)
+        setattr(self, name, value)
+
+    def __iter__(self):
+        return iter(PRODUCT_FIELDS)
+
+    def __len__(self):
+        return len(PRODUCT_FIELDS)
+
+    def __reduce__(self):
+        # Rebuilt through __init__, so products from worker processes share this process's vocabularies.
+        return Product, (dict(self),)
+
+    def to_dict(self) -> dict:
+        """The product as ``compact()`` returns it for the equivalent dict."""
+        return compact(self)
+
+
+PRODUCT_MODELS = {"dict": dict, "slots": Product}
+_product_model = Product
+
+
+def set_product_model(name: str):
+    """Select what ``new_product`` returns: ``Product`` records, or the plain dicts they replace."""
+    global _product_model
+    _product_model = PRODUCT_MODELS[name]
+
+
+def parse_row(row: dict, image_index: dict):
+    name_url = normalize_inline(row.get("Name_URL"))
+    name = normalize_inline(row.get("product_title") or row.get("Name"))
+    key = name_url or name
+    if not key:
+        return None
+
+    image_path = None
+    saved_to = normalize_inline(row.get("URL_Saved_To"))
+    if saved_to:
+        image_path = image_index.get(Path(saved_to).name)
+    if not image_path:
+        image_path = normalize_inline(row.get("URL"))
+
+    coupon_applicable = normalize_inline(row.get("Coupon_Applicable", "")).strip().upper() or None
+    promotion = normalize_inline(row.get("Promotions", "")).strip() or None
+    return {
+        "key": key,
+        "name": name,
+        "description": normalize_block(row.get("Description")),
+        "composition": normalize_block(row.get("Text")),
+        "how_to_use": normalize_block(row.get("how_to_use")),
+        "results_timeline": normalize_inline(row.get("results")),
+        "category": normalize_inline(row.get("category") or row.get("Category")),
+        "collection": normalize_inline(row.get("Collection")),
+        "price": parse_price(row.get("price_current")),
+        "star_rating": parse_rating(row.get("star_rating")),
+        "reviews": parse_review_count(row.get("Reviews")),
+        "variants": parse_variants(row.get("variants")),
+        "coupon_applicable": coupon_applicable,
+        "promotion": promotion,
+        "image_path": image_path,
+    }
+
+
+def derive_fields(name: str, description: str, composition: str, category: str, collection: str) -> dict:
+    """Fields extracted or inferred from a product's first row; the inputs are all they depend on."""
+    product_type = infer_product_type(name)
+    category_label = normalize_category(category, product_type)
+    combined_text = " ".join(filter(None, [name, description, composition]))
+    return {
+        "category": category_label,
+        "product_type": product_type,
+        "description": normalize_inline(description) or None,
+        "ingredients": extract_ingredients(composition),
+        "features": extract_features(description, composition),
+        "benefits": infer_benefits(combined_text),
+        "collections": [collection] if collection else infer_collections(combined_text),
+        "concerns": infer_concerns(combined_text),
+        "categories": infer_shop_categories(
+            name, normalize_inline(description), category_label, product_type
+        ),
+        "spf": extract_spf(combined_text),
+        "size_ml": extract_size_ml(combined_text),
+    }
+
+
+def new_product(fields: dict):
+    name = fields["name"]
+    composition = fields["composition"]
+    promotion = fields["promotion"]
+    derived = derive_cached(
+        derive_fields, name, fields["description"], composition, fields["category"], fields["collection"]
+    )
+    return _product_model({
+        "id": None,
+        "name": name,
+        "category": derived["category"],
+        "product_type": derived["product_type"],
+        "price": fields["price"],
+        "star_rating": fields["star_rating"],
+        "reviews": fields["reviews"],
+        "description": derived["description"],
+        "composition": composition or None,
+        "ingredients": derived["ingredients"],
+        "how_to_use": fields["how_to_use"] or None,
+        "results_timeline": fields["results_timeline"] or None,
+        "variants": fields["variants"],
+        "features": derived["features"],
+        "benefits": derived["benefits"],
+        "collections": derived["collections"],
+        "concerns": derived["concerns"],
+        "categories": derived["categories"],
+        "spf": derived["spf"],
+        "size_ml": derived["size_ml"],
+        "image_url": None,
+        "image_gallery": [],
+        "tags": [],
+        "coupon_applicable": fields["coupon_applicable"],
+        "promotions": [promotion] if promotion else [],
+    })
+
+
+def merge_fields(product: dict, fields: dict):
+    description = fields["description"]
+    if not product.get("description") and description:
+        product["description"] = normalize_inline(description)
+    if not product.get("price") and fields["price"] is not None:
+        product["price"] = fields["price"]
+    if not product.get("star_rating") and fields["star_rating"] is not None:
+        product["star_rating"] = fields["star_rating"]
+    if not product.get("reviews") and fields["reviews"] is not None:
+        product["reviews"] = fields["reviews"]
+    if not product.get("how_to_use") and fields["how_to_use"]:
+        product["how_to_use"] = fields["how_to_use"]
+    if not product.get("results_timeline") and fields["results_timeline"]:
+        product["results_timeline"] = fields["results_timeline"]
+    if fields["coupon_applicable"] and not product.get("coupon_applicable"):
+        product["coupon_applicable"] = fields["coupon_applicable"]
+    if fields["promotion"]:
+        promos = product.get("promotions") or []
+        if fields["promotion"] not in promos:
+            product["promotions"] = [*promos, fields["promotion"]]
+
+
+def add_image(product: dict, image_path: str):
+    if image_path:
+        gallery = product.get("image_gallery") or []
+        if image_path not in gallery:
+            product["image_gallery"] = [*gallery, image_path]
+        if not product.get("image_url"):
+            product["image_url"] = image_path
+
+
+def apply_row(products_by_key: dict, fields: dict):
+    product = products_by_key.get(fields["key"])
+    if not product:
+        product = new_product(fields)
+        products_by_key[fields["key"]] = product
+    else:
+        merge_fields(product, fields)
+    add_image(product, fields["image_path"])
+    return product
+
+
+def derivation_fingerprint() -> str:
+    """Hash of the derivation code and the active taxonomy maps; editing either invalidates the cache."""
+    # Unwrapped, so installing the profiler's timers doesn't change the fingerprint.
+    values = [inspect.unwrap(globals()[name]) for name in DERIVATION_CODE]
+    source = "".join(
+        inspect.getsource(value) if inspect.isfunction(value) or inspect.isclass(value)
+        # Sets repr in hash order, which changes from one process to the next.
+        else repr(sorted(value)) if isinstance(value, (set, frozenset))
+        else repr(value)
+        for value in values
+    )
+    maps = json.dumps({name: globals()[variable] for name, variable in TAXONOMY_GLOBALS.items()}, sort_keys=True)
+    return hash_text(source + maps)
+
+
+def derivation_cache_path_for(output_path: Path) -> Path:
+    return output_path.with_name(f"{output_path.stem}.derive-cache.sqlite")
+
+
+class DerivationCache:
+    """On-disk LRU of ``derive_cached`` results, keyed by a hash of the function name and inputs.
+
+    Entries written under another ``derivation_fingerprint`` are dropped on
+    open. Lookups read SQLite directly; recency updates and new entries are
+    buffered and written by ``flush``, which then evicts least recently used
+    entries until the stored values fit in ``max_bytes``.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = DERIVATION_CACHE_MAX_BYTES, read: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.read = read
+        self.fingerprint = derivation_fingerprint()
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS derivations ("
+            "key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, data TEXT NOT NULL, "
+            "bytes INTEGER NOT NULL, used INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS derivations_used ON derivations (used)")
+        self.invalidated = self.conn.execute(
+            "DELETE FROM derivations WHERE fingerprint != ?", (self.fingerprint,)
+        ).rowcount
+        self.conn.commit()
+        self.clock = (self.conn.execute("SELECT MAX(used) FROM derivations").fetchone()[0] or 0) + 1
+        self.touched = {}
+        self.added = {}
+        self.hits = self.misses = self.evicted = 0
+
+    def key(self, inputs) -> str:
+        return hash_text(self.fingerprint + json.dumps(inputs))
+
+    def get(self, inputs):
+        if not self.read:
+            self.misses += 1
+            return None
+        key = self.key(inputs)
+        row = self.conn.execute("SELECT data FROM derivations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touched[key] = self.clock
+        self.clock += 1
+        return json.loads(row[0])
+
+    def put(self, inputs, derived: dict):
+        self.added[self.key(inputs)] = json.dumps(derived, ensure_ascii=False)
+
+    def flush(self):
+        self.conn.executemany("UPDATE derivations SET used = ? WHERE key = ?", [
+            (used, key) for key, used in self.touched.items()
+        ])
+        rows = []
+        for key, data in self.added.items():
+            rows.append((key, self.fingerprint, data, len(data), self.clock))
+            self.clock += 1
+        self.conn.executemany("INSERT OR REPLACE INTO derivations VALUES (?, ?, ?, ?, ?)", rows)
+        self.touched.clear()
+        self.added.clear()
+
+        total = self.conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM derivations").fetchone()[0]
+        if total > self.max_bytes:
+            evict = []
+            for key, size in self.conn.execute("SELECT key, bytes FROM derivations ORDER BY used"):
+                if total <= self.max_bytes:
+                    break
+                evict.append((key,))
+                total -= size
+            self.conn.executemany("DELETE FROM derivations WHERE key = ?", evict)
+            self.evicted += len(evict)
+        self.conn.commit()
+        return total
+
+    def close(self):
+        self.conn.close()
+
+    def report(self, stored_bytes: int) -> str:
+        lookups = self.hits + self.misses
+        rate = f"{100 * self.hits / lookups:.0f}%" if lookups else "-"
+        return (
+            f"Derivation cache: {self.hits} hits, {self.misses} misses ({rate} hit rate), "
+            f"{self.evicted} evicted, {self.invalidated} invalidated, "
+            f"{stored_bytes / 2**20:.1f} of {self.max_bytes / 2**20:.3g} MB"
+        )
+
+
+_derivation_cache = None
+
+
+def set_derivation_cache(cache):
+    """Use ``cache`` (a ``DerivationCache`` or None) for ``derive_cached``; returns the previous one."""
+    global _derivation_cache
+    previous, _derivation_cache = _derivation_cache, cache
+    return previous
+
+
+def flush_derivation_cache():
+    """Write buffered derivations and apply the size bound; returns the stored bytes, or None without a cache."""
+    if _derivation_cache is None:
+        return None
+    return _derivation_cache.flush()
+
+
+def derive_cached(derive, *inputs):
+    """``derive(*inputs)``, served from the derivation cache when one is set."""
+    if _derivation_cache is None:
+        return derive(*inputs)
+    key = [derive.__name__, *inputs]
+    derived = _derivation_cache.get(key)
+    if derived is None:
+        derived = derive(*inputs)
+        _derivation_cache.put(key, derived)
+    return derived
+
+
+_column_map = {}
+
+
+def set_column_map(columns: dict):
+    """Read feeds with other headers; ``columns`` maps the column names used here to the feed's."""
+    global _column_map
+    _column_map = {source: column for column, source in columns.items()}
+
+
+def rename_columns(fieldnames: list) -> list:
+    """Feed header names as the names used here, under the active ``set_column_map``."""
+    return [_column_map.get(name, name) for name in fieldnames]
+
+
+def _rename_columns(reader):
+    if _column_map and reader.fieldnames:
+        reader.fieldnames = rename_columns(reader.fieldnames)
+    return reader
+
+
+def read_rows(csv_path: Path, workers: int = 1):
+    """Feed rows as dicts; with ``workers > 1``, byte-range chunks are parsed in parallel (see csv_chunks.py)."""
+    if workers > 1:
+        yield from _rename_columns(ChunkedDictReader(csv_path, workers))
+        return
+    with open(csv_path, newline="", encoding="utf-8") as handle:
+        yield from _rename_columns(csv.DictReader(handle))
+
+
+def row_key(row: dict):
+    return normalize_inline(row.get("Name_URL")) or normalize_inline(row.get("product_title") or row.get("Name"))
+
+
+def group_rows(rows):
+    """Group rows by product key, keeping first-appearance order of keys and rows."""
+    groups = {}
+    for chunk in iter_chunks(rows, NORMALIZE_BATCH_ROWS):
+        prime_text(chunk)
+        for row in chunk:
+            key = row_key(row)
+            if key:
+                groups.setdefault(key, []).append(row)
+    return groups
+
+
+def dedupe_entries(groups: dict) -> list:
+    """``(key, name, description)`` per group, as ``parse_row`` reads them from the group's rows."""
+    entries = []
+    for key, rows in groups.items():
+        name = normalize_inline(rows[0].get("product_title") or rows[0].get("Name"))
+        description = next(filter(None, (normalize_inline(row.get("Description")) for row in rows)), "")
+        entries.append((key, name, description))
+    return entries
+
+
+def dedupe_groups(groups: dict, log_path: Path) -> tuple:
+    """Fold near-duplicate groups into the first-seen one; returns the groups and the pass's counts.
+
+    A folded group's rows run group by group in first-appearance order, so
+    the first-non-empty merge rules keep the first-seen listing's values.
+    """
+    with open(log_path, "w", encoding="utf-8") as log:
+        merged_into, stats = find_duplicates(dedupe_entries(groups), log)
+    deduped = {}
+    for key, rows in groups.items():
+        deduped.setdefault(merged_into.get(key, key), []).extend(rows)
+    return deduped, stats
+
+
+def build_group(rows, image_index: dict):
+    """Fold a group's rows into one product; a ``--dedupe`` group can hold rows from several keys."""
+    product = None
+    for row in rows:
+        fields = parse_row(row, image_index)
+        if product is None:
+            product = new_product(fields)
+        else:
+            merge_fields(product, fields)
+        add_image(product, fields["image_path"])
+    return product
+
+
+_worker_image_index = {}
+
+
+def _init_worker(image_index: dict, normalizer: str = "scalar", taxonomy=None):
+    global _worker_image_index
+    _worker_image_index = image_index
+    # A forked worker must not share the parent's SQLite connection.
+    set_derivation_cache(None)
+    set_normalizer(normalizer)
+    if taxonomy:
+        set_taxonomy(taxonomy)
+
+
+def _build_group_in_worker(rows):
+    return build_group(rows, _worker_image_index)
+
+
+def build_groups(groups: dict, image_index: dict, workers: int = 1):
+    """Build one product per key group, optionally fanning groups out to worker processes.
+
+    Each group holds a key's rows in file order, so a worker replays them
+    through the same merge rules a serial run uses. ``pool.map`` returns
+    results in submission order, which keeps the key insertion order (and
+    therefore tie-breaking in the name sort) unchanged.
+    """
+    if workers <= 1 or len(groups) < 2:
+        return {key: build_group(rows, image_index) for key, rows in groups.items()}
+    chunksize = max(1, len(groups) // (workers * 4))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(image_index, "scalar" if _text_memo is None else "batch", _taxonomy_overrides),
+    ) as pool:
+        products = pool.map(_build_group_in_worker, groups.values(), chunksize=chunksize)
+        return dict(zip(groups, products))
+
+
+def build_products(csv_path: Path, image_index: dict, workers: int = 1):
+    return build_groups(group_rows(read_rows(csv_path)), image_index, workers)
+
+
+def report_worker_scaling(csv_path: Path, image_index: dict, max_workers: int):
+    """Print rows/sec for 1..max_workers and check every run matches the serial output."""
+    row_count = sum(1 for _ in read_rows(csv_path))
+    baseline = None
+    print(f"{'workers':>7}  {'seconds':>8}  {'rows/sec':>10}  identical")
+    for workers in range(1, max_workers + 1):
+        started = time.perf_counter()
+        products = finalize_products(build_products(csv_path, image_index, workers))
+        elapsed = time.perf_counter() - started
+        if baseline is None:
+            baseline = products
+        print(f"{workers:>7}  {elapsed:>8.3f}  {row_count / elapsed:>10.0f}  {products == baseline}")
+
+
+def approx_tokens(text: str) -> int:
+    """Rough BPE token count of ``text``, without a model vocabulary.
+
+    A run of letters costs one token per ``PROMPT_WORD_CHARS``, a run of
+    digits one per ``PROMPT_DIGIT_CHARS`` and any other run one per
+    ``PROMPT_SYMBOL_CHARS``. Whitespace is free, as it joins the next token.
+    """
+    count = 0
+    for piece in PROMPT_TOKEN_PATTERN.findall(text):
+        if piece.isascii() and piece.isalpha():
+            count += -(-len(piece) // PROMPT_WORD_CHARS)
+        elif piece.isdigit():
+            count += -(-len(piece) // PROMPT_DIGIT_CHARS)
+        else:
+            count += -(-len(piece) // PROMPT_SYMBOL_CHARS)
+    return count
+
+
+def fit_tokens(text: str, budget: int) -> str:
+    """``text``, or its longest run of whole words that fits ``budget`` tokens with a trailing "..."."""
+    if approx_tokens(text) <= budget:
+        return text
+    kept = []
+    used = approx_tokens("...")
+    for word in text.split(" "):
+        used += approx_tokens(word)
+        if used > budget:
+            break
+        kept.append(word)
+    return " ".join(kept).rstrip(" ,.:;") + "..."
+
+
+def prompt_summary(product: dict, budget: int = PROMPT_SUMMARY_TOKENS) -> str:
+    """The description (or first feature, without one) cut to ``budget`` for the shopper agent's prompt.
+
+    server.js sends it in place of ``description``. Name, price, rating,
+    labels and promotions stay structured fields of the candidate, so they
+    are not repeated here.
+    """
+    features = product.get("features") or []
+    return fit_tokens(product.get("description") or (features[0] if features else ""), budget)
+
+
+def set_prompt_summary(product: dict, budget: int = PROMPT_SUMMARY_TOKENS) -> dict:
+    """Store ``prompt_summary`` on ``product``; a budget of 0 leaves it out."""
+    product["prompt_summary"] = prompt_summary(product, budget) if budget > 0 else None
+    return product
+
+
+def finalize_products(products_by_key: dict, id_prefix: str = ID_PREFIX, prompt_tokens: int = PROMPT_SUMMARY_TOKENS):
+    """Assign ``<id_prefix>N`` ids in name order, add prompt summaries and drop empty fields.
+
+    Returns ``(key, product)`` pairs in output order.
+    """
+    ordered = sorted(products_by_key.items(), key=lambda item: item[1].get("name", ""))
+    finalized = []
+    for idx, (key, product) in enumerate(ordered):
+        product["id"] = f"{id_prefix}{idx + 1}"
+        finalized.append((key, compact(set_prompt_summary(product, prompt_tokens))))
+    return finalized
+
+
+def manifest_path_for(output_path: Path) -> Path:
+    return output_path.with_name(f"{output_path.stem}.build-manifest.json")
+
+
+def generation_path_for(output_path: Path) -> Path:
+    return output_path.with_name(f"{output_path.stem}.generation")
+
+
+def read_generation(output_path: Path) -> int:
+    try:
+        return int(generation_path_for(output_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return 0
+
+
+def bump_generation(output_path: Path) -> int:
+    """Count one more published build, once every output is in place; consumers reload when it changes."""
+    generation = read_generation(output_path) + 1
+    with atomic_output(generation_path_for(output_path)) as handle:
+        handle.write(f"{generation}\n".encode("utf-8"))
+    return generation
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def hash_row(row: dict) -> str:
+    return hash_text(json.dumps(row, sort_keys=True, ensure_ascii=False))
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_fingerprint(image_index: dict, options=()) -> str:
+    """Anything outside the rows that changes derived fields forces a full rebuild."""
+    source = Path(__file__).read_text(encoding="utf-8")
+    settings = json.dumps([_taxonomy_overrides, _column_map, list(options)], sort_keys=True)
+    return hash_text(source + json.dumps(image_index, sort_keys=True) + settings)
+
+
+def load_previous_build(output_path: Path, fingerprint: str):
+    """Return ``{key: (key_hash, product)}`` from the last build, or None if it can't be reused."""
+    manifest_path = manifest_path_for(output_path)
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("fingerprint") != fingerprint:
+            return None
+        if manifest.get("output_hash") != file_digest(output_path):
+            return None
+        payload = json.loads(output_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    products_by_id = {product.get("id"): product for product in payload.get("products", [])}
+    return {
+        key: (entry["hash"], products_by_id.get(entry["id"]))
+        for key, entry in manifest.get("keys", {}).items()
+    }
+
+
+def build_incremental(groups: dict, image_index: dict, previous: dict, workers: int = 1):
+    """Rebuild only key groups whose rows changed, reusing the previous output for the rest."""
+    row_hashes = {key: [hash_row(row) for row in rows] for key, rows in groups.items()}
+    key_hashes = {key: hash_text("".join(hashes)) for key, hashes in row_hashes.items()}
+    reused = {}
+    changed = {}
+    for key, rows in groups.items():
+        key_hash, product = previous.get(key, (None, None))
+        if product is not None and key_hash == key_hashes[key]:
+            reused[key] = dict(product)
+        else:
+            changed[key] = rows
+    built = build_groups(changed, image_index, workers)
+    products_by_key = {key: reused[key] if key in reused else built[key] for key in groups}
+    stats = {
+        "reused": len(reused),
+        "rebuilt": len(changed),
+        "removed": len(set(previous) - set(groups)),
+    }
+    return products_by_key, row_hashes, key_hashes, stats
+
+
+def write_manifest(output_path: Path, fingerprint: str, finalized, row_hashes: dict, key_hashes: dict):
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "fingerprint": fingerprint,
+        "output_hash": file_digest(output_path),
+        "rows": [row_hash for hashes in row_hashes.values() for row_hash in hashes],
+        "keys": {key: {"hash": key_hashes[key], "id": product["id"]} for key, product in finalized},
+    }
+    manifest_path_for(output_path).write_text(json.dumps(manifest), encoding="utf-8")
+
+
+def search_tokenize(value) -> list:
+    """Same rule as ``tokenize()`` in server.js."""
+    return [token for token in SEARCH_TOKEN_SPLIT.split(str(value or "").lower()) if len(token) >= 2]
+
+
+def search_blob_values(product: dict) -> list:
+    """The fields ``getProductSearchBlob`` in server.js joins, in the same order."""
+    values = [
+        product.get("name"),
+        product.get("category"),
+        product.get("product_type"),
+        product.get("description"),
+        product.get("composition"),
+        product.get("how_to_use"),
+        product.get("results_timeline"),
+    ]
+    for field in ("collections", "categories", "concerns", "benefits", "features", "ingredients", "promotions"):
+        values.extend(product.get(field) or [])
+    values.append(product.get("coupon_applicable"))
+    return [value for value in values if value]
+
+
+def product_price(product: dict) -> float:
+    """Price as ``normalizeCatalogProduct`` in server.js resolves it, defaulting to 0."""
+    first_variant = (product.get("variants") or [{}])[0]
+    for value in (product.get("price"), first_variant.get("sale_price"), first_variant.get("standard_price")):
+        price = parse_price(str(value)) if value is not None else None
+        if price is not None:
+            return price
+    return 0.0
+
+
+def to_bitset(ordinals) -> str:
+    bits = bytearray()
+    for ordinal in ordinals:
+        byte = ordinal >> 3
+        if byte >= len(bits):
+            bits.extend(bytes(byte + 1 - len(bits)))
+        bits[byte] |= 1 << (ordinal & 7)
+    return format(int.from_bytes(bits, "little"), "x")
+
+
+def search_entry(product: dict) -> tuple:
+    """``(flags, facets)`` for one product: a ``SEARCH_FIELDS`` mask per token, and its ``(facet, label)`` pairs."""
+    flags = {}
+    for value in search_blob_values(product):
+        for token in search_tokenize(value):
+            flags[token] = SEARCH_FIELDS["blob"]
+    for field in ("name", "category"):
+        for token in search_tokenize(product.get(field)):
+            flags[token] |= SEARCH_FIELDS[field]
+
+    facets = [(facet, label) for facet in ("concerns", "categories", "collections") for label in product.get(facet) or []]
+    price = product_price(product)
+    for band, low, high in PRICE_BANDS:
+        if low < price <= high or (low == 0 and price == 0):
+            facets.append(("price_bands", band))
+    if "fragrance" in (product.get("composition") or "").lower():
+        facets.append(("composition", "fragrance"))
+    return flags, list(dict.fromkeys(facets))
+
+
+def search_postings(entries: list) -> tuple:
+    """``(postings, facets)`` from ``search_entry`` results in catalog order; facets hold ordinal lists."""
+    postings = {}
+    facets = {facet: {} for facet in SEARCH_FACETS}
+    for ordinal, (flags, memberships) in enumerate(entries):
+        for token, mask in flags.items():
+            postings.setdefault(token, []).extend((ordinal, mask))
+        for facet, label in memberships:
+            facets[facet].setdefault(label, []).append(ordinal)
+    return postings, facets
+
+
+def search_index_document(ids: list, postings: dict, facets: dict) -> dict:
+    return {
+        "version": SEARCH_INDEX_VERSION,
+        "products": ids,
+        "fields": SEARCH_FIELDS,
+        "postings": dict(sorted(postings.items())),
+        "facets": {
+            facet: {label: to_bitset(ordinals) for label, ordinals in sorted(values.items()) if ordinals}
+            for facet, values in facets.items()
+        },
+    }
+
+
+def build_search_index(products: list) -> dict:
+    """Inverted token index and facet bitsets over the finalized catalog.
+
+    ``postings`` maps every blob token to a flat ``[ordinal, flags, ...]`` list,
+    where ``flags`` is a mask of ``SEARCH_FIELDS``. Facets are hex bitsets
+    with bit ``i`` set for the product at ordinal ``i``.
+    """
+    postings, facets = search_postings([search_entry(product) for product in products])
+    return search_index_document([product.get("id") for product in products], postings, facets)
+
+
+def write_search_index(index: dict, output_path: Path, serializer: str = "auto"):
+    with atomic_output(search_index_path_for(output_path)) as handle:
+        handle.write(SERIALIZERS[resolve_serializer(serializer)](index, False))
+
+
+def search_index_path_for(output_path: Path) -> Path:
+    return output_path.with_name(f"{output_path.stem}.search-index.json")
+
+
+def ingredient_index_path_for(output_path: Path) -> Path:
+    return output_path.with_name(f"{output_path.stem}.ingredients.json")
+
+
+def build_ingredient_index(ingredients: list) -> dict:
+    """Global ingredient dictionary and ingredient -> product postings.
+
+    ``ingredients`` holds ``(product id, canonical names)`` in catalog order.
+    An ingredient's id is its position in the sorted ``ingredients`` list of
+    the index, and ``postings[id]`` lists the ordinals of the products that
+    contain it.
+    """
+    names = sorted({name for _, product_names in ingredients for name in product_names})
+    ids = {name: ingredient_id for ingredient_id, name in enumerate(names)}
+    postings = [[] for _ in names]
+    for ordinal, (_, product_names) in enumerate(ingredients):
+        for name in product_names:
+            postings[ids[name]].append(ordinal)
+    return {
+        "version": INGREDIENT_INDEX_VERSION,
+        "products": [product_id for product_id, _ in ingredients],
+        "ingredients": names,
+        "postings": postings,
+    }
+
+
+def set_ingredient_ids(product: dict, names: list, ids: dict) -> dict:
+    product.pop("ingredient_ids", None)
+    if names:
+        product["ingredient_ids"] = [ids[name] for name in names]
+    return product
+
+
+def link_ingredients(products: list) -> dict:
+    """Store each product's full ingredient list as ids; returns the ingredient index."""
+    ingredients = [(product.get("id"), product_ingredients(product)) for product in products]
+    index = build_ingredient_index(ingredients)
+    ids = {name: ingredient_id for ingredient_id, name in enumerate(index["ingredients"])}
+    for product, (_, names) in zip(products, ingredients):
+        set_ingredient_ids(product, names, ids)
+    return index
+
+
+def write_ingredient_index(index: dict, output_path: Path, serializer: str = "auto"):
+    with atomic_output(ingredient_index_path_for(output_path)) as handle:
+        handle.write(SERIALIZERS[resolve_serializer(serializer)](index, False))
+
+
+def product_rating(product: dict) -> float:
+    """``rating ?? star_rating`` as ``normalizeCatalogProduct`` in app.js resolves it, defaulting to 0."""
+    rating = product.get("rating")
+    if rating is None:
+        rating = product.get("star_rating")
+    return rating or 0
+
+
+def routine_role(product: dict) -> str:
+    """Same rule as ``getProductRoutineRole`` in app.js."""
+    haystack = f"{product.get('category') or ''} {product.get('product_type') or ''} {product.get('name') or ''}"
+    haystack = haystack.lower()
+    for role, pattern in ROUTINE_ROLES:
+        if pattern.search(haystack):
+            return role
+    return "skincare"
+
+
+def product_text_blob(product: dict) -> str:
+    """The fields ``getProductTextBlob`` in app.js joins, in the same order."""
+    values = [product.get(field) for field in ("name", "category", "product_type", "description")]
+    values += [product.get(field) for field in ("overview", "overview_summary", "composition")]
+    for field in ("concerns", "benefits", "categories"):
+        values.extend(product.get(field) or [])
+    return " ".join(str(value) for value in values if value).lower()
+
+
+def normalized_labels(values) -> list:
+    labels = [str(value or "").strip().lower() for value in values or []]
+    return [label for label in labels if label]
+
+
+def related_features(product: dict) -> dict:
+    """The parts of a product the similar and pairing scores read."""
+    role = routine_role(product)
+    boost = 0
+    if role in PAIRING_BOOSTS:
+        pattern, field = PAIRING_BOOSTS[role]
+        text = product.get("description") or "" if field == "description" else product_text_blob(product)
+        boost = 1 if pattern.search(text) else 0
+    return {
+        "id": product.get("id"),
+        "role": role,
+        "rating": product_rating(product),
+        "families": normalized_labels(product.get("collections")),
+        "concerns": normalized_labels(product.get("concerns")),
+        "skin_type": str(product.get("skin_type") or "").strip().lower(),
+        "pairing_boost": boost,
+    }
+
+
+def score_similar(source: dict, candidate: dict) -> float:
+    """Port of ``scoreSimilarCandidate`` in app.js over ``related_features``."""
+    if candidate["id"] == source["id"] or candidate["role"] != source["role"]:
+        return -math.inf
+    score = candidate["rating"] * 0.6
+    if any(family in candidate["families"] for family in source["families"]):
+        score += 4
+    score += sum(1 for concern in source["concerns"] if concern in candidate["concerns"]) * 1.5
+    if source["skin_type"] and candidate["skin_type"] and source["skin_type"] in candidate["skin_type"]:
+        score += 1.5
+    return score
+
+
+def score_pairing(source: dict, candidate: dict, preferred_roles: list) -> float:
+    """Port of ``scorePairingCandidate`` in app.js over ``related_features``."""
+    if candidate["id"] == source["id"] or candidate["role"] not in preferred_roles:
+        return -math.inf
+    score = candidate["rating"] * 0.6
+    score += max(0, 3 - preferred_roles.index(candidate["role"])) * 2
+    if any(family in candidate["families"] for family in source["families"]):
+        score += 4
+    score += sum(1 for concern in source["concerns"] if concern in candidate["concerns"]) * 1.5
+    if source["skin_type"] and candidate["skin_type"] and source["skin_type"] in candidate["skin_type"]:
+        score += 1.5
+    return score + candidate["pairing_boost"]
+
+
+def pairing_roles(role: str) -> list:
+    return PAIRING_ROLES.get(role, PAIRING_ROLES["skincare"])
+
+
+def related_signature(feature: dict) -> tuple:
+    """Everything but the candidate-only part (rating, routine boost) that a score reads."""
+    return (
+        feature["role"],
+        tuple(sorted(feature["families"])),
+        tuple(sorted(feature["concerns"])),
+        feature["skin_type"],
+    )
+
+
+class RelatedIndex:
+    """Exact top-K similar and pairing lists without scoring every pair.
+
+    Scores depend on the source only through its ``related_signature``, and on
+    a candidate through its signature plus a candidate-only part: the rating,
+    and the routine boost when pairing. So one search per distinct source
+    signature serves every product that shares it. Within a group of
+    candidates with the same signature, a higher candidate-only part always
+    scores higher, so only a group's best ``top_k + 1`` members can ever
+    place. ``add`` keeps just those, which bounds the index by the number of
+    signatures rather than products, so a streaming build can feed it one
+    product at a time. Groups are visited best member first and the search
+    stops once the K-th score beats the next group's best. Ties break by
+    catalog order, where app.js broke them by its shuffled order.
+    """
+
+    MODES = ("similar", "pairing")
+
+    def __init__(self, features=(), top_k: int = RELATED_TOP_K):
+        self.top_k = top_k
+        self.features = {}
+        self.signatures_by_role = {}
+        self.members = {mode: {} for mode in self.MODES}
+        self._searches = {}
+        for ordinal, feature in enumerate(features):
+            self.add(ordinal, feature)
+
+    def add(self, ordinal: int, feature: dict):
+        """Offer the product at ``ordinal`` as a candidate; ordinals must arrive in catalog order."""
+        signature = related_signature(feature)
+        if signature not in self.members["similar"]:
+            self.signatures_by_role.setdefault(signature[0], []).append(signature)
+        bases = {"similar": feature["rating"] * 0.6, "pairing": feature["rating"] * 0.6 + feature["pairing_boost"]}
+        groups = [self.members[mode].setdefault(signature, []) for mode in self.MODES]
+        evicted = set()
+        for group, mode in zip(groups, self.MODES):
+            bisect.insort(group, (-bases[mode], ordinal))
+            if len(group) > self.top_k + 1:
+                evicted.add(group.pop()[1])
+        self.features[ordinal] = feature
+        for candidate in evicted:
+            if not any(member == candidate for group in groups for _, member in group):
+                del self.features[candidate]
+
+    def _search(self, source: dict, roles: list, mode: str, score) -> list:
+        """Best ``top_k + 1`` ordinals for ``source``, so dropping the product itself still leaves K."""
+        limit = self.top_k + 1
+        members = self.members[mode]
+        heads = []
+        for role in roles:
+            for signature in self.signatures_by_role.get(role, []):
+                first = members[signature][0][1]
+                heads.append((-score(source, self.features[first]), first, signature))
+        heads.sort()
+        top = []
+        for head, _, signature in heads:
+            if len(top) == limit and head > top[-1][0]:
+                break
+            for _, candidate in members[signature]:
+                value = score(source, self.features[candidate])
+                if value <= 0 or (len(top) == limit and -value > top[-1][0]):
+                    break
+                bisect.insort(top, (-value, candidate))
+                del top[limit:]
+        return [candidate for _, candidate in top]
+
+    def _related(self, ordinal: int, feature: dict, mode: str) -> list:
+        key = (mode, related_signature(feature))
+        if key not in self._searches:
+            # Scored as an anonymous source so no candidate is excluded as "itself".
+            source = dict(feature, id=None)
+            if mode == "similar":
+                self._searches[key] = self._search(source, [feature["role"]], mode, score_similar)
+            else:
+                roles = pairing_roles(feature["role"])
+
+                def score(source, candidate):
+                    return score_pairing(source, candidate, roles)
+
+                self._searches[key] = self._search(source, roles, mode, score)
+        return [candidate for candidate in self._searches[key] if candidate != ordinal][: self.top_k]
+
+    def lists(self, ordinal: int, feature: dict) -> dict:
+        """``set_related`` lists for the product at ``ordinal``, whose ``related_features`` are ``feature``."""
+        return {
+            f"{mode}_ids": [self.features[candidate]["id"] for candidate in self._related(ordinal, feature, mode)]
+            for mode in self.MODES
+        }
+
+
+def related_products(products, top_k: int = RELATED_TOP_K) -> list:
+    """``{"similar_ids": [...], "pairing_ids": [...]}`` per product, in catalog order.
+
+    ``products`` may be any iterable of finalized products; only their
+    ``related_features`` are kept, so a streaming build can pass its store.
+    """
+    return related_lists([related_features(product) for product in products], top_k)
+
+
+def related_lists(features: list, top_k: int = RELATED_TOP_K) -> list:
+    """``related_products`` over precomputed ``related_features``."""
+    index = RelatedIndex(features, top_k)
+    return [index.lists(ordinal, feature) for ordinal, feature in enumerate(features)]
+
+
+def related_products_linear(products: list, top_k: int = RELATED_TOP_K) -> list:
+    """Reference for ``related_products``: scores every pair like app.js does."""
+    features = [related_features(product) for product in products]
+    related = []
+    for source in features:
+        roles = pairing_roles(source["role"])
+        lists = {}
+        for field, score in (
+            ("similar_ids", lambda candidate: score_similar(source, candidate)),
+            ("pairing_ids", lambda candidate: score_pairing(source, candidate, roles)),
+        ):
+            scored = [(score(candidate), candidate["id"]) for candidate in features]
+            ranked = sorted((entry for entry in scored if entry[0] > 0), key=lambda entry: -entry[0])
+            lists[field] = [product_id for _, product_id in ranked[:top_k]]
+        related.append(lists)
+    return related
+
+
+def set_related(product: dict, lists: dict) -> dict:
+    """Store the id lists on ``product``, keeping it compact and its key order stable across rebuilds."""
+    for field in lists:
+        product.pop(field, None)
+    for field, ids in lists.items():
+        if ids:
+            product[field] = ids
+    return product
+
+
+def link_related(products: list) -> list:
+    for product, lists in zip(products, related_products(products)):
+        set_related(product, lists)
+    return products
+
+
+class ProductStore:
+    """On-disk product store keyed by ``Name_URL`` for streaming builds.
+
+    Partial products are spilled to SQLite after every chunk so only one chunk
+    of rows and its products are held in memory at a time. Iteration yields
+    products in the same order as ``sorted(..., key=name)`` over insertion
+    order: SQLite's binary collation orders UTF-8 by code point, and ``seq``
+    breaks ties the way a stable sort would.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            "key TEXT PRIMARY KEY, seq INTEGER NOT NULL, name TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS products_order ON products (name, seq)")
+        # Filled by index_stream: finalized ids and ingredient names, read back by the second pass.
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS links (ordinal INTEGER PRIMARY KEY, id TEXT, ingredients TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS postings (name TEXT NOT NULL, ordinal INTEGER NOT NULL)")
+        self.next_seq = self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def load(self, keys):
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            batch = keys[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            query = f"SELECT key, data FROM products WHERE key IN ({placeholders})"
+            for key, data in self.conn.execute(query, batch):
+                found[key] = json.loads(data)
+        return found
+
+    def save(self, products_by_key: dict):
+        existing = self.load(products_by_key)
+        inserts = []
+        updates = []
+        for key, product in products_by_key.items():
+            data = json.dumps(dict(product), ensure_ascii=False)
+            if key in existing:
+                updates.append((product.get("name", ""), data, key))
+            else:
+                inserts.append((key, self.next_seq, product.get("name", ""), data))
+                self.next_seq += 1
+        self.conn.executemany("UPDATE products SET name = ?, data = ? WHERE key = ?", updates)
+        self.conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?)", inserts)
+        self.conn.commit()
+
+    def save_links(self, links: list):
+        """Store ``(ordinal, product id, ingredient names)`` for finalized products."""
+        self.conn.executemany(
+            "INSERT INTO links VALUES (?, ?, ?)",
+            [(ordinal, product_id, json.dumps(names, ensure_ascii=False)) for ordinal, product_id, names in links],
+        )
+        self.conn.executemany(
+            "INSERT INTO postings VALUES (?, ?)",
+            [(name, ordinal) for ordinal, _, names in links for name in names],
+        )
+
+    def finish_links(self):
+        self.conn.execute("CREATE INDEX IF NOT EXISTS postings_order ON postings (name, ordinal)")
+        self.conn.commit()
+
+    def ingredient_names(self) -> list:
+        """Distinct ingredient names in code point order, as ``sorted`` gives them."""
+        return [name for (name,) in self.conn.execute("SELECT DISTINCT name FROM postings ORDER BY name")]
+
+    def iter_links(self):
+        """``(product id, ingredient names)`` in catalog order."""
+        for product_id, names in self.conn.execute("SELECT id, ingredients FROM links ORDER BY ordinal"):
+            yield product_id, json.loads(names)
+
+    def iter_postings(self):
+        """Ordinals of the products that contain each ingredient, in ``ingredient_names`` order."""
+        cursor = self.conn.execute("SELECT name, ordinal FROM postings ORDER BY name, ordinal")
+        for _, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+            yield [ordinal for _, ordinal in rows]
+
+    def __len__(self):
+        return self.next_seq
+
+    def __iter__(self):
+        cursor = self.conn.execute("SELECT data FROM products ORDER BY name, seq")
+        for (data,) in cursor:
+            yield json.loads(data)
+
+    def close(self):
+        self.conn.close()
+
+
+def iter_chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_products_streaming(csv_path: Path, image_index: dict, store: ProductStore, chunk_size: int):
+    for chunk in iter_chunks(read_rows(csv_path), chunk_size):
+        prime_text(chunk)
+        parsed = [fields for fields in (parse_row(row, image_index) for row in chunk) if fields]
+        products_by_key = store.load({fields["key"] for fields in parsed})
+        for fields in parsed:
+            apply_row(products_by_key, fields)
+        store.save(products_by_key)
+        # Keep memory bounded by one chunk.
+        if _text_memo is not None:
+            _text_memo.clear()
+        flush_derivation_cache()
+
+
+def finalize_stream(store: ProductStore, id_prefix: str = ID_PREFIX, prompt_tokens: int = PROMPT_SUMMARY_TOKENS):
+    """Like ``finalize_products`` but relies on the store's name ordering."""
+    for idx, product in enumerate(store):
+        product["id"] = f"{id_prefix}{idx + 1}"
+        yield compact(set_prompt_summary(product, prompt_tokens))
+
+
+def index_stream(store: ProductStore, products, chunk_size: int = 5000) -> RelatedIndex:
+    """First pass of a streaming build over finalized ``products``.
+
+    Ids and ingredient names go to ``store``, and each product is offered
+    to a ``RelatedIndex``, which keeps only the candidates that can place.
+    """
+    related = RelatedIndex()
+    for chunk in iter_chunks(enumerate(products), chunk_size):
+        store.save_links([(ordinal, product.get("id"), product_ingredients(product)) for ordinal, product in chunk])
+        for ordinal, product in chunk:
+            related.add(ordinal, related_features(product))
+    store.finish_links()
+    return related
+
+
+def write_ingredient_index_stream(store: ProductStore, names: list, output_path: Path, serializer: str = "auto"):
+    """``write_ingredient_index`` for a streaming build; ids and postings are read from ``store`` as they are written."""
+    encode = SERIALIZERS[resolve_serializer(serializer)]
+    with atomic_output(ingredient_index_path_for(output_path)) as handle:
+
+        def write_items(values):
+            for position, value in enumerate(values):
+                if position:
+                    handle.write(b",")
+                handle.write(encode(value, False))
+
+        handle.write(b'{"version":' + encode(INGREDIENT_INDEX_VERSION, False) + b',"products":[')
+        write_items(product_id for product_id, _ in store.iter_links())
+        handle.write(b'],"ingredients":' + encode(names, False) + b',"postings":[')
+        write_items(store.iter_postings())
+        handle.write(b"]}")
+
+
+SERIALIZERS = {}
+
+
+def register_serializer(name: str):
+    def register(encode):
+        SERIALIZERS[name] = encode
+        return encode
+
+    return register
+
+
+_STDLIB_ENCODERS = {
+    True: json.JSONEncoder(indent=2, ensure_ascii=False),
+    False: json.JSONEncoder(separators=(",", ":"), ensure_ascii=False),
+}
+
+
+@register_serializer("stdlib")
+def encode_stdlib(value, indent: bool) -> bytes:
+    return _STDLIB_ENCODERS[indent].encode(value).encode("utf-8")
+
+
+if orjson is not None:
+
+    @register_serializer("orjson")
+    def encode_orjson(value, indent: bool) -> bytes:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 if indent else 0)
+
+
+def resolve_serializer(name: str = "auto") -> str:
+    """``auto`` is the fastest installed backend; every backend writes identical bytes."""
+    if name == "auto":
+        return "orjson" if "orjson" in SERIALIZERS else "stdlib"
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unknown serializer {name!r}; installed: {', '.join(SERIALIZERS)}")
+    return name
+
+
+@contextlib.contextmanager
+def atomic_output(path: Path):
+    """Binary handle on a temp file beside ``path``, renamed over it when the block exits cleanly.
+
+    Readers see the old file or the new one, never a partial write.
+    """
+    path = Path(path)
+    handle = tempfile.NamedTemporaryFile(
+        "wb", buffering=WRITE_BUFFER_BYTES, dir=path.parent, prefix=f".{path.name}.", delete=False
+    )
+    try:
+        with handle:
+            yield handle
+        os.chmod(handle.name, 0o644)
+        os.replace(handle.name, path)
+    except BaseException:
+        os.unlink(handle.name)
+        raise
+
+
+def encode_products(products, output_format: str = "json", serializer: str = "auto", compact: bool = False):
+    """Yield each product's bytes as ``write_catalog`` lays it out."""
+    encode = SERIALIZERS[resolve_serializer(serializer)]
+    indent = output_format == "json" and not compact
+    for product in products:
+        if indent:
+            yield encode(product, True).replace(b"\n", b"\n    ")
+        else:
+            yield encode(product, False)
+
+
+def write_encoded(encoded, output_path: Path, output_format: str = "json", compact: bool = False) -> int:
+    """Write products already run through ``encode_products``; returns the count."""
+    count = 0
+    with atomic_output(output_path) as handle:
+        if output_format == "jsonl":
+            for product in encoded:
+                handle.write(product)
+                handle.write(b"\n")
+                count += 1
+            return count
+        if compact:
+            handle.write(b'{"products":[')
+            for product in encoded:
+                if count:
+                    handle.write(b",")
+                handle.write(product)
+                count += 1
+            handle.write(b"]}")
+            return count
+        handle.write(b'{\n  "products": [')
+        for product in encoded:
+            handle.write(b",\n    " if count else b"\n    ")
+            handle.write(product)
+            count += 1
+        handle.write(b"\n  ]\n}" if count else b"]\n}")
+    return count
+
+
+def write_catalog(
+    products, output_path: Path, output_format: str = "json", serializer: str = "auto", compact: bool = False
+):
+    """Encode and write products one at a time through a buffered handle.
+
+    The readable layout matches ``json.dumps(indent=2)``; ``compact`` drops
+    all whitespace. JSONL is always one compact product per line.
+    """
+    encoded = encode_products(products, output_format, serializer, compact)
+    return write_encoded(encoded, output_path, output_format, compact)
+
+
+class Profiler:
+    """Opt-in stage timers for a build.
+
+    ``install()`` rebinds the module functions listed in ``PROFILE_STAGES`` to
+    timing wrappers and ``uninstall()`` restores them, so a build without
+    profiling runs the plain functions. Times are exclusive: a function's
+    wall and CPU time exclude nested timed calls. Each ``build_group`` call is
+    also a row scope, which records the product key, its total time and a
+    per-stage breakdown so the slowest keys can be explained. Trace events use
+    the Chrome trace format (chrome://tracing, Perfetto, speedscope).
+    Worker processes started by ``--workers`` are not profiled.
+    """
+
+    def __init__(self, trace: bool = False, slowest: int = 10):
+        self.functions = {}
+        self.slowest = slowest
+        self.rows = []
+        self.events = [] if trace else None
+        self._stack = [[0.0, 0.0]]
+        self._row = None
+        self._originals = {}
+        self._started = time.perf_counter()
+
+    def _timed(self, stage: str, name: str, func):
+        record = self.functions.setdefault(name, {"stage": stage, "wall": 0.0, "cpu": 0.0, "calls": 0})
+        profiler = self
+
+        def enter():
+            profiler._stack.append([0.0, 0.0])
+            return time.perf_counter(), time.process_time()
+
+        def leave(wall_started, cpu_started):
+            wall = time.perf_counter() - wall_started
+            cpu = time.process_time() - cpu_started
+            child_wall, child_cpu = profiler._stack.pop()
+            record["wall"] += wall - child_wall
+            record["cpu"] += cpu - child_cpu
+            record["calls"] += 1
+            parent = profiler._stack[-1]
+            parent[0] += wall
+            parent[1] += cpu
+            if profiler._row is not None:
+                profiler._row[stage] = profiler._row.get(stage, 0.0) + wall - child_wall
+            events = profiler.events
+            if events is not None and len(events) < PROFILE_MAX_TRACE_EVENTS:
+                events.append(
+                    {
+                        "name": name,
+                        "cat": stage,
+                        "ph": "X",
+                        "ts": (wall_started - profiler._started) * 1e6,
+                        "dur": wall * 1e6,
+                        "pid": os.getpid(),
+                        "tid": 0,
+                    }
+                )
+
+        if inspect.isgeneratorfunction(func):
+            # Time each step of the generator, not just its creation.
+            @functools.wraps(func)
+            def timed_generator(*args, **kwargs):
+                iterator = func(*args, **kwargs)
+                while True:
+                    started = enter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        leave(*started)
+                    yield item
+
+            return timed_generator
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = enter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                leave(*started)
+
+        return timed
+
+    def _row_scope(self, func, key_of):
+        profiler = self
+
+        @functools.wraps(func)
+        def scoped(rows, *args, **kwargs):
+            outer = profiler._row
+            profiler._row = {}
+            started = time.perf_counter()
+            try:
+                return func(rows, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                entry = (elapsed, key_of(rows), len(rows), profiler._row)
+                if len(profiler.rows) < profiler.slowest:
+                    heapq.heappush(profiler.rows, entry)
+                else:
+                    heapq.heappushpop(profiler.rows, entry)
+                profiler._row = outer
+
+        return scoped
+
+    def install(self):
+        module = globals()
+        key_of = module["row_key"]
+        for stage, names in PROFILE_STAGES.items():
+            for name in names:
+                self._originals[name] = module[name]
+                module[name] = self._timed(stage, name, module[name])
+        module["build_group"] = self._row_scope(module["build_group"], lambda rows: key_of(rows[0]) if rows else "")
+        return self
+
+    def uninstall(self):
+        globals().update(self._originals)
+        self._originals = {}
+
+    def stage_totals(self) -> dict:
+        totals = {stage: {"wall": 0.0, "cpu": 0.0, "calls": 0} for stage in PROFILE_STAGES}
+        for record in self.functions.values():
+            total = totals[record["stage"]]
+            for field in ("wall", "cpu", "calls"):
+                total[field] += record[field]
+        return totals
+
+    def slowest_rows(self) -> list:
+        return sorted(self.rows, key=lambda entry: -entry[0])
+
+    def report(self) -> str:
+        lines = [f"{'stage':<16} {'wall s':>9} {'cpu s':>9} {'calls':>10}"]
+        for stage, total in self.stage_totals().items():
+            if total["calls"]:
+                lines.append(f"{stage:<16} {total['wall']:>9.3f} {total['cpu']:>9.3f} {total['calls']:>10}")
+        lines.append("")
+        lines.append(f"{'function':<24} {'stage':<14} {'wall s':>9} {'cpu s':>9} {'calls':>10}")
+        ranked = sorted(self.functions.items(), key=lambda item: -item[1]["wall"])
+        for name, record in ranked:
+            if record["calls"]:
+                lines.append(
+                    f"{name:<24} {record['stage']:<14} {record['wall']:>9.3f} "
+                    f"{record['cpu']:>9.3f} {record['calls']:>10}"
+                )
+        if self.rows:
+            lines.append("")
+            lines.append("slowest products (time, rows, top stages)")
+            for elapsed, key, row_count, breakdown in self.slowest_rows():
+                top = sorted(breakdown.items(), key=lambda item: -item[1])[:3]
+                why = ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in top)
+                lines.append(f"{elapsed * 1000:>8.1f}ms {row_count:>4}  {key}  [{why}]")
+        return "\n".join(lines)
+
+    def write_trace(self, path: Path):
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump({"traceEvents": self.events or [], "displayTimeUnit": "ms"}, handle)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the storefront catalog from the Shiseido CSV.")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH, help="source CSV feed")
+    parser.add_argument("--images", type=Path, default=IMAGES_ROOT, help="local image directory")
+    parser.add_argument("--output", type=Path, default=OUTPUT_PATH, help="catalog output path")
+    parser.add_argument("--id-prefix", default=ID_PREFIX, help=f"product id prefix (default: {ID_PREFIX})")
+    parser.add_argument(
+        "--format", choices=("json", "jsonl"), default="json", help="output document format"
+    )
+    parser.add_argument(
+        "--serializer",
+        choices=("auto", *SERIALIZERS),
+        default="auto",
+        help="JSON encoder; auto picks orjson when it is installed, else the stdlib (same output either way)",
+    )
+    parser.add_argument(
+        "--compact", action="store_true", help="write the catalog without indentation, for production"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="constant-memory build: merge rows in chunks through an on-disk product store",
+    )
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per chunk in --stream mode")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes for CSV parsing and row processing (default: 1)",
+    )
+    parser.add_argument(
+        "--normalizer",
+        choices=NORMALIZE_ENGINES,
+        default="batch",
+        help="text normalisation engine: batch memoises each distinct cell (default), scalar runs per call",
+    )
+    parser.add_argument(
+        "--prompt-tokens",
+        type=int,
+        default=PROMPT_SUMMARY_TOKENS,
+        help=f"approximate tokens per prompt_summary; 0 leaves it out (default: {PROMPT_SUMMARY_TOKENS})",
+    )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="also write a memory-mappable columnar copy (<output>.cols, see catalog_columnar.py)",
+    )
+    parser.add_argument(
+        "--derivatives",
+        action="store_true",
+        help="verify gallery images and write resized WebP/AVIF copies (<output>.images, see catalog_images.py)",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="merge near-duplicate listings first, logging each decision (<output>.dedupe.jsonl, see catalog_dedupe.py)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the build manifest, image index cache and derivation cache and reprocess everything",
+    )
+    parser.add_argument(
+        "--derivation-cache-mb",
+        type=float,
+        default=DERIVATION_CACHE_MAX_BYTES / 2**20,
+        help="size bound of the per-product derivation cache (<output>.derive-cache.sqlite); 0 disables it",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="after building, check the result against a full rebuild",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=bool(os.environ.get("CATALOG_PROFILE")),
+        help="print per-stage timings and the slowest products (or set CATALOG_PROFILE=1)",
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        default=os.environ.get("CATALOG_TRACE") or None,
+        help="write a Chrome trace event file of the profiled build (or set CATALOG_TRACE)",
+    )
+    parser.add_argument(
+        "--scaling",
+        action="store_true",
+        help="report rows/sec for 1..--workers processes instead of writing the catalog",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and rebuild only the changed products when the CSV or images change (see catalog_watch.py)",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=WATCH_DEBOUNCE_SECONDS,
+        help=f"seconds without further changes before a --watch rebuild starts (default: {WATCH_DEBOUNCE_SECONDS})",
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.stream and args.workers > 1:
+        parser.error("--stream and --workers cannot be combined")
+    if args.stream and args.columnar:
+        parser.error("--columnar needs the in-memory build and cannot be combined with --stream")
+    if args.stream and args.derivatives:
+        parser.error("--derivatives needs the in-memory build and cannot be combined with --stream")
+    if args.stream and args.dedupe:
+        parser.error("--dedupe needs the in-memory build and cannot be combined with --stream")
+    if args.watch:
+        for flag in ("stream", "columnar", "derivatives", "dedupe", "verify", "scaling"):
+            if getattr(args, flag):
+                parser.error(f"--watch cannot be combined with --{flag}")
+    return args
+
+
+def main(argv=None) -> list:
+    """Run the CLI; returns the paths of the outputs a build published (see ``build``)."""
+    args = parse_args(argv)
+    if not (args.profile or args.trace):
+        return run(args)
+
+    profiler = Profiler(trace=bool(args.trace)).install()
+    try:
+        return run(args)
+    finally:
+        profiler.uninstall()
+        print(profiler.report())
+        if args.trace:
+            profiler.write_trace(args.trace)
+            print(f"Wrote {len(profiler.events)} trace events to {args.trace}")
+
+
+def run(args) -> list:
+    set_normalizer(args.normalizer)
+    # Every output, the derivation cache included, is written beside --output.
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    cache = None
+    # Serial builds only: pool workers run without the cache, and --scaling must time real work.
+    if args.derivation_cache_mb > 0 and not args.scaling:
+        cache = DerivationCache(
+            derivation_cache_path_for(args.output), int(args.derivation_cache_mb * 2**20), read=not args.full
+        )
+    previous_cache = set_derivation_cache(cache)
+    try:
+        if args.watch:
+            # Imported here: catalog_watch builds on this module.
+            from catalog_watch import watch
+
+            watch(args)
+            return []
+        return build(args)
+    finally:
+        clear_vocabularies()
+        set_derivation_cache(previous_cache)
+        if cache is not None:
+            stored_bytes = cache.flush()
+            print(cache.report(stored_bytes))
+            cache.close()
+
+
+def build(args) -> list:
+    """Build the catalog and its sidecars; returns the published output files.
+
+    Build state beside them (the build manifest, generation counter,
+    derivation cache and dedupe log) is left out, so callers can hash the
+    list and get the same answer for the same inputs.
+    """
+    image_index = build_image_index(args.images, use_cache=not args.full)
+
+    if args.scaling:
+        report_worker_scaling(args.csv, image_index, args.workers)
+        return []
+
+    if args.stream:
+        with tempfile.TemporaryDirectory(prefix="catalog-store-") as tmp_dir:
+            store = ProductStore(Path(tmp_dir) / "products.sqlite")
+            try:
+                build_products_streaming(args.csv, image_index, store, args.chunk_size)
+                # Related lists and ingredient ids need every product, so the store is read twice. Only the
+                # related index and the ingredient names stay in memory between the passes.
+                related = index_stream(
+                    store, finalize_stream(store, args.id_prefix, args.prompt_tokens), args.chunk_size
+                )
+                names = store.ingredient_names()
+                ids = {name: ingredient_id for ingredient_id, name in enumerate(names)}
+                finalized = zip(finalize_stream(store, args.id_prefix, args.prompt_tokens), store.iter_links())
+                products = (
+                    set_related(
+                        set_ingredient_ids(product, product_names, ids),
+                        related.lists(ordinal, related_features(product)),
+                    )
+                    for ordinal, (product, (_, product_names)) in enumerate(finalized)
+                )
+                count = write_catalog(products, args.output, args.format, args.serializer, args.compact)
+                write_ingredient_index_stream(store, names, args.output, args.serializer)
+            finally:
+                store.close()
+        bump_generation(args.output)
+        print(f"Wrote {count} products to {args.output}")
+        return [args.output, ingredient_index_path_for(args.output)]
+
+    # Products reused from a --derivatives build carry its image edits, so the flag is part of the fingerprint.
+    fingerprint = build_fingerprint(image_index, ["derivatives"] if args.derivatives else [])
+    previous = None if args.full or args.format != "json" else load_previous_build(args.output, fingerprint)
+    groups = group_rows(read_rows(args.csv, args.workers))
+    if args.dedupe:
+        groups, dedupe_stats = dedupe_groups(groups, dedupe_log_path_for(args.output))
+        print(f"Dedupe: {describe_dedupe(dedupe_stats)}; decisions in {dedupe_log_path_for(args.output)}")
+    products_by_key, row_hashes, key_hashes, stats = build_incremental(
+        groups, image_index, previous or {}, args.workers
+    )
+    finalized = finalize_products(products_by_key, args.id_prefix, args.prompt_tokens)
+    ingredient_index = link_ingredients([product for _, product in finalized])
+    link_related([product for _, product in finalized])
+    if args.derivatives:
+        image_stats = verify_products([product for _, product in finalized], derivatives_dir_for(args.output))
+        print(
+            f"Checked {image_stats['images']} images ({image_stats['cached']} cached, {image_stats['broken']} broken); "
+            f"derivatives: {', '.join(image_stats['formats']) or 'none, Pillow is not installed'}"
+        )
+    count = write_catalog(
+        (product for _, product in finalized), args.output, args.format, args.serializer, args.compact
+    )
+    if args.format == "json":
+        write_manifest(args.output, fingerprint, finalized, row_hashes, key_hashes)
+    search_index = build_search_index([product for _, product in finalized])
+    write_search_index(search_index, args.output, args.serializer)
+    write_ingredient_index(ingredient_index, args.output, args.serializer)
+    if args.format == "json":
+        write_shards([product for _, product in finalized], shards_dir_for(args.output))
+    outputs = [args.output, search_index_path_for(args.output), ingredient_index_path_for(args.output)]
+    if args.columnar:
+        write_columnar([product for _, product in finalized], columnar_path_for(args.output))
+        outputs.append(columnar_path_for(args.output))
+    bump_generation(args.output)
+
+    if previous is None:
+        print(f"Wrote {count} products to {args.output}")
+    else:
+        print(
+            f"Wrote {count} products to {args.output} "
+            f"({stats['rebuilt']} rebuilt, {stats['reused']} reused, {stats['removed']} removed)"
+        )
+
+    if args.verify:
+        # The reference rebuild derives every field afresh, which also checks the derivation cache.
+        set_derivation_cache(None)
+        rebuilt = build_groups(groups, image_index, args.workers)
+        full = finalize_products(rebuilt, args.id_prefix, args.prompt_tokens)
+        link_ingredients([product for _, product in full])
+        link_related([product for _, product in full])
+        if args.derivatives:
+            verify_products([product for _, product in full], derivatives_dir_for(args.output))
+        if json.dumps(full) != json.dumps(finalized):
+            raise SystemExit("Verification failed: incremental output differs from a full rebuild")
+        products = [product for _, product in finalized]
+        if related_products(products) != related_products_linear(products):
+            raise SystemExit("Verification failed: related lists differ from an all-pairs scan")
+        print("Verified: output matches a full rebuild and related lists match an all-pairs scan")
+    return outputs
 
 
 if __name__ == "__main__":
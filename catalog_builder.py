@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Build one catalog per brand from a config of sources.
+
+``catalog-sources.json`` lists the brands. Each source names a registered
+type (``csv`` or ``json``), its files, a ``columns`` map (catalog field ->
+field in the feed) and optional ``taxonomy`` maps, so a new brand is a
+config entry rather than a copy of the adapter:
+
+    python3 catalog_builder.py
+    python3 catalog_builder.py --brand the-north-face --jobs 2
+
+Brands build concurrently, one process each, so one brand's taxonomy never
+leaks into another's and a large feed does not hold up the rest. Each brand
+is written to ``<output_dir>/<brand>/catalog.json`` with its sidecar files.
+``<output_dir>/manifest.json`` merges the per-brand results (product count,
+file sizes and hashes) and is rewritten as each brand finishes; entries for
+brands outside ``--brand`` are kept from the previous run.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import catalog_adapter
+
+ROOT = Path(__file__).resolve().parent
+CONFIG_PATH = ROOT / "catalog-sources.json"
+BUILD_MANIFEST_VERSION = 1
+CATALOG_NAME = "catalog.json"
+JSON_TEXT_FIELDS = ["name", "category", "product_type", "description", "features", "tags"]
+
+SOURCE_TYPES = {}
+
+
+def register_source(kind: str):
+    def register(build):
+        SOURCE_TYPES[kind] = build
+        return build
+
+    return register
+
+
+@register_source("csv")
+def build_csv_source(source: dict, output_path: Path) -> tuple:
+    """A feed with the Shiseido CSV layout, run through the full adapter build.
+
+    ``columns`` maps the adapter's column names to the feed's headers and
+    ``taxonomy`` replaces any of the adapter's keyword maps (see
+    ``catalog_adapter.TAXONOMY_GLOBALS``).
+    """
+    catalog_adapter.set_column_map(source.get("columns", {}))
+    catalog_adapter.set_taxonomy(source.get("taxonomy", {}))
+    argv = ["--csv", str(source["csv"]), "--output", str(output_path)]
+    argv += ["--id-prefix", source.get("id_prefix", f"{source['brand']}-")]
+    if "images" in source:
+        argv += ["--images", str(source["images"])]
+    argv += [str(arg) for arg in source.get("args", [])]
+    outputs = catalog_adapter.main(argv)
+    return len(json.loads(output_path.read_text(encoding="utf-8"))["products"]), outputs
+
+
+def tag_fields(product: dict, matcher: catalog_adapter.KeywordMatcher, text_fields: list) -> dict:
+    """Fill fields the feed left empty from keyword matches over ``text_fields``."""
+    values = []
+    for field in text_fields:
+        value = product.get(field)
+        values.extend(value if isinstance(value, list) else [value])
+    tags = matcher.tag(" ".join(str(value) for value in values if value not in (None, "")))
+    for field, labels in tags.items():
+        if labels and not product.get(field):
+            product[field] = labels
+    return product
+
+
+@register_source("json")
+def build_json_source(source: dict, output_path: Path) -> tuple:
+    """A JSON feed of products that already resemble catalog entries.
+
+    Fields are renamed through ``columns``; ``taxonomy`` maps a catalog field
+    to ``[label, [keywords]]`` entries that fill the field when the feed
+    leaves it empty, matched over ``text_fields``. ``id_prefix`` namespaces the feed's ids, and
+    ``related: true`` adds the storefront's similar/pairing lists.
+    """
+    payload = json.loads(Path(source["path"]).read_text(encoding="utf-8"))
+    feed = payload.get(source.get("products_key", "products"), []) if isinstance(payload, dict) else payload
+    renames = {field: column for column, field in source.get("columns", {}).items()}
+    taxonomy = {field: entries for field, entries in source.get("taxonomy", {}).items() if entries}
+    matcher = catalog_adapter.KeywordMatcher(taxonomy) if taxonomy else None
+    text_fields = source.get("text_fields", JSON_TEXT_FIELDS)
+    id_prefix = source.get("id_prefix", "")
+
+    products = []
+    for ordinal, item in enumerate(feed):
+        product = {renames.get(field, field): value for field, value in item.items()}
+        product["id"] = f"{id_prefix}{product.get('id', ordinal + 1)}"
+        if matcher:
+            tag_fields(product, matcher, text_fields)
+        products.append(catalog_adapter.compact(product))
+    if source.get("related"):
+        catalog_adapter.link_related(products)
+
+    count = catalog_adapter.write_catalog(products, output_path)
+    search_index_path = catalog_adapter.search_index_path_for(output_path)
+    search_index_path.write_text(
+        json.dumps(catalog_adapter.build_search_index(products), separators=(",", ":")), encoding="utf-8"
+    )
+    return count, [output_path, search_index_path]
+
+
+def load_config(config_path: Path) -> dict:
+    """Read the config and resolve each source's file paths against the config's directory."""
+    config = json.loads(config_path.read_text(encoding="utf-8"))
+    base = config_path.resolve().parent
+    config["output_dir"] = base / config.get("output_dir", "catalogs")
+    brands = set()
+    for source in config["sources"]:
+        brand = source.get("brand", "")
+        if not brand or "/" in brand or brand in brands:
+            raise ValueError(f"Each source needs a unique brand name without '/': {brand!r}")
+        if source.get("type") not in SOURCE_TYPES:
+            known = ", ".join(SOURCE_TYPES)
+            raise ValueError(f"Unknown source type {source.get('type')!r} for {brand}; known: {known}")
+        brands.add(brand)
+        for key in ("csv", "images", "path"):
+            if key in source:
+                source[key] = str(base / source[key])
+    return config
+
+
+def build_brand(source: dict, output_dir: Path) -> dict:
+    """Build one brand's shard; runs in its own process. Returns the manifest entry plus its build time."""
+    brand_dir = output_dir / source["brand"]
+    brand_dir.mkdir(parents=True, exist_ok=True)
+    output_path = brand_dir / CATALOG_NAME
+    started = time.perf_counter()
+    count, outputs = SOURCE_TYPES[source["type"]](source, output_path)
+    seconds = time.perf_counter() - started
+    # Only what the source reports writing: caches and build state beside it change on every run.
+    files = {
+        path.name: {"bytes": path.stat().st_size, "sha1": catalog_adapter.file_digest(path)}
+        for path in sorted(outputs)
+    }
+    return {
+        "type": source["type"],
+        "catalog": f"{source['brand']}/{CATALOG_NAME}",
+        "products": count,
+        "files": files,
+        "seconds": seconds,
+    }
+
+
+def manifest_path_for(output_dir: Path) -> Path:
+    return output_dir / "manifest.json"
+
+
+def load_manifest(output_dir: Path) -> dict:
+    try:
+        manifest = json.loads(manifest_path_for(output_dir).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return manifest.get("brands", {}) if manifest.get("version") == BUILD_MANIFEST_VERSION else {}
+
+
+def write_manifest(output_dir: Path, brands: dict):
+    """Write the merged manifest through a temp file so readers never see a partial one."""
+    manifest = {
+        "version": BUILD_MANIFEST_VERSION,
+        "brands": {brand: brands[brand] for brand in sorted(brands)},
+        "products": sum(entry.get("products", 0) for entry in brands.values()),
+    }
+    handle, tmp_name = tempfile.mkstemp(prefix=".manifest.", dir=output_dir)
+    try:
+        with os.fdopen(handle, "w", encoding="utf-8") as target:
+            json.dump(manifest, target, indent=2)
+            target.write("\n")
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, manifest_path_for(output_dir))
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def build_all(config: dict, brands=None, jobs: int = 1) -> dict:
+    """Build the selected brands concurrently; returns the merged manifest entries."""
+    sources = [source for source in config["sources"] if not brands or source["brand"] in brands]
+    missing = set(brands or []) - {source["brand"] for source in sources}
+    if missing:
+        raise SystemExit(f"Unknown brands: {', '.join(sorted(missing))}")
+    output_dir = config["output_dir"]
+    output_dir.mkdir(parents=True, exist_ok=True)
+    entries = load_manifest(output_dir)
+    # One process per brand: taxonomy and column maps are module state in catalog_adapter.
+    with ProcessPoolExecutor(max_workers=max(1, min(jobs, len(sources))), max_tasks_per_child=1) as pool:
+        futures = {pool.submit(build_brand, source, output_dir): source["brand"] for source in sources}
+        for future in as_completed(futures):
+            brand = futures[future]
+            try:
+                entry = future.result()
+            except Exception as error:
+                entries[brand] = {"error": f"{type(error).__name__}: {error}"}
+                print(f"{brand}: failed: {entries[brand]['error']}")
+            else:
+                # Timings stay out of the manifest so it only changes when the output does.
+                seconds = entry.pop("seconds")
+                entries[brand] = entry
+                print(f"{brand}: {entry['products']} products in {seconds:.2f}s")
+            write_manifest(output_dir, entries)
+    return entries
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build per-brand catalogs from a source config.")
+    parser.add_argument("--config", type=Path, default=CONFIG_PATH, help="brand source config")
+    parser.add_argument("--brand", action="append", help="only build this brand (repeatable)")
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count() or 1, help="brands built at once (default: CPU count)"
+    )
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config)
+    entries = build_all(config, args.brand, args.jobs)
+    print(f"Wrote {manifest_path_for(config['output_dir'])}")
+    if any("error" in entries[brand] for brand in args.brand or entries):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
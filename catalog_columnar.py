@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Binary columnar catalog format with a memory-mapped, lazy reader.
+
+Layout (all integers little-endian)::
+
+    magic "SHCC" | u16 version | u16 reserved | u32 product count | u32 directory length
+    directory: UTF-8 JSON list of column descriptors, in product key order
+    column sections, each starting on an 8-byte boundary; descriptor offsets
+    are relative to the first section, which follows the directory
+
+Column kinds:
+
+``f64``   fixed-width float64 array, NaN for a missing value
+``i64``   fixed-width int64 array, ``I64_NULL`` for a missing value
+``str``   string heap: u32 offsets (count + 1) followed by UTF-8 bytes
+``list``  dictionary-encoded string lists: a string heap of distinct values,
+          u32 per-product offsets (count + 1) and a u32 value-id array
+``json``  string heap of JSON text, for structured fields such as variants
+
+Missing and empty values are the same thing here, because catalog products
+are already ``compact()``-ed. Readers only touch the bytes of the columns and
+rows they ask for.
+"""
+import argparse
+import json
+import math
+import mmap
+import resource
+import struct
+import subprocess
+import sys
+import time
+from array import array
+from pathlib import Path
+
+MAGIC = b"SHCC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+I64_NULL = -(2**63)
+ROOT = Path(__file__).resolve().parent
+DEFAULT_JSON_PATH = ROOT / "shiseido-catalog.json"
+
+
+def columnar_path_for(output_path: Path) -> Path:
+    return output_path.with_suffix(".cols")
+
+
+def _align(offset: int) -> int:
+    return offset + (-offset % 8)
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _column_kind(values: list) -> str:
+    present = [value for value in values if value is not None]
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        return "i64"
+    if all(isinstance(value, float) for value in present):
+        return "f64"
+    if all(isinstance(value, str) for value in present):
+        return "str"
+    if all(isinstance(value, list) and all(isinstance(item, str) for item in value) for value in present):
+        return "list"
+    return "json"
+
+
+def _string_heap(strings: list) -> bytes:
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = array("I", [0])
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    return _little_endian(offsets) + b"".join(encoded)
+
+
+def _encode_column(kind: str, values: list) -> tuple:
+    """Return ``(payload, extra descriptor fields)`` for one column."""
+    if kind == "f64":
+        data = array("d", [math.nan if value is None else value for value in values])
+        return _little_endian(data), {}
+    if kind == "i64":
+        data = array("q", [I64_NULL if value is None else value for value in values])
+        return _little_endian(data), {}
+    if kind == "str":
+        return _string_heap([value or "" for value in values]), {}
+    if kind == "json":
+        return _string_heap(["" if value is None else json.dumps(value) for value in values]), {}
+
+    dictionary = {}
+    offsets = array("I", [0])
+    ids = array("I")
+    for value in values:
+        for item in value or []:
+            ids.append(dictionary.setdefault(item, len(dictionary)))
+        offsets.append(len(ids))
+    heap = _string_heap(list(dictionary))
+    index = _little_endian(offsets) + _little_endian(ids)
+    return heap + index, {"dictionary_size": len(dictionary), "heap_length": len(heap)}
+
+
+def write_columnar(products: list, path: Path) -> int:
+    """Write ``products`` (compacted catalog records) column by column; returns bytes written."""
+    # Merge each product's key order so absent fields don't reorder the rest.
+    names = []
+    for product in products:
+        position = 0
+        for key in product:
+            if key not in names:
+                names.insert(position, key)
+            position = names.index(key) + 1
+
+    directory = []
+    payloads = []
+    for name in names:
+        values = [product.get(name) for product in products]
+        kind = _column_kind(values)
+        payload, extra = _encode_column(kind, values)
+        directory.append({"name": name, "kind": kind, "length": len(payload), **extra})
+        payloads.append(payload)
+
+    offset = 0
+    for column, payload in zip(directory, payloads):
+        offset = _align(offset)
+        column["offset"] = offset
+        offset += len(payload)
+    directory_bytes = json.dumps(directory, separators=(",", ":")).encode("utf-8")
+    data_start = _align(HEADER.size + len(directory_bytes))
+
+    with open(path, "wb") as handle:
+        handle.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(products), len(directory_bytes)))
+        handle.write(directory_bytes)
+        for column, payload in zip(directory, payloads):
+            handle.write(b"\0" * (data_start + column["offset"] - handle.tell()))
+            handle.write(payload)
+        return handle.tell()
+
+
+class ColumnarCatalog:
+    """Memory-mapped reader; columns and products are decoded on demand."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, directory_length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a columnar catalog")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar catalog version {version} in {self.path}")
+        self.count = count
+        directory = json.loads(self._map[HEADER.size : HEADER.size + directory_length])
+        data_start = _align(HEADER.size + directory_length)
+        for column in directory:
+            column["offset"] += data_start
+        self.columns = {column["name"]: column for column in directory}
+        self._dictionaries = {}
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _u32(self, base: int, index: int) -> int:
+        return struct.unpack_from("<I", self._map, base + 4 * index)[0]
+
+    def _heap_string(self, base: int, count: int, index: int) -> str:
+        start = self._u32(base, index)
+        end = self._u32(base, index + 1)
+        data_start = base + 4 * (count + 1)
+        return self._map[data_start + start : data_start + end].decode("utf-8")
+
+    def _dictionary(self, column: dict) -> list:
+        name = column["name"]
+        if name not in self._dictionaries:
+            size = column["dictionary_size"]
+            self._dictionaries[name] = [
+                self._heap_string(column["offset"], size, index) for index in range(size)
+            ]
+        return self._dictionaries[name]
+
+    def value(self, name: str, index: int):
+        """One field of one product, or None when the product doesn't have it."""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        column = self.columns[name]
+        kind = column["kind"]
+        base = column["offset"]
+        if kind == "f64":
+            value = struct.unpack_from("<d", self._map, base + 8 * index)[0]
+            return None if math.isnan(value) else value
+        if kind == "i64":
+            value = struct.unpack_from("<q", self._map, base + 8 * index)[0]
+            return None if value == I64_NULL else value
+        if kind in ("str", "json"):
+            text = self._heap_string(base, self.count, index)
+            if not text:
+                return None
+            return json.loads(text) if kind == "json" else text
+        offsets_base = base + column["heap_length"]
+        ids_base = offsets_base + 4 * (self.count + 1)
+        start = self._u32(offsets_base, index)
+        end = self._u32(offsets_base, index + 1)
+        if start == end:
+            return None
+        dictionary = self._dictionary(column)
+        ids = struct.unpack_from(f"<{end - start}I", self._map, ids_base + 4 * start)
+        return [dictionary[value_id] for value_id in ids]
+
+    def column(self, name: str) -> list:
+        column = self.columns[name]
+        if column["kind"] in ("f64", "i64"):
+            values = array("d" if column["kind"] == "f64" else "q")
+            values.frombytes(self._map[column["offset"] : column["offset"] + 8 * self.count])
+            if sys.byteorder != "little":
+                values.byteswap()
+            if column["kind"] == "f64":
+                return [None if math.isnan(value) else value for value in values]
+            return [None if value == I64_NULL else value for value in values]
+        return [self.value(name, index) for index in range(self.count)]
+
+    def product(self, index: int) -> dict:
+        product = {}
+        for name in self.columns:
+            value = self.value(name, index)
+            if value is not None:
+                product[name] = value
+        return product
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.product(index)
+
+
+def check_round_trip(json_path: Path, columnar_path: Path) -> bool:
+    products = json.loads(json_path.read_text(encoding="utf-8"))["products"]
+    with ColumnarCatalog(columnar_path) as catalog:
+        restored = list(catalog)
+    same = json.dumps(restored) == json.dumps(products)
+    print(f"Round trip of {len(products)} products: {'identical' if same else 'DIFFERENT'}")
+    return same
+
+
+def _probe(mode: str, path: str):
+    """Run in a fresh interpreter by ``compare_load``: load, touch one product, report."""
+    started = time.perf_counter()
+    if mode == "json":
+        products = json.loads(Path(path).read_text(encoding="utf-8"))["products"]
+        name = products[len(products) // 2].get("name")
+    else:
+        catalog = ColumnarCatalog(Path(path))
+        name = catalog.value("name", len(catalog) // 2)
+    elapsed = time.perf_counter() - started
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"seconds": elapsed, "max_rss_kb": rss_kb, "name": name}))
+
+
+def compare_load(json_path: Path, columnar_path: Path):
+    print(f"{'format':<9} {'bytes':>10} {'load ms':>9} {'max RSS KB':>11}")
+    for mode, path in (("json", json_path), ("columnar", columnar_path)):
+        output = subprocess.run(
+            [sys.executable, __file__, "_probe", mode, str(path)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output)
+        size = path.stat().st_size
+        print(f"{mode:<9} {size:>10} {result['seconds'] * 1000:>9.2f} {result['max_rss_kb']:>11}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert, verify and benchmark columnar catalogs.")
+    parser.add_argument("command", choices=("write", "check", "compare", "_probe"))
+    parser.add_argument("paths", nargs="*", help="[json path] [columnar path]")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "_probe":
+        _probe(*args.paths)
+        return
+    json_path = Path(args.paths[0]) if args.paths else DEFAULT_JSON_PATH
+    columnar_path = Path(args.paths[1]) if len(args.paths) > 1 else columnar_path_for(json_path)
+    if args.command == "write":
+        products = json.loads(json_path.read_text(encoding="utf-8"))["products"]
+        size = write_columnar(products, columnar_path)
+        print(f"Wrote {len(products)} products ({size} bytes) to {columnar_path}")
+    elif args.command == "check":
+        raise SystemExit(0 if check_round_trip(json_path, columnar_path) else 1)
+    else:
+        compare_load(json_path, columnar_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""Find near-duplicate product groups before they are merged into products.
+
+The same product can be listed twice: once under a URL with tracking
+parameters, or as a new listing with the size in the title. ``find_duplicates``
+folds these together in two passes:
+
+1. Keys whose ``canonical_url`` matches merge outright. Canonicalisation
+   lowercases the scheme and host, drops the fragment, a trailing slash and
+   tracking parameters (``utm_*``, ``cgid``, ``gclid``, ...).
+2. The remaining keys are blocked by the numbers left in their normalised
+   name (sizes are stripped first), so "SPF 30" never meets "SPF 50". Within
+   a block, MinHash signatures over word bigrams of the name and the start of
+   the description are banded for locality-sensitive hashing. Only pairs that
+   share a band bucket are compared, and a pair merges when both its name
+   trigram and its text bigram Jaccard similarity clear the thresholds.
+
+Each decision (URL merge, merge, kept pair, skipped bucket) is written as a
+JSON line to the log, so a merge can be traced back and audited:
+
+    python3 catalog_adapter.py --dedupe        # decisions in <output>.dedupe.jsonl
+    python3 catalog_dedupe.py check            # precision/recall on the feed, shared SKUs as truth
+    python3 catalog_dedupe.py compare --rows 1000000
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import time
+import zlib
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+TRACKING_PARAMS = {"cgid", "gclid", "fbclid", "msclkid", "dclid", "ref", "srsltid", "_ga"}
+TRACKING_PREFIXES = ("utm_",)
+SIZE_PATTERN = re.compile(r"\b\d+(?:\.\d+)?\s*(?:fl\.?\s*oz|ml|oz|mg|g|l|ct|pcs)\b")
+WORD_PATTERN = re.compile(r"[^\W_]+")
+DESCRIPTION_WORDS = 30
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+MINHASH_PRIME = (1 << 61) - 1
+MINHASH_SEED = 0
+MAX_BUCKET = 200
+NAME_SIMILARITY = 0.9
+TEXT_SIMILARITY = 0.8
+COMPARE_DUPLICATE_RATE = 0.01
+COMPARE_SIZE_SUFFIXES = ["50mL", "1.7 oz", "30 ml", "75mL"]
+
+
+def dedupe_log_path_for(output_path: Path) -> Path:
+    return output_path.with_name(f"{output_path.stem}.dedupe.jsonl")
+
+
+def canonical_url(value: str) -> str:
+    """``value`` without tracking parameters, fragment or trailing slash; non-URLs come back unchanged."""
+    parts = urlsplit(value.strip())
+    if not parts.scheme or not parts.netloc:
+        return value
+    query = [
+        (name, item)
+        for name, item in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in TRACKING_PARAMS and not name.lower().startswith(TRACKING_PREFIXES)
+    ]
+    scheme = "https" if parts.scheme.lower() == "http" else parts.scheme.lower()
+    return urlunsplit((scheme, parts.netloc.lower(), parts.path.rstrip("/") or "/", urlencode(sorted(query)), ""))
+
+
+def name_words(name: str) -> list:
+    """Casefolded words of a product name, with sizes ("50mL", "1.7 oz") removed."""
+    return WORD_PATTERN.findall(SIZE_PATTERN.sub(" ", (name or "").casefold()))
+
+
+def shingles(words: list) -> set:
+    if len(words) < 2:
+        return set(words)
+    return {f"{first} {second}" for first, second in zip(words, words[1:])}
+
+
+def trigrams(text: str) -> set:
+    return {text[index:index + 3] for index in range(max(1, len(text) - 2))} if text else set()
+
+
+def jaccard(left: set, right: set) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def minhash_permutations(count: int, seed: int = MINHASH_SEED) -> list:
+    rng = random.Random(seed)
+    return [(rng.randrange(1, MINHASH_PRIME) | 1, rng.randrange(MINHASH_PRIME)) for _ in range(count)]
+
+
+PERMUTATIONS = minhash_permutations(MINHASH_BANDS * MINHASH_ROWS)
+
+
+def minhash(shingle_set: set) -> tuple:
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set]
+    return tuple(min((a * value + b) % MINHASH_PRIME for value in hashes) for a, b in PERMUTATIONS)
+
+
+class Entry:
+    """What the near-duplicate pass compares for one key group."""
+
+    __slots__ = ("index", "key", "name_grams", "text")
+
+    def __init__(self, index: int, key: str, name: str, description: str):
+        words = name_words(name)
+        self.index = index
+        self.key = key
+        self.name_grams = trigrams(" ".join(words))
+        self.text = shingles(words + WORD_PATTERN.findall((description or "").casefold())[:DESCRIPTION_WORDS])
+
+
+def find_duplicates(entries: list, log=None) -> tuple:
+    """Map each duplicate key to the first-seen key it folds into, plus counts for the pass.
+
+    ``entries`` holds ``(key, name, description)`` in first-appearance order.
+    ``log`` is a text file that gets one JSON line per decision.
+    """
+    write = (lambda record: log.write(json.dumps(record, ensure_ascii=False) + "\n")) if log else (lambda record: None)
+    parent = list(range(len(entries)))
+
+    def root(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    def union(left: int, right: int):
+        left, right = root(left), root(right)
+        if left != right:
+            parent[max(left, right)] = min(left, right)
+
+    stats = {"keys": len(entries), "url": 0, "signatures": 0, "candidates": 0, "similar": 0, "kept": 0, "skipped": 0}
+    first_by_url = {}
+    for index, (key, _, _) in enumerate(entries):
+        url = canonical_url(key)
+        first = first_by_url.setdefault(url, index)
+        if first != index:
+            union(first, index)
+            stats["url"] += 1
+            write({"decision": "merge", "reason": "url", "key": key, "match": entries[first][0], "canonical": url})
+
+    # Most keys are alone in their block, so shingles are only built for blocks of two or more.
+    blocks = {}
+    for index, (_, name, _) in enumerate(entries):
+        if root(index) == index:
+            blocks.setdefault(tuple(word for word in name_words(name) if word.isdigit()), []).append(index)
+
+    compared = set()
+    for indexes in blocks.values():
+        if len(indexes) < 2:
+            continue
+        block = [entry for entry in (Entry(index, *entries[index]) for index in indexes) if entry.text]
+        buckets = {}
+        for entry in block:
+            signature = minhash(entry.text)
+            stats["signatures"] += 1
+            for band in range(MINHASH_BANDS):
+                rows = signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+                buckets.setdefault((band, rows), []).append(entry)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            if len(members) > MAX_BUCKET:
+                stats["skipped"] += 1
+                write({"decision": "skip", "reason": "bucket", "size": len(members), "keys": [entry.key for entry in members[:5]]})
+                continue
+            for left, right in itertools.combinations(members, 2):
+                if (left.index, right.index) in compared:
+                    continue
+                compared.add((left.index, right.index))
+                stats["candidates"] += 1
+                name_similarity = jaccard(left.name_grams, right.name_grams)
+                text_similarity = jaccard(left.text, right.text)
+                same = name_similarity >= NAME_SIMILARITY and text_similarity >= TEXT_SIMILARITY
+                stats["similar" if same else "kept"] += 1
+                if same:
+                    union(left.index, right.index)
+                write({
+                    "decision": "merge" if same else "keep",
+                    "reason": "similar",
+                    "key": right.key,
+                    "match": left.key,
+                    "name_similarity": round(name_similarity, 3),
+                    "text_similarity": round(text_similarity, 3),
+                })
+
+    merged_into = {}
+    for index, (key, _, _) in enumerate(entries):
+        first = root(index)
+        if first != index:
+            merged_into[key] = entries[first][0]
+    stats["merged"] = len(merged_into)
+    return merged_into, stats
+
+
+def describe(stats: dict) -> str:
+    return (
+        f"{stats['merged']} of {stats['keys']} keys merged ({stats['url']} by URL, {stats['similar']} similar pairs "
+        f"of {stats['candidates']} LSH candidates from {stats['signatures']} signatures, "
+        f"{stats['skipped']} oversized buckets skipped)"
+    )
+
+
+def merged_pairs(merged_into: dict, keys) -> set:
+    """Every unordered key pair that ends up in the same product."""
+    clusters = {}
+    for key in keys:
+        clusters.setdefault(merged_into.get(key, key), []).append(key)
+    return {
+        pair
+        for members in clusters.values()
+        for pair in itertools.combinations(sorted(members), 2)
+    }
+
+
+def score(found: set, expected: set) -> tuple:
+    precision = len(found & expected) / len(found) if found else 1.0
+    recall = len(found & expected) / len(expected) if expected else 1.0
+    return precision, recall
+
+
+def check() -> int:
+    """Dedupe the real feed; keys that share a variant SKU are the true duplicates. Returns false merges."""
+    # Imported here: catalog_adapter imports this module.
+    import catalog_adapter
+
+    groups = catalog_adapter.group_rows(catalog_adapter.read_rows(catalog_adapter.CSV_PATH))
+    merged_into, stats = find_duplicates(catalog_adapter.dedupe_entries(groups))
+    skus = {}
+    for key, rows in groups.items():
+        for row in rows:
+            for variant in catalog_adapter.parse_variants(row.get("variants")):
+                if variant.get("variant_id"):
+                    skus.setdefault(variant["variant_id"], set()).add(key)
+    expected = {pair for keys in skus.values() for pair in itertools.combinations(sorted(keys), 2)}
+    found = merged_pairs(merged_into, groups)
+    for left, right in sorted(found):
+        print(f"{'ok   ' if (left, right) in expected else 'FALSE'} {left}\n      {right}")
+    for left, right in sorted(expected - found):
+        print(f"MISSED {left}\n       {right}")
+    precision, recall = score(found, expected)
+    print(describe(stats))
+    print(f"{len(found)} merged pairs, {len(expected)} sharing a SKU: precision {precision:.3f}, recall {recall:.3f}")
+    return len(found - expected)
+
+
+def synthetic_entries(rows: int, seed: int) -> tuple:
+    """Key entries of a synthetic feed, plus re-listed near duplicates of a sample of its products.
+
+    A re-listing gets a new URL, a size suffix and reflowed, recased title
+    whitespace. Returns the entries and each entry's product number.
+    """
+    # Imported here: catalog_adapter imports this module.
+    import catalog_adapter
+    from benchmarks.synthetic import iter_synthetic_rows
+
+    first = {}
+    for row in iter_synthetic_rows(rows, seed):
+        key = catalog_adapter.row_key(row)
+        name, description = first.get(key, (None, ""))
+        if name is None:
+            name = catalog_adapter.normalize_inline(row.get("product_title") or row.get("Name"))
+        first[key] = (name, description or catalog_adapter.normalize_inline(row.get("Description")))
+    rng = random.Random(seed)
+    entries = []
+    products = []
+    relisted = []
+    for key, (name, description) in first.items():
+        product = int(re.search(r"synthetic-product-(\d+)", key).group(1))
+        entries.append((key, name, description))
+        products.append(product)
+        if rng.random() < COMPARE_DUPLICATE_RATE:
+            title = f"{name.upper() if rng.random() < 0.5 else name}  {rng.choice(COMPARE_SIZE_SUFFIXES)}"
+            relisted.append((f"https://www.shiseido.com/us/en/synthetic-product-{product:07d}-relisted.html", title.replace(" ", "  ", 1), description))
+    entries.extend(relisted)
+    products.extend(int(re.search(r"synthetic-product-(\d+)", key).group(1)) for key, _, _ in relisted)
+    return entries, products
+
+
+def compare(rows: int, seed: int = 0):
+    """Time the pass on a synthetic feed and score it against the known re-listings and tracking URLs."""
+    started = time.perf_counter()
+    entries, products = synthetic_entries(rows, seed)
+    prepared = time.perf_counter() - started
+    started = time.perf_counter()
+    merged_into, stats = find_duplicates(entries)
+    elapsed = time.perf_counter() - started
+    product_of = {key: product for (key, _, _), product in zip(entries, products)}
+    found = merged_pairs(merged_into, product_of)
+    clusters = {}
+    for key, product in product_of.items():
+        clusters.setdefault(product, []).append(key)
+    expected = {pair for keys in clusters.values() for pair in itertools.combinations(sorted(keys), 2)}
+    precision, recall = score(found, expected)
+    print(f"{rows} rows, {len(entries)} keys ({prepared:.1f}s to read the feed)")
+    print(describe(stats))
+    print(f"dedupe: {elapsed:.2f}s, {len(entries) / elapsed:.0f} keys/sec")
+    print(f"{len(found)} merged pairs, {len(expected)} true: precision {precision:.3f}, recall {recall:.3f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check or benchmark near-duplicate product detection.")
+    parser.add_argument("command", choices=("check", "compare"))
+    parser.add_argument("--rows", type=int, default=1_000_000, help="synthetic feed rows for compare")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "check":
+        raise SystemExit(1 if check() else 0)
+    compare(args.rows, args.seed)
+
+
+if __name__ == "__main__":
+    main()
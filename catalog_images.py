@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Verify catalog images and write resized derivatives, offline.
+
+``verify_products`` checks every local ``image_gallery`` entry on a bounded
+thread pool. Each file's header must parse and its trailer must be
+present; with Pillow installed the whole image is also decoded. Broken
+entries are dropped from the gallery. Every surviving image gets an
+``image_meta`` record (format, width, height, bytes) and, with Pillow,
+WebP/AVIF derivatives sized for the PLP card and PDP carousel.
+
+Results are cached by a hash of the source file's content, and derivative
+files are named by that hash, so unchanged images are skipped on the next
+run. Remote URLs (from the feed's ``URL`` column) are left alone; nothing
+is downloaded.
+
+    python3 catalog_adapter.py --derivatives
+    python3 catalog_images.py            # originals vs derivatives, from the last run
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image, features
+except ImportError:  # verification still works; derivatives need Pillow
+    Image = None
+
+IMAGE_CACHE_VERSION = 1
+ROOT = Path(__file__).resolve().parent
+DEFAULT_JSON_PATH = ROOT / "shiseido-catalog.json"
+# Twice the CSS box of `.card-image img` (288px) and `.pdp-carousel-frame img` (392px).
+DERIVATIVE_SIZES = {"plp": 576, "pdp": 784}
+DERIVATIVE_FORMATS = ["webp", "avif"]
+DERIVATIVE_QUALITY = 80
+IMAGE_WORKERS = 8
+REMOTE_PREFIXES = ("http://", "https://", "//", "data:")
+
+
+def derivatives_dir_for(output_path: Path) -> Path:
+    return output_path.with_suffix(".images")
+
+
+def _jpeg_size(data: bytes):
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        (length,) = struct.unpack(">H", data[offset + 2 : offset + 4])
+        # SOF0..SOF15, except DHT (C4), JPG (C8) and DAC (CC).
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[offset + 5 : offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def probe_image(data: bytes):
+    """``(format, width, height)`` from the header, or None if the bytes are not a complete image."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        complete = data.rstrip(b"\0").endswith(b"IEND\xaeB`\x82")
+        return ("png", width, height) if complete else None
+    if data.startswith(b"\xff\xd8"):
+        size = _jpeg_size(data)
+        # Some encoders pad after EOI, so look for it near the end rather than at it.
+        complete = b"\xff\xd9" in data[-1024:]
+        return ("jpeg", *size) if size and complete else None
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        width, height = struct.unpack("<HH", data[6:10])
+        return ("gif", width, height) if data.rstrip(b"\0").endswith(b";") else None
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        (riff_size,) = struct.unpack("<I", data[4:8])
+        if len(data) < riff_size + 8:
+            return None
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return "webp", width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            (bits,) = struct.unpack("<I", data[21:25])
+            return "webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            width = int.from_bytes(data[24:27], "little") + 1
+            height = int.from_bytes(data[27:30], "little") + 1
+            return "webp", width, height
+    return None
+
+
+def available_formats() -> list:
+    """Derivative formats this Pillow build can write (none without Pillow)."""
+    if Image is None:
+        return []
+    return [fmt for fmt in DERIVATIVE_FORMATS if features.check(fmt)]
+
+
+def settings_key() -> str:
+    """Results depend on the sizes and formats, so a Pillow upgrade that adds AVIF redoes them."""
+    settings = json.dumps([DERIVATIVE_SIZES, available_formats(), DERIVATIVE_QUALITY])
+    return hashlib.sha1(settings.encode("utf-8")).hexdigest()[:12]
+
+
+def write_derivatives(source: Path, digest: str, out_dir: Path, formats: list) -> list:
+    """Decode ``source`` fully and write one file per size and format; raises if it doesn't decode."""
+    with Image.open(source) as image:
+        image.load()
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        derivatives = []
+        for size, bound in DERIVATIVE_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((bound, bound), Image.LANCZOS)
+            for fmt in formats:
+                target = out_dir / f"{digest[:16]}-{size}.{fmt}"
+                if not target.exists():
+                    handle, tmp_name = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=out_dir)
+                    try:
+                        with os.fdopen(handle, "wb") as tmp:
+                            resized.save(tmp, fmt.upper(), quality=DERIVATIVE_QUALITY)
+                        os.chmod(tmp_name, 0o644)
+                        os.replace(tmp_name, target)
+                    except BaseException:
+                        os.unlink(tmp_name)
+                        raise
+                derivatives.append({
+                    "size": size,
+                    "format": fmt,
+                    "src": target.relative_to(ROOT).as_posix() if target.is_relative_to(ROOT) else str(target),
+                    "width": resized.width,
+                    "height": resized.height,
+                    "bytes": target.stat().st_size,
+                })
+    return derivatives
+
+
+class ImageCache:
+    """``path -> (size, mtime_ns, sha1)`` so unchanged files aren't rehashed, and ``sha1 -> record``."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.settings = settings_key()
+        self.hashes = {}
+        self.records = {}
+        try:
+            cache = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if cache.get("version") == IMAGE_CACHE_VERSION and cache.get("settings") == self.settings:
+            self.hashes = cache.get("hashes", {})
+            self.records = cache.get("records", {})
+
+    def digest(self, path: Path, stat: os.stat_result) -> str:
+        key = str(path)
+        cached = self.hashes.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha1(path.read_bytes()).hexdigest()
+        self.hashes[key] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def save(self):
+        payload = {
+            "version": IMAGE_CACHE_VERSION,
+            "settings": self.settings,
+            "hashes": self.hashes,
+            "records": self.records,
+        }
+        self.path.write_text(json.dumps(payload), encoding="utf-8")
+
+
+def image_digest(path: Path, cache: ImageCache):
+    """Content hash of ``path``, or None if it can't be read."""
+    try:
+        return cache.digest(path, path.stat())
+    except OSError:
+        return None
+
+
+def check_image(path: Path, digest: str, out_dir: Path, cache: ImageCache, formats: list):
+    """``(record, cache_hit)`` for one distinct image; ``record`` is {} when the file is broken."""
+    record = cache.records.get(digest)
+    derived = record.get("derivatives", []) if record else []
+    if record is not None and all((ROOT / derivative["src"]).exists() for derivative in derived):
+        return record, True
+    data = path.read_bytes()
+    probe = probe_image(data)
+    record = {}
+    if probe:
+        fmt, width, height = probe
+        record = {"format": fmt, "width": width, "height": height, "bytes": len(data), "sha1": digest}
+        if formats:
+            try:
+                record["derivatives"] = write_derivatives(path, digest, out_dir, formats)
+            except (OSError, ValueError, Image.DecompressionBombError):
+                record = {}
+    # Broken files are cached as {} so they are not re-decoded until they change.
+    cache.records[digest] = record
+    return record, False
+
+
+def verify_products(products: list, out_dir: Path, workers: int = IMAGE_WORKERS) -> dict:
+    """Drop broken gallery images and attach ``image_meta`` (aligned with ``image_gallery``); returns stats."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cache = ImageCache(out_dir / "cache.json")
+    formats = available_formats()
+    local = sorted({
+        src
+        for product in products
+        for src in product.get("image_gallery", [])
+        if not src.startswith(REMOTE_PREFIXES)
+    })
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = dict(zip(local, pool.map(lambda src: image_digest(ROOT / src, cache), local)))
+        # Paths with identical bytes share a digest and its derivative files, so each digest is checked once.
+        sources = {}
+        for src, digest in digests.items():
+            if digest is not None:
+                sources.setdefault(digest, src)
+        checked = dict(zip(
+            sources,
+            pool.map(lambda item: check_image(ROOT / item[1], item[0], out_dir, cache, formats), sources.items()),
+        ))
+    results = {}
+    for src, digest in digests.items():
+        record, hit = checked[digest] if digest is not None else ({}, False)
+        results[src] = ({"src": src, **record} if record else None), hit
+
+    stats = {"images": len(local), "cached": 0, "broken": 0, "formats": formats}
+    for record, hit in results.values():
+        stats["cached"] += hit
+        stats["broken"] += record is None
+    for product in products:
+        product.pop("image_meta", None)
+        gallery = [src for src in product.get("image_gallery", []) if src not in results or results[src][0]]
+        if product.get("image_url") and product["image_url"] not in gallery and product["image_url"] in results:
+            product["image_url"] = gallery[0] if gallery else None
+        product["image_gallery"] = gallery
+        meta = [results[src][0] if src in results else {"src": src} for src in gallery]
+        if any(len(entry) > 1 for entry in meta):
+            product["image_meta"] = meta
+        for field in ("image_url", "image_gallery"):
+            if not product.get(field):
+                product.pop(field, None)
+    cache.save()
+    return stats
+
+
+def derivative_report(products: list) -> dict:
+    originals = {}
+    derived = {}
+    for product in products:
+        for entry in product.get("image_meta", []):
+            if "bytes" in entry:
+                originals[entry["src"]] = entry["bytes"]
+            for derivative in entry.get("derivatives", []):
+                files = derived.setdefault((derivative["size"], derivative["format"]), {})
+                files[derivative["src"]] = derivative["bytes"]
+    return {"originals": originals, "derived": derived}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report image bytes before and after derivatives.")
+    parser.add_argument("catalog", nargs="?", type=Path, default=DEFAULT_JSON_PATH)
+    args = parser.parse_args(argv)
+    products = json.loads(args.catalog.read_text(encoding="utf-8"))["products"]
+    report = derivative_report(products)
+    originals = report["originals"]
+    if not originals:
+        raise SystemExit("No image_meta in the catalog; build it with catalog_adapter.py --derivatives")
+    total = sum(originals.values())
+    print(f"{'images':<12} {'files':>6} {'bytes':>12} {'avg bytes':>10}")
+    print(f"{'originals':<12} {len(originals):>6} {total:>12} {total // len(originals):>10}")
+    for (size, fmt), files in sorted(report["derived"].items()):
+        label = f"{size} {fmt}"
+        print(f"{label:<12} {len(files):>6} {sum(files.values()):>12} {sum(files.values()) // len(files):>10}")
+    if not report["derived"]:
+        print("No derivatives: install Pillow to generate them")
+
+
+if __name__ == "__main__":
+    main()
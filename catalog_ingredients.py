@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Ingredient lookups over the dictionary and inverted index emitted by catalog_adapter.py.
+
+A term matches every canonical ingredient name that contains it, so
+``fragrance`` finds ``FRAGRANCE(PARFUM)``. The scan covers the ingredient
+dictionary, not the products, and a product set is then a union of
+postings:
+
+    python3 catalog_ingredients.py niacinamide
+    python3 catalog_ingredients.py --free-of fragrance
+    python3 catalog_ingredients.py --check
+
+``--free-of`` only considers products that have an ingredient list; a
+product without one is unknown, not free of anything.
+"""
+import argparse
+import json
+from pathlib import Path
+
+from catalog_adapter import (
+    INGREDIENT_INDEX_VERSION,
+    OUTPUT_PATH,
+    canonical_ingredient,
+    ingredient_index_path_for,
+    product_ingredients,
+)
+
+CHECK_TERMS = ["fragrance", "niacinamide", "alcohol", "paraben", "retinol", "hyaluron", "water", "zinc oxide"]
+
+
+def load_ingredient_index(index_path: Path) -> dict:
+    index = json.loads(index_path.read_text(encoding="utf-8"))
+    if index.get("version") != INGREDIENT_INDEX_VERSION:
+        raise ValueError(f"Unsupported ingredient index version {index.get('version')!r} in {index_path}")
+    return index
+
+
+class IngredientIndex:
+    def __init__(self, index: dict):
+        self.products = index["products"]
+        self.names = index["ingredients"]
+        self.postings = [frozenset(ordinals) for ordinals in index["postings"]]
+        self.listed = frozenset().union(*self.postings)
+        self._matches = {}
+
+    def ingredient_ids(self, term: str) -> list:
+        """Ids of the ingredients whose canonical name contains ``term``."""
+        term = canonical_ingredient(term)
+        if term not in self._matches:
+            self._matches[term] = [
+                ingredient_id for ingredient_id, name in enumerate(self.names) if term and term in name
+            ]
+        return self._matches[term]
+
+    def _ids(self, ordinals) -> list:
+        return [self.products[ordinal] for ordinal in sorted(ordinals)]
+
+    def containing_ordinals(self, term: str) -> frozenset:
+        return frozenset().union(*(self.postings[ingredient_id] for ingredient_id in self.ingredient_ids(term)))
+
+    def containing(self, term: str) -> list:
+        return self._ids(self.containing_ordinals(term))
+
+    def free_of(self, term: str) -> list:
+        return self._ids(self.listed - self.containing_ordinals(term))
+
+
+def check_index(products: list, index: IngredientIndex) -> int:
+    """Compare index lookups and product ``ingredient_ids`` with a scan of the compositions; returns mismatches."""
+    if index.products != [product.get("id") for product in products]:
+        raise ValueError("Ingredient index does not match the catalog; rebuild with catalog_adapter.py")
+    lists = [product_ingredients(product) for product in products]
+    mismatches = 0
+    for product, names in zip(products, lists):
+        if [index.names[ingredient_id] for ingredient_id in product.get("ingredient_ids", [])] != names:
+            mismatches += 1
+            print(f"Mismatch: ingredient_ids of {product.get('id')}")
+    terms = CHECK_TERMS + index.names
+    for term in terms:
+        canonical = canonical_ingredient(term)
+        expected = [
+            product.get("id")
+            for product, names in zip(products, lists)
+            if canonical and any(canonical in name for name in names)
+        ]
+        if index.containing(term) != expected:
+            mismatches += 1
+            print(f"Mismatch: containing {term!r}")
+    print(f"Checked {len(products)} products and {len(terms)} terms: {mismatches} mismatches")
+    return mismatches
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Look up products by ingredient.")
+    parser.add_argument("term", nargs="?", help="ingredient to look for, e.g. niacinamide")
+    parser.add_argument("--free-of", help="list products whose ingredient list lacks this ingredient")
+    parser.add_argument("--catalog", type=Path, default=OUTPUT_PATH, help="catalog JSON")
+    parser.add_argument("--index", type=Path, help="ingredient index (default: next to the catalog)")
+    parser.add_argument("--check", action="store_true", help="verify the index against the compositions")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    products = json.loads(args.catalog.read_text(encoding="utf-8")).get("products", [])
+    index = IngredientIndex(load_ingredient_index(args.index or ingredient_index_path_for(args.catalog)))
+    if args.check:
+        raise SystemExit(1 if check_index(products, index) else 0)
+    if args.free_of:
+        product_ids = index.free_of(args.free_of)
+    elif args.term:
+        product_ids = index.containing(args.term)
+    else:
+        raise SystemExit("Give an ingredient, --free-of or --check")
+    names = {product["id"]: product.get("name", "") for product in products}
+    for product_id in product_ids:
+        print(f"{product_id:>14}  {names.get(product_id, '')}")
+
+
+if __name__ == "__main__":
+    main()
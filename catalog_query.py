@@ -0,0 +1,647 @@
+#!/usr/bin/env python3
+"""Ranked candidates for the shopper agent from a long-lived process.
+
+``QueryService`` loads the catalog and its search index once and answers
+the requests that ``getRankedCandidates`` in server.js handles. These are a
+query, an active filter, intent filters and refinement ids. Scores come from
+``catalog_search.IndexedRanker``. The category and refinement regexes run
+once per product at load time and are kept as bitsets. Results are held in an
+LRU cache keyed by the normalised request, so repeated and re-phrased
+requests (case, spacing, refinement order) are not ranked again:
+
+    python3 catalog_query.py "gentle cleanser" --refinement dry-skin
+    python3 catalog_query.py --serve --port 8090
+    python3 catalog_query.py --check
+
+The catalog is loaded the way ``loadCatalog`` in server.js loads it:
+every product goes through a port of ``normalizeCatalogProduct`` and is
+merged with the CSV feed as ``mergeCatalogProducts`` does. The merge adds
+CSV text to the blob, so the search index is built from the merged products
+at load time rather than read from the adapter's index file.
+
+``--serve`` answers ``POST /candidates`` with the body server.js sends to
+``/api/chat``. Set ``CATALOG_QUERY_URL=http://127.0.0.1:8090`` for
+server.js to use it. ``benchmarks.query_service`` load-tests it. The
+server reloads the catalog when a build bumps ``<catalog>.generation``.
+``--check`` runs ``getRankedCandidates`` from server.js itself under node.
+"""
+import argparse
+import csv
+import functools
+import json
+import re
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from catalog_adapter import CSV_PATH, OUTPUT_PATH, ROOT, build_search_index, product_price, read_generation
+from catalog_search import (
+    CHECK_FILTERS,
+    CHECK_INTENTS,
+    CHECK_QUERIES,
+    IndexedRanker,
+    clean_text,
+    decode_search_index,
+    iter_bits,
+    load_products,
+    rank_linear,
+    search_blob,
+)
+
+QUERY_CACHE_SIZE = 4096
+GENERATION_POLL_SECONDS = 1.0
+CATEGORY_CACHE_SIZE = 256
+FALLBACK_RESULTS = 12
+INTENT_FIELDS = ["product_category", "skin_type", "concern", "finish", "coverage", "spf_min"]
+SERVER_JS = ROOT / "server.js"
+# inferConcerns in server.js, for products that have no concerns of their own.
+KNOWN_CONCERNS = [
+    "wrinkles",
+    "fine lines",
+    "dark spots",
+    "dullness",
+    "dryness",
+    "hydration",
+    "sun protection",
+    "redness",
+    "pores",
+    "texture",
+    "firming",
+    "acne",
+    "sensitivity",
+    "dark circles",
+]
+# The longer of two CSV texts wins these fields when loadCatalogFromCsv folds duplicate rows.
+CSV_LONGEST_FIELDS = ["description", "composition", "how_to_use", "overview", "overview_summary"]
+MERGE_FIRST_FIELDS = ["composition", "how_to_use", "overview", "overview_summary", "results_timeline", "coupon_applicable"]
+MERGE_LIST_FIELDS = ["features", "benefits", "concerns", "categories", "collections", "image_gallery", "promotions"]
+# Loads server.js with any npm package that isn't installed stubbed out, then ranks every request on stdin.
+SERVER_HARNESS = r"""
+const Module = require("module");
+const payload = JSON.parse(require("fs").readFileSync(0, "utf8"));
+const stubs = {
+  dotenv: { config() {} },
+  express: Object.assign(() => ({ use() {}, get() {}, post() {}, listen() {} }), { json() {}, static() {} }),
+  openai: class OpenAI {},
+  "csv-parse/sync": { parse: () => payload.rows },
+};
+const load = Module._load;
+Module._load = function (request, ...rest) {
+  try {
+    return load.call(this, request, ...rest);
+  } catch (error) {
+    if (error.code !== "MODULE_NOT_FOUND" || !(request in stubs)) throw error;
+    return stubs[request];
+  }
+};
+const { getRankedCandidates } = require(payload.server);
+const ids = payload.requests.map((request) => getRankedCandidates(request).map((product) => product.id));
+process.stdout.write(`\n${JSON.stringify(ids)}\n`);
+"""
+
+
+def js_regex(pattern: str) -> re.Pattern:
+    """A regex copied from server.js; JS ``\\b`` only knows ASCII word characters."""
+    return re.compile(pattern, re.ASCII)
+
+
+REQUESTED_CATEGORY_PATTERNS = [
+    ("cleanser", js_regex(r"\bcleanser|cleansing|face wash|wash\b")),
+    ("moisturizer", js_regex(r"\bmoisturizer|moisturiser|cream\b")),
+    ("serum", js_regex(r"\bserum\b")),
+    ("sunscreen", js_regex(r"\bsunscreen|spf|sun protection\b")),
+    ("eye care", js_regex(r"\beye cream|eye care\b")),
+    ("toner", js_regex(r"\btoner|softener\b")),
+]
+CATEGORY_PATTERNS = {
+    "cleanser": js_regex(r"\bcleanser|cleansing|face wash|foam|oil cleanser|cleanse\b"),
+    "moisturizer": js_regex(r"\bmoisturizer|moisturiser|cream|gel-cream|face moisturizers\b"),
+    "serum": js_regex(r"\bserum|treatment\b"),
+    "sunscreen": js_regex(r"\bsunscreen|spf|sun protection|face sunscreen|sun protector\b"),
+    "eye care": js_regex(r"\beye cream|eye care|eye & lip care|eye creams\b"),
+    "toner": js_regex(r"\btoner|softener\b"),
+}
+REFINEMENT_PATTERNS = {
+    "gentle-sensitive": js_regex(r"\bgentle|sensitive|non-stripping|soothing\b"),
+    "removes-makeup": js_regex(r"\bmakeup|waterproof|impurities|remove\b"),
+    "dry-skin": js_regex(r"\bdry|hydrat|moisture|barrier\b"),
+    "oily-skin": js_regex(r"\boily|oil control|pores|shine\b"),
+    "fragrance-free": js_regex(r"\bfragrance-free|unscented\b"),
+    "lightweight-day": js_regex(r"\blightweight|day|daily\b"),
+    "rich-night": js_regex(r"\brich|night|overnight\b"),
+    "wrinkle-focused": js_regex(r"\bwrinkle|anti-aging|fine lines\b"),
+    "with-spf": js_regex(r"\bspf|sun protection|sunscreen\b"),
+    "good-under-makeup": js_regex(r"\bunder makeup|makeup\b"),
+    "invisible-finish": js_regex(r"\binvisible finish|clear|no white cast|weightless\b"),
+    "stick-reapply": js_regex(r"\bstick|reapply|on-the-go\b"),
+    "water-resistant": js_regex(r"\bwater[- ]resistant\b|\bwetforce\b|\bsweat\b|\bsport\b"),
+    "brightening": js_regex(r"\bbrightening|radiance|glow|dullness|dark spots\b"),
+    "hydrating": js_regex(r"\bhydrat|moisture|plump\b"),
+    "barrier-support": js_regex(r"\bbarrier\b"),
+    "fast-absorbing": js_regex(r"\bfast-absorbing|absorbs quickly|quickly absorbs\b"),
+    "dark-circles": js_regex(r"\bdark circles\b"),
+    "fine-lines": js_regex(r"\bfine lines|wrinkle\b"),
+    "am-routine": js_regex(r"\bmorning|am routine|day\b"),
+    "pm-repair": js_regex(r"\bnight|pm repair|overnight\b"),
+}
+
+CHECK_REFINEMENTS = [[], ["dry-skin"], ["gentle-sensitive", "best-rated"], ["with-spf", "under-50"], ["dark-circles"]]
+
+
+def js_length(value: str) -> int:
+    """``String.prototype.length``, which counts UTF-16 code units."""
+    return len(value.encode("utf-16-le")) // 2
+
+
+def parse_number(value):
+    """``parseNumber`` in server.js: digits and dots only, then ``parseFloat``."""
+    if value is None:
+        return None
+    match = re.match(r"\d+(?:\.\d*)?|\.\d+", re.sub(r"[^0-9.]", "", str(value)))
+    return float(match.group()) if match else None
+
+
+def first_number(*values):
+    return next((number for number in map(parse_number, values) if number is not None), None)
+
+
+def slugify(value) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", clean_text(value).lower()).strip("-")
+
+
+def split_list(value) -> list:
+    if not value:
+        return []
+    return [item for item in map(clean_text, re.split(r"[,;|]", str(value))) if item]
+
+
+def unique_list(values) -> list:
+    return list(dict.fromkeys(item for item in map(clean_text, values) if item))
+
+
+def clean_list(values) -> list:
+    return [item for item in map(clean_text, values) if item]
+
+
+def infer_concerns(product: dict) -> list:
+    concerns = product.get("concerns")
+    if isinstance(concerns, list) and concerns:
+        return clean_list(concerns)
+    source = f"{product.get('description') or ''} {product.get('overview_summary') or ''}".lower()
+    return [concern for concern in KNOWN_CONCERNS if concern in source]
+
+
+def first_variant(product: dict) -> dict:
+    variants = product.get("variants")
+    variant = variants[0] if isinstance(variants, list) and variants else None
+    return variant if isinstance(variant, dict) else {}
+
+
+def normalize_catalog_product(product: dict, index: int = 0) -> dict:
+    """Port of ``normalizeCatalogProduct`` in server.js."""
+    variant = first_variant(product)
+    price = first_number(
+        product.get("price"), product.get("price_current"), variant.get("sale_price"), variant.get("standard_price")
+    )
+    price = 0 if price is None else price
+
+    def listed(field: str, fallback) -> list:
+        values = product.get(field)
+        return clean_list(values) if isinstance(values, list) else fallback
+
+    categories = listed("categories", split_list(product.get("category")))
+    rating = first_number(product.get("rating"), product.get("star_rating"))
+    name = product.get("name") or product.get("product_title")
+    return {
+        **product,
+        "id": clean_text(product.get("id"))
+        or clean_text(variant.get("variant_id"))
+        or f"catalog-{slugify(name or f'item-{index + 1}')}",
+        "name": clean_text(name or f"Product {index + 1}"),
+        "category": clean_text(product.get("category") or (categories[0] if categories else "") or "Skincare"),
+        "product_type": clean_text(product.get("product_type") or (categories[0] if categories else "") or "beauty"),
+        "price": price,
+        "msrp": first_number(product.get("msrp"), variant.get("standard_price"), product.get("price_current")) or price,
+        "rating": rating,
+        # catalog_search scores star_rating; server.js scores the parsed rating.
+        "star_rating": rating,
+        "reviews": first_number(product.get("reviews"), product.get("review_count")),
+        "description": clean_text(
+            product.get("description") or product.get("overview_summary") or product.get("overview")
+        ),
+        "composition": clean_text(product.get("composition") or product.get("Text")),
+        "how_to_use": clean_text(product.get("how_to_use")),
+        "results_timeline": clean_text(product.get("results_timeline") or product.get("results")),
+        "overview": clean_text(product.get("overview")),
+        "overview_summary": clean_text(product.get("overview_summary")),
+        "collections": listed("collections", split_list(product.get("Collection"))),
+        "categories": categories,
+        "concerns": infer_concerns(product),
+        "benefits": listed("benefits", []),
+        "features": listed("features", split_list(product.get("results"))),
+        "ingredients": listed("ingredients", []),
+        "image_url": clean_text(product.get("image_url") or product.get("URL_Saved_To")),
+        "image_gallery": [item for item in product.get("image_gallery") or [] if item]
+        if isinstance(product.get("image_gallery"), list)
+        else [],
+        "coupon_applicable": clean_text(product.get("coupon_applicable") or product.get("Coupon_Applicable")),
+        "promotions": listed("promotions", split_list(product.get("Promotions"))),
+    }
+
+
+def read_csv_rows(csv_path: Path) -> list:
+    """The feed's rows as ``csv-parse`` gives them to server.js: header-keyed, short rows without the missing cells."""
+    with open(csv_path, newline="", encoding="utf-8") as handle:
+        return [
+            {name: value for name, value in row.items() if name is not None and value is not None}
+            for row in csv.DictReader(handle)
+        ]
+
+
+def parse_json(value, fallback):
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return fallback
+
+
+def load_csv_products(rows: list) -> list:
+    """Port of ``loadCatalogFromCsv`` in server.js, over ``read_csv_rows`` output."""
+    products = []
+    for index, row in enumerate(rows):
+        variants = parse_json(row.get("variants"), [])
+        title = clean_text(row.get("Name") or row.get("product_title"))
+        if not title:
+            continue
+        variant = first_variant({"variants": variants})
+        products.append(normalize_catalog_product({
+            "id": clean_text(row.get("Name_URL")) or clean_text(variant.get("variant_id")),
+            "name": title,
+            "category": clean_text(row.get("category") or "Skincare"),
+            "product_type": clean_text(row.get("category") or "Skincare"),
+            "price_current": row.get("price_current"),
+            "star_rating": row.get("star_rating"),
+            "reviews": row.get("Reviews"),
+            "description": row.get("Description"),
+            "composition": row.get("Text"),
+            "how_to_use": row.get("how_to_use"),
+            "results_timeline": row.get("results"),
+            "overview": row.get("overview"),
+            "overview_summary": row.get("overview_summary"),
+            "variants": variants,
+            "collections": split_list(row.get("Collection")),
+            "categories": split_list(row.get("category")),
+            "image_url": row.get("URL_Saved_To"),
+            "coupon_applicable": row.get("Coupon_Applicable"),
+            "promotions": split_list(row.get("Promotions")),
+        }, index))
+
+    deduped = {}
+    for product in products:
+        key = (
+            clean_text(first_variant(product).get("variant_id"))
+            or clean_text(product["id"])
+            or clean_text(product["name"]).lower()
+        )
+        existing = deduped.get(key)
+        if existing is None:
+            deduped[key] = {**product, "image_gallery": unique_list([product["image_url"], *product["image_gallery"]])}
+            continue
+        deduped[key] = {
+            **existing,
+            **{
+                field: existing[field] if js_length(existing[field]) >= js_length(product[field]) else product[field]
+                for field in CSV_LONGEST_FIELDS
+            },
+            "image_gallery": unique_list(
+                [*existing["image_gallery"], existing["image_url"], *product["image_gallery"], product["image_url"]]
+            ),
+            "promotions": unique_list([*existing["promotions"], *product["promotions"]]),
+        }
+    return list(deduped.values())
+
+
+def merge_catalog_products(products: list, csv_products: list) -> list:
+    """Port of ``mergeCatalogProducts`` in server.js: CSV text fills gaps and extends list fields, matched by name."""
+    csv_by_name = {clean_text(product["name"]).lower(): product for product in csv_products}
+    merged = []
+    for product in products:
+        match = csv_by_name.get(clean_text(product["name"]).lower())
+        if match is None:
+            merged.append(product)
+            continue
+        description = product["description"]
+        merged.append({
+            **product,
+            "description": description
+            if description and js_length(description) >= js_length(match["description"])
+            else match["description"],
+            **{field: product.get(field) or match.get(field) for field in MERGE_FIRST_FIELDS},
+            **{field: unique_list([*(product.get(field) or []), *(match.get(field) or [])]) for field in MERGE_LIST_FIELDS},
+            "ingredients": product["ingredients"] if product["ingredients"] else match["ingredients"],
+        })
+    return merged
+
+
+def load_server_catalog(catalog_path: Path = OUTPUT_PATH, csv_path: Path = CSV_PATH) -> list:
+    """The products server.js ranks: ``loadCatalog``'s normalised JSON, merged with the CSV feed when it exists."""
+    products = [normalize_catalog_product(product, index) for index, product in enumerate(load_products(catalog_path))]
+    if csv_path and csv_path.exists():
+        products = merge_catalog_products(products, load_csv_products(read_csv_rows(csv_path)))
+    return products
+
+
+def taxonomy_haystack(product: dict) -> str:
+    values = [product.get("category"), product.get("product_type")]
+    values += (product.get("categories") or []) + (product.get("collections") or []) + [product.get("name")]
+    return " ".join(str(value) for value in values if value).lower()
+
+
+def infer_requested_category(query: str, intent_filters=None) -> str:
+    intent = (intent_filters or {}).get("discoveryIntent") or {}
+    explicit = clean_text(intent.get("product_category")).lower()
+    if explicit:
+        return explicit
+    normalized = clean_text(query).lower()
+    for category, pattern in REQUESTED_CATEGORY_PATTERNS:
+        if normalized and pattern.search(normalized):
+            return category
+    return ""
+
+
+def matches_requested_category(product: dict, requested: str) -> bool:
+    if not requested:
+        return True
+    haystack = taxonomy_haystack(product)
+    pattern = CATEGORY_PATTERNS.get(requested)
+    return bool(pattern.search(haystack)) if pattern else requested in haystack
+
+
+def matches_refinement(product: dict, refinement: str, blob: str) -> bool:
+    if refinement == "best-rated":
+        return (product.get("star_rating") or 0) >= 4.5
+    if refinement == "under-50":
+        return product_price(product) <= 50
+    pattern = REFINEMENT_PATTERNS.get(refinement)
+    return bool(pattern.search(blob)) if pattern else True
+
+
+def best_rated(products: list) -> list:
+    ordered = sorted(range(len(products)), key=lambda ordinal: -(products[ordinal].get("star_rating") or 0))
+    return [products[ordinal]["id"] for ordinal in ordered[:FALLBACK_RESULTS]]
+
+
+def ranked_candidates_linear(products: list, query: str, active_filter=None, intent_filters=None, refinements=()):
+    """Straight port of ``getRankedCandidates``: filters and scores every product per request."""
+    requested = infer_requested_category(query, intent_filters)
+    refinements = [refinement for refinement in refinements if refinement]
+    pool = [product for product in products if matches_requested_category(product, requested)]
+    if refinements:
+        pool = [
+            product
+            for product in pool
+            if all(matches_refinement(product, refinement, search_blob(product)) for refinement in refinements)
+        ]
+        if not pool:
+            return []
+    ranked = rank_linear(pool or products, query, active_filter, intent_filters)
+    if ranked or refinements:
+        return ranked
+    return best_rated(products)
+
+
+def query_key(query: str, active_filter=None, intent_filters=None, refinements=()) -> tuple:
+    """Everything the ranking depends on, normalised so equivalent requests share a cache entry."""
+    intent = (intent_filters or {}).get("discoveryIntent") or {}
+    return (
+        clean_text(query).lower(),
+        # applyActiveFilterScore matches the id exactly, so it is not cleaned.
+        active_filter if isinstance(active_filter, str) and active_filter else None,
+        tuple(
+            (field, intent[field])
+            for field in INTENT_FIELDS
+            if intent.get(field) and isinstance(intent[field], (str, int, float))
+        ),
+        tuple(sorted({refinement for refinement in refinements or () if refinement and isinstance(refinement, str)})),
+    )
+
+
+class QueryService:
+    """Ranks requests from precomputed category/refinement bitsets, with an LRU cache of results."""
+
+    def __init__(self, products: list, index: dict, cache_size: int = QUERY_CACHE_SIZE):
+        self.products = products
+        self.ranker = IndexedRanker(products, index)
+        self.all_bits = self.ranker.all_bits
+        self.best_rated = tuple(best_rated(products))
+        blobs = [search_blob(product) for product in products]
+        refinements = [*REFINEMENT_PATTERNS, "best-rated", "under-50"]
+        self.refinement_bits = {
+            refinement: self._bits(
+                matches_refinement(product, refinement, blob) for product, blob in zip(products, blobs)
+            )
+            for refinement in refinements
+        }
+        self.category_bits = functools.lru_cache(maxsize=CATEGORY_CACHE_SIZE)(self._category_bits)
+        self._ranked = functools.lru_cache(maxsize=cache_size)(self._rank)
+
+    @staticmethod
+    def _bits(flags) -> int:
+        bits = 0
+        for ordinal, flag in enumerate(flags):
+            if flag:
+                bits |= 1 << ordinal
+        return bits
+
+    def _category_bits(self, requested: str) -> int:
+        return self._bits(matches_requested_category(product, requested) for product in self.products)
+
+    def _rank(self, key: tuple) -> tuple:
+        query, active_filter, intent, refinements = key
+        intent_filters = {"discoveryIntent": dict(intent)}
+        requested = infer_requested_category(query, intent_filters)
+        pool = self.category_bits(requested) if requested else self.all_bits
+        for refinement in refinements:
+            # Unknown refinement ids match everything, as in productMatchesRefinementId.
+            pool &= self.refinement_bits.get(refinement, self.all_bits)
+        if refinements and not pool:
+            return ()
+        scores = self.ranker.scores(query, active_filter, intent_filters)
+        ordered = sorted(iter_bits(pool or self.all_bits), key=lambda ordinal: -scores[ordinal])
+        ranked = tuple(self.products[ordinal]["id"] for ordinal in ordered if scores[ordinal] > 0)
+        if ranked or refinements:
+            return ranked
+        return self.best_rated
+
+    def candidates(self, query: str, active_filter=None, intent_filters=None, refinements=()) -> tuple:
+        """Ranked product ids, like ``getRankedCandidates`` in server.js."""
+        return self._ranked(query_key(query, active_filter, intent_filters, refinements))
+
+    def cache_info(self) -> dict:
+        info = self._ranked.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+
+def load_service(catalog_path: Path = OUTPUT_PATH, csv_path: Path = CSV_PATH, cache_size=QUERY_CACHE_SIZE):
+    products = load_server_catalog(catalog_path, csv_path)
+    return QueryService(products, decode_search_index(build_search_index(products)), cache_size)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """``POST /candidates`` with a server.js chat body; ``GET /health`` for counts and cache stats."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40ms per request.
+    disable_nagle_algorithm = True
+    service = None
+
+    def send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_json(404, {"error": "Not found"})
+            return
+        self.send_json(200, {"ok": True, "products": len(self.service.products), "cache": self.service.cache_info()})
+
+    def do_POST(self):
+        if self.path != "/candidates":
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            refinements = request.get("refinementIds")
+            ids = self.service.candidates(
+                request.get("query"),
+                request.get("activeFilter"),
+                request.get("intentFilters") if isinstance(request.get("intentFilters"), dict) else None,
+                refinements if isinstance(refinements, list) else (),
+            )
+        except (ValueError, AttributeError) as error:
+            self.send_json(400, {"error": f"Bad request: {error}"})
+            return
+        limit = request.get("limit")
+        self.send_json(200, {"ids": list(ids[:limit] if isinstance(limit, int) else ids), "total": len(ids)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(service: QueryService, host: str = "127.0.0.1", port: int = 8090) -> ThreadingHTTPServer:
+    handler = type("BoundQueryHandler", (QueryHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def reload_on_generation(server: ThreadingHTTPServer, catalog_path: Path, csv_path: Path, cache_size: int):
+    """Swap in a freshly loaded service whenever a build bumps the catalog's generation file."""
+
+    def poll():
+        loaded = read_generation(catalog_path)
+        while True:
+            time.sleep(GENERATION_POLL_SECONDS)
+            generation = read_generation(catalog_path)
+            if generation == loaded:
+                continue
+            try:
+                server.RequestHandlerClass.service = load_service(catalog_path, csv_path, cache_size)
+            except (OSError, ValueError) as error:
+                # Another rebuild may be mid-write; the next poll tries again.
+                print(f"Reload of generation {generation} failed: {error}")
+                continue
+            loaded = generation
+            print(f"Reloaded generation {generation}: {len(server.RequestHandlerClass.service.products)} products")
+
+    threading.Thread(target=poll, daemon=True).start()
+
+
+def server_rankings(requests: list, csv_path: Path = CSV_PATH) -> list:
+    """Ranked ids from ``getRankedCandidates`` in server.js, run under node, for each request.
+
+    server.js loads its own catalog and CSV. Any npm package that isn't
+    installed is stubbed; a stubbed ``csv-parse`` returns ``read_csv_rows``.
+    """
+    payload = {"server": str(SERVER_JS), "requests": requests, "rows": read_csv_rows(csv_path)}
+    try:
+        result = subprocess.run(
+            ["node", "-e", SERVER_HARNESS], input=json.dumps(payload), capture_output=True, text=True, check=False
+        )
+    except FileNotFoundError:
+        raise SystemExit("--check needs node to run server.js")
+    if result.returncode:
+        raise SystemExit(f"Running server.js failed:\n{result.stderr.strip()}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_candidates(service: QueryService) -> int:
+    """Compare the service with server.js over a grid of requests; returns mismatch count."""
+    grid = [
+        {"query": query, "activeFilter": active_filter, "intentFilters": intent_filters, "refinementIds": refinements}
+        for query in CHECK_QUERIES
+        for active_filter in CHECK_FILTERS
+        for intent_filters in CHECK_INTENTS
+        for refinements in CHECK_REFINEMENTS
+    ]
+    mismatches = 0
+    for request, expected in zip(grid, server_rankings(grid)):
+        # Asked twice, re-spaced and re-cased, so cached answers are checked too.
+        for variant in (request["query"], f"  {request['query'].upper()} "):
+            actual = service.candidates(variant, request["activeFilter"], request["intentFilters"], request["refinementIds"])
+            if list(actual) != expected:
+                mismatches += 1
+                print(
+                    f"Mismatch: query={variant!r} filter={request['activeFilter']} "
+                    f"intent={request['intentFilters']} refinements={request['refinementIds']}"
+                )
+    print(f"Checked {len(grid)} requests against server.js: {mismatches} mismatches; cache {service.cache_info()}")
+    return mismatches
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve or query ranked catalog candidates.")
+    parser.add_argument("query", nargs="?", default="", help="shopper query text")
+    parser.add_argument("--catalog", type=Path, default=OUTPUT_PATH, help="catalog JSON")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH, help="feed merged into the catalog, as server.js does")
+    parser.add_argument("--filter", dest="active_filter", help="active filter id, e.g. under50")
+    parser.add_argument("--refinement", action="append", default=[], help="refinement id (repeatable)")
+    parser.add_argument("--limit", type=int, default=12, help="results to print")
+    parser.add_argument("--cache-size", type=int, default=QUERY_CACHE_SIZE, help="cached normalised requests")
+    parser.add_argument("--serve", action="store_true", help="answer POST /candidates over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--check", action="store_true", help="verify against getRankedCandidates in server.js (needs node)")
+    args = parser.parse_args(argv)
+    if args.check and (args.catalog != OUTPUT_PATH or args.csv != CSV_PATH):
+        parser.error("--check compares with server.js, which always loads the default catalog and CSV")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    service = load_service(args.catalog, args.csv, args.cache_size)
+    if args.check:
+        raise SystemExit(1 if check_candidates(service) else 0)
+    if args.serve:
+        server = make_server(service, args.host, args.port)
+        reload_on_generation(server, args.catalog, args.csv, args.cache_size)
+        print(f"Serving {len(service.products)} products on http://{args.host}:{server.server_port}/candidates")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+    by_id = {product["id"]: product for product in service.products}
+    for product_id in service.candidates(args.query, args.active_filter, None, args.refinement)[: args.limit]:
+        print(f"{product_id:>14}  {by_id[product_id].get('name', '')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""Reference ranking over the prebuilt search index emitted by catalog_adapter.py.
+
+``rank_linear`` is a straight port of ``scoreProduct``/``getRankedCandidates``'
+scoring in server.js and scans every product. ``rank_indexed`` produces the
+same ranking from the inverted index and facet bitsets: query tokens resolve
+to postings through the (small) token vocabulary, so product text is only
+touched for free-text intent phrases, and then only for candidate products.
+"""
+import argparse
+import json
+import re
+from pathlib import Path
+
+from catalog_adapter import (
+    OUTPUT_PATH,
+    SEARCH_INDEX_VERSION,
+    product_price,
+    search_blob_values,
+    search_index_path_for,
+    search_tokenize,
+)
+
+TOKEN_CACHE_SIZE = 65536
+SPF_PATTERN = re.compile(r"spf\s*(\d+)", re.IGNORECASE)
+
+INTENT_WEIGHTS = [
+    ("product_category", 5, -1),
+    ("skin_type", 4, 0),
+    ("concern", 4, 0),
+    ("finish", 2, 0),
+    ("coverage", 2, 0),
+]
+
+CHECK_QUERIES = [
+    "hydrating serum",
+    "sunscreen for oily skin",
+    "anti aging eye cream",
+    "gentle cleanser sensitive skin",
+    "vitamin c brightening",
+    "gift set",
+    "spf 50+ daily",
+    "wrinkle wrinkle cream",
+    "",
+]
+CHECK_FILTERS = [None, "under25", "under50", "bestRated", "fragranceFree", "sensitive", "vegan"]
+CHECK_INTENTS = [
+    None,
+    {"discoveryIntent": {"product_category": "serum", "concern": "dryness"}},
+    {"discoveryIntent": {"skin_type": "oily skin", "spf_min": 30}},
+]
+
+
+def clean_text(value) -> str:
+    return " ".join(str(value or "").replace("\xa0", " ").split())
+
+
+def load_products(catalog_path: Path) -> list:
+    return json.loads(catalog_path.read_text(encoding="utf-8")).get("products", [])
+
+
+def load_search_index(index_path: Path) -> dict:
+    index = json.loads(index_path.read_text(encoding="utf-8"))
+    if index.get("version") != SEARCH_INDEX_VERSION:
+        raise ValueError(f"Unsupported search index version {index.get('version')!r} in {index_path}")
+    return decode_search_index(index)
+
+
+def decode_search_index(index: dict) -> dict:
+    """Unflatten postings and parse the hex facet bitsets of a ``build_search_index`` result, in place."""
+    index["postings"] = {
+        token: list(zip(flat[::2], flat[1::2])) for token, flat in index["postings"].items()
+    }
+    index["facets"] = {
+        facet: {label: int(bits, 16) for label, bits in values.items()}
+        for facet, values in index["facets"].items()
+    }
+    return index
+
+
+def search_blob(product: dict) -> str:
+    return " ".join(search_blob_values(product)).lower()
+
+
+def spf_score(product: dict, spf_min) -> float:
+    description = product.get("description")
+    if not spf_min or not description:
+        return 0
+    match = SPF_PATTERN.search(description)
+    spf = int(match.group(1)) if match else 0
+    return 3 if spf >= spf_min else -1
+
+
+def active_filter_score(product: dict, active_filter, blob: str) -> float:
+    price = product_price(product)
+    if active_filter == "under25":
+        return 5 if price <= 25 else -4
+    if active_filter == "under50":
+        return 4 if price <= 50 else -3
+    if active_filter == "bestRated":
+        return (product.get("star_rating") or 0) * 1.5
+    if active_filter == "fragranceFree":
+        return -2 if "fragrance" in clean_text(product.get("composition")).lower() else 2
+    if active_filter == "sensitive":
+        return 3 if "sensitive" in blob else 0
+    if active_filter == "vegan":
+        return 2 if "vegan" in blob else 0
+    return 0
+
+
+def intent_score(product: dict, intent_filters, blob: str) -> float:
+    intent = (intent_filters or {}).get("discoveryIntent") or {}
+    score = 0
+    for field, hit, miss in INTENT_WEIGHTS:
+        if intent.get(field):
+            score += hit if str(intent[field]).lower() in blob else miss
+    score += spf_score(product, intent.get("spf_min"))
+    return score
+
+
+def score_product_linear(product: dict, query: str, active_filter=None, intent_filters=None) -> float:
+    blob = search_blob(product)
+    name = clean_text(product.get("name")).lower()
+    category = clean_text(product.get("category")).lower()
+    score = (product.get("star_rating") or 0) * 0.5
+    for token in search_tokenize(query):
+        if token not in blob:
+            continue
+        score += 2.2 if len(token) >= 6 else 1
+        if token in name:
+            score += 1.5
+        if token in category:
+            score += 1.25
+    score += active_filter_score(product, active_filter, blob)
+    score += intent_score(product, intent_filters, blob)
+    if product.get("promotions"):
+        score += 0.4
+    if product.get("coupon_applicable"):
+        score += 0.2
+    return score
+
+
+def rank(scores: list, products: list) -> list:
+    ordered = sorted(range(len(products)), key=lambda ordinal: -scores[ordinal])
+    return [products[ordinal]["id"] for ordinal in ordered if scores[ordinal] > 0]
+
+
+def rank_linear(products: list, query: str, active_filter=None, intent_filters=None) -> list:
+    scores = [score_product_linear(product, query, active_filter, intent_filters) for product in products]
+    return rank(scores, products)
+
+
+class IndexedRanker:
+    """Ranks the catalog from the inverted index instead of per-product blob scans."""
+
+    def __init__(self, products: list, index: dict):
+        if index["products"] != [product.get("id") for product in products]:
+            raise ValueError("Search index does not match the catalog; rebuild with catalog_adapter.py")
+        self.products = products
+        self.index = index
+        self.fields = index["fields"]
+        self.vocabulary = sorted(index["postings"])
+        self._token_cache = {}
+        self.all_bits = (1 << len(products)) - 1
+
+    def token_flags(self, token: str) -> dict:
+        """``{ordinal: flags}`` for products whose blob contains ``token`` as a substring.
+
+        Query tokens contain only ``[a-z0-9+]``, so any occurrence sits inside
+        one blob token; scanning the vocabulary is enough to answer
+        ``blob.includes(token)`` exactly.
+        """
+        cached = self._token_cache.get(token)
+        if cached is None:
+            if len(self._token_cache) >= TOKEN_CACHE_SIZE:
+                # A long-lived ranker sees unbounded query text; start over rather than grow.
+                self._token_cache.clear()
+            cached = {}
+            for candidate in self.vocabulary:
+                if token in candidate:
+                    for ordinal, flags in self.index["postings"][candidate]:
+                        cached[ordinal] = cached.get(ordinal, 0) | flags
+            self._token_cache[token] = cached
+        return cached
+
+    def token_bits(self, token: str) -> int:
+        bits = 0
+        for ordinal in self.token_flags(token):
+            bits |= 1 << ordinal
+        return bits
+
+    def phrase_bits(self, phrase: str) -> int:
+        """Products whose blob contains ``phrase``; only token candidates are verified."""
+        phrase = phrase.lower()
+        tokens = search_tokenize(phrase)
+        candidates = self.all_bits
+        for token in tokens:
+            candidates &= self.token_bits(token)
+        if len(tokens) == 1 and tokens[0] == phrase:
+            return candidates
+        bits = 0
+        for ordinal in iter_bits(candidates):
+            if phrase in search_blob(self.products[ordinal]):
+                bits |= 1 << ordinal
+        return bits
+
+    def facet_bits(self, facet: str, *labels) -> int:
+        bits = 0
+        for label in labels:
+            bits |= self.index["facets"].get(facet, {}).get(label, 0)
+        return bits
+
+    def filter_scores(self, active_filter) -> list:
+        count = len(self.products)
+        if active_filter == "under25":
+            bits, hit, miss = self.facet_bits("price_bands", "under25"), 5, -4
+        elif active_filter == "under50":
+            bits, hit, miss = self.facet_bits("price_bands", "under25", "25to50"), 4, -3
+        elif active_filter == "bestRated":
+            return [(product.get("star_rating") or 0) * 1.5 for product in self.products]
+        elif active_filter == "fragranceFree":
+            bits, hit, miss = self.facet_bits("composition", "fragrance"), -2, 2
+        elif active_filter == "sensitive":
+            bits, hit, miss = self.token_bits("sensitive"), 3, 0
+        elif active_filter == "vegan":
+            bits, hit, miss = self.token_bits("vegan"), 2, 0
+        else:
+            return [0] * count
+        return [hit if bits >> ordinal & 1 else miss for ordinal in range(count)]
+
+    def intent_scores(self, intent_filters) -> list:
+        intent = (intent_filters or {}).get("discoveryIntent") or {}
+        scores = [0] * len(self.products)
+        for field, hit, miss in INTENT_WEIGHTS:
+            if intent.get(field):
+                bits = self.phrase_bits(str(intent[field]))
+                for ordinal in range(len(scores)):
+                    scores[ordinal] += hit if bits >> ordinal & 1 else miss
+        if intent.get("spf_min"):
+            for ordinal, product in enumerate(self.products):
+                scores[ordinal] += spf_score(product, intent["spf_min"])
+        return scores
+
+    def scores(self, query: str, active_filter=None, intent_filters=None) -> list:
+        # Additions happen in the same order as scoreProduct so tied floats tie here too.
+        scores = [(product.get("star_rating") or 0) * 0.5 for product in self.products]
+        for token in search_tokenize(query):
+            weight = 2.2 if len(token) >= 6 else 1
+            for ordinal, flags in self.token_flags(token).items():
+                score = scores[ordinal] + weight
+                if flags & self.fields["name"]:
+                    score += 1.5
+                if flags & self.fields["category"]:
+                    score += 1.25
+                scores[ordinal] = score
+        for ordinal, value in enumerate(self.filter_scores(active_filter)):
+            scores[ordinal] += value
+        for ordinal, value in enumerate(self.intent_scores(intent_filters)):
+            scores[ordinal] += value
+        for ordinal, product in enumerate(self.products):
+            if product.get("promotions"):
+                scores[ordinal] += 0.4
+            if product.get("coupon_applicable"):
+                scores[ordinal] += 0.2
+        return scores
+
+    def rank(self, query: str, active_filter=None, intent_filters=None) -> list:
+        return rank(self.scores(query, active_filter, intent_filters), self.products)
+
+
+def iter_bits(bits: int):
+    # One pass over bin(); shifting a catalog-wide int once per ordinal is quadratic.
+    for ordinal, digit in enumerate(reversed(bin(bits)[2:])):
+        if digit == "1":
+            yield ordinal
+
+
+def rank_indexed(products: list, index: dict, query: str, active_filter=None, intent_filters=None) -> list:
+    return IndexedRanker(products, index).rank(query, active_filter, intent_filters)
+
+
+def check_rankings(products: list, index: dict) -> int:
+    """Compare indexed and linear rankings over a grid of queries; returns mismatch count."""
+    ranker = IndexedRanker(products, index)
+    mismatches = 0
+    cases = 0
+    for query in CHECK_QUERIES:
+        for active_filter in CHECK_FILTERS:
+            for intent_filters in CHECK_INTENTS:
+                cases += 1
+                expected = rank_linear(products, query, active_filter, intent_filters)
+                actual = ranker.rank(query, active_filter, intent_filters)
+                if expected != actual:
+                    mismatches += 1
+                    print(f"Mismatch: query={query!r} filter={active_filter} intent={intent_filters}")
+    print(f"Checked {cases} ranking cases: {cases - mismatches} match, {mismatches} differ")
+    return mismatches
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Query the prebuilt catalog search index.")
+    parser.add_argument("query", nargs="?", default="", help="shopper query text")
+    parser.add_argument("--catalog", type=Path, default=OUTPUT_PATH, help="catalog JSON")
+    parser.add_argument("--index", type=Path, help="search index (default: next to the catalog)")
+    parser.add_argument("--filter", dest="active_filter", help="active filter id, e.g. under50")
+    parser.add_argument("--limit", type=int, default=12, help="results to print")
+    parser.add_argument(
+        "--check", action="store_true", help="verify indexed rankings against the linear scorer"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    products = load_products(args.catalog)
+    index = load_search_index(args.index or search_index_path_for(args.catalog))
+    if args.check:
+        raise SystemExit(1 if check_rankings(products, index) else 0)
+    by_id = {product["id"]: product for product in products}
+    for product_id in rank_indexed(products, index, args.query, args.active_filter)[: args.limit]:
+        print(f"{product_id:>14}  {by_id[product_id].get('name', '')}")
+
+
+if __name__ == "__main__":
+    main()
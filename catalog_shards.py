@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Split catalog output for lazy client loading.
+
+``write_shards`` turns the catalog into a directory next to it::
+
+    shiseido-catalog.shards/
+        manifest.json                          # small, revalidated on every load
+        listing/<category>-<page>.<hash>.json  # PLP cards, ranking and facets
+        detail/<product id>.<hash>.json        # heavy text, fetched when a PDP opens
+
+Listing pages hold every product field except ``DETAIL_FIELDS``, grouped by
+category and paginated, with the gallery cut to the images a card shows.
+Detail shards hold the rest. A file name carries a hash of its content, so
+shards can be cached forever and only ``manifest.json`` changes between
+builds. A listing product updated with its detail shard equals the catalog
+product:
+
+    python3 catalog_shards.py check    # round trip against the JSON output
+    python3 catalog_shards.py report   # bytes to first results and per PDP, raw and gzipped
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import statistics
+import tempfile
+from pathlib import Path
+
+SHARDS_VERSION = 1
+ROOT = Path(__file__).resolve().parent
+DEFAULT_JSON_PATH = ROOT / "shiseido-catalog.json"
+# Only PDP views read these, and prompt_summary is for server.js alone. description and composition
+# stay in the listing: the client's local search (matchesQuery, getProductTextBlob, productHasFragrance)
+# matches against both before any PDP has loaded.
+DETAIL_FIELDS = ["how_to_use", "image_gallery", "image_meta", "ingredient_ids", "prompt_summary"]
+# getProductCarouselImages in app.js rotates the gallery by one, so a card shows the second image.
+LISTING_GALLERY_IMAGES = 2
+GALLERY_FIELDS = ["image_gallery", "image_meta"]
+LISTING_PAGE_SIZE = 48
+SLUG_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+def shards_dir_for(output_path: Path) -> Path:
+    return output_path.with_suffix(".shards")
+
+
+def slugify(value: str) -> str:
+    return SLUG_SPLIT.sub("-", value.lower()).strip("-") or "uncategorized"
+
+
+def encode(document) -> bytes:
+    return json.dumps(document, separators=(",", ":")).encode("utf-8")
+
+
+def split_product(product: dict) -> tuple:
+    """``(listing, detail)`` halves of one catalog product."""
+    listing = {key: value for key, value in product.items() if key not in DETAIL_FIELDS}
+    detail = {key: product[key] for key in DETAIL_FIELDS if key in product}
+    for field in GALLERY_FIELDS:
+        if product.get(field):
+            listing[field] = product[field][:LISTING_GALLERY_IMAGES]
+    return listing, detail
+
+
+def _write_hashed(directory: Path, stem: str, payload: bytes) -> str:
+    name = f"{stem}.{hashlib.sha1(payload).hexdigest()[:12]}.json"
+    (directory / name).write_bytes(payload)
+    return f"{directory.name}/{name}"
+
+
+class ShardWriter:
+    """Writes shards in place, re-encoding only the products that changed since its last call.
+
+    New files go in beside the current ones, then ``manifest.json`` is
+    replaced atomically, then files it no longer names are removed, so a
+    reader holding either manifest finds its files. Unchanged products and
+    listing pages reuse the halves and entries of the previous call.
+    """
+
+    def __init__(self, shards_dir: Path):
+        self.shards_dir = Path(shards_dir)
+        self.listings = {}
+        self.details = {}
+        self.pages = {}
+
+    def write(self, products: list, changed=None) -> dict:
+        """Write shards for ``products``; ``changed`` holds the ids that differ from the last call (None: all)."""
+        for directory in ("listing", "detail"):
+            (self.shards_dir / directory).mkdir(parents=True, exist_ok=True)
+        listings = {}
+        details = {}
+        touched = set()
+        pages = {}
+        for product in products:
+            product_id = str(product["id"])
+            if changed is None or product_id in changed or product_id not in self.listings:
+                listing, detail = split_product(product)
+                path = _write_hashed(self.shards_dir / "detail", slugify(product_id), encode(detail)) if detail else None
+                touched.add(product_id)
+            else:
+                listing, path = self.listings[product_id], self.details[product_id]
+            listings[product_id], details[product_id] = listing, path
+            pages.setdefault(listing.get("category") or "", []).append(product_id)
+
+        listing_pages = []
+        entries = {}
+        for category, members in pages.items():
+            for start in range(0, len(members), LISTING_PAGE_SIZE):
+                page = start // LISTING_PAGE_SIZE + 1
+                chunk = tuple(members[start : start + LISTING_PAGE_SIZE])
+                previous = self.pages.get((category, page))
+                if previous and previous[0] == chunk and touched.isdisjoint(chunk):
+                    entry = previous[1]
+                else:
+                    payload = encode({"category": category, "page": page, "products": [listings[i] for i in chunk]})
+                    entry = {
+                        "category": category,
+                        "page": page,
+                        "path": _write_hashed(self.shards_dir / "listing", f"{slugify(category)}-{page}", payload),
+                        "products": len(chunk),
+                        "bytes": len(payload),
+                    }
+                entries[(category, page)] = (chunk, entry)
+                listing_pages.append(entry)
+
+        manifest = {
+            "version": SHARDS_VERSION,
+            "products": len(products),
+            "detail_fields": DETAIL_FIELDS,
+            "listing": listing_pages,
+            "details": {product_id: path for product_id, path in details.items() if path},
+        }
+        handle = tempfile.NamedTemporaryFile("wb", dir=self.shards_dir, prefix=".manifest.", delete=False)
+        try:
+            with handle:
+                handle.write(encode(manifest))
+            os.chmod(handle.name, 0o644)
+            os.replace(handle.name, self.shards_dir / "manifest.json")
+        except BaseException:
+            os.unlink(handle.name)
+            raise
+        self.listings, self.details, self.pages = listings, details, entries
+        self._remove_unlisted(manifest)
+        return manifest
+
+    def _remove_unlisted(self, manifest: dict):
+        listed = {page["path"] for page in manifest["listing"]} | set(manifest["details"].values())
+        for directory in ("listing", "detail"):
+            with os.scandir(self.shards_dir / directory) as entries:
+                for entry in entries:
+                    if f"{directory}/{entry.name}" not in listed:
+                        os.unlink(entry.path)
+
+
+def write_shards(products: list, shards_dir: Path) -> dict:
+    """Write listing pages, detail shards and the manifest; returns the manifest.
+
+    Shards from earlier builds that the new manifest does not name are
+    removed, so they do not pile up.
+    """
+    return ShardWriter(shards_dir).write(products)
+
+
+def load_manifest(shards_dir: Path) -> dict:
+    manifest = json.loads((shards_dir / "manifest.json").read_text(encoding="utf-8"))
+    if manifest.get("version") != SHARDS_VERSION:
+        raise ValueError(f"Unsupported shards version {manifest.get('version')!r} in {shards_dir}")
+    return manifest
+
+
+def load_listing(shards_dir: Path, manifest: dict) -> list:
+    products = []
+    for page in manifest["listing"]:
+        products.extend(json.loads((shards_dir / page["path"]).read_text(encoding="utf-8"))["products"])
+    return products
+
+
+def load_detail(shards_dir: Path, manifest: dict, product_id) -> dict:
+    path = manifest["details"].get(str(product_id))
+    return json.loads((shards_dir / path).read_text(encoding="utf-8")) if path else {}
+
+
+def check_round_trip(json_path: Path, shards_dir: Path) -> bool:
+    products = json.loads(json_path.read_text(encoding="utf-8"))["products"]
+    manifest = load_manifest(shards_dir)
+    listing = {str(product["id"]): product for product in load_listing(shards_dir, manifest)}
+    mismatches = 0
+    for product in products:
+        merged = {**listing.get(str(product["id"]), {}), **load_detail(shards_dir, manifest, product["id"])}
+        if merged != product:
+            mismatches += 1
+            print(f"Mismatch: {product['id']}")
+    if len(listing) != len(products):
+        mismatches += 1
+        print(f"Listing holds {len(listing)} products, catalog {len(products)}")
+    print(f"Checked {len(products)} products: {mismatches} mismatches")
+    return mismatches == 0
+
+
+def _sizes(paths: list) -> tuple:
+    """Raw and gzipped bytes of ``paths`` fetched one by one."""
+    raw = zipped = 0
+    for path in paths:
+        payload = path.read_bytes()
+        raw += len(payload)
+        zipped += len(gzip.compress(payload, 9))
+    return raw, zipped
+
+
+def bundle_report(json_path: Path, shards_dir: Path) -> dict:
+    manifest = load_manifest(shards_dir)
+    full = _sizes([json_path])
+    first = _sizes([shards_dir / "manifest.json"] + [shards_dir / page["path"] for page in manifest["listing"]])
+    details = [_sizes([shards_dir / path]) for path in manifest["details"].values()]
+    return {
+        "full_catalog": full,
+        "first_results": first,
+        "requests_to_first_results": 1 + len(manifest["listing"]),
+        "detail_median": tuple(int(statistics.median(sizes[i] for sizes in details)) for i in (0, 1)),
+        "detail_max": tuple(max(sizes[i] for sizes in details) for i in (0, 1)),
+    }
+
+
+def print_report(report: dict):
+    full_raw, full_zipped = report["full_catalog"]
+    print(f"{'':<26} {'raw bytes':>12} {'gzip bytes':>12}")
+    rows = [
+        ("full catalog", report["full_catalog"]),
+        (f"first results ({report['requests_to_first_results']} files)", report["first_results"]),
+        ("detail shard, median", report["detail_median"]),
+        ("detail shard, max", report["detail_max"]),
+    ]
+    for label, (raw, zipped) in rows:
+        print(f"{label:<26} {raw:>12} {zipped:>12}")
+    first_raw, first_zipped = report["first_results"]
+    print(
+        f"First results need {100 * (1 - first_raw / full_raw):.0f}% fewer bytes "
+        f"({100 * (1 - first_zipped / full_zipped):.0f}% gzipped)"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Write, check or measure the sharded catalog.")
+    parser.add_argument("command", choices=("write", "check", "report"))
+    parser.add_argument("paths", nargs="*", help="catalog JSON and shards directory")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    json_path = Path(args.paths[0]) if args.paths else DEFAULT_JSON_PATH
+    shards_dir = Path(args.paths[1]) if len(args.paths) > 1 else shards_dir_for(json_path)
+    if args.command == "write":
+        products = json.loads(json_path.read_text(encoding="utf-8"))["products"]
+        manifest = write_shards(products, shards_dir)
+        pages, details = len(manifest["listing"]), len(manifest["details"])
+        print(f"Wrote {pages} listing pages and {details} detail shards to {shards_dir}")
+    elif args.command == "check":
+        raise SystemExit(0 if check_round_trip(json_path, shards_dir) else 1)
+    else:
+        print_report(bundle_report(json_path, shards_dir))
+
+
+if __name__ == "__main__":
+    main()
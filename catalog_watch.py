@@ -0,0 +1,798 @@
+#!/usr/bin/env python3
+"""Keep the catalog outputs current while the CSV feed and image directory change.
+
+``catalog_adapter.py --watch`` builds once and then polls the mtimes of the
+feed and of every image directory. A burst of edits is debounced. Once
+nothing has changed for ``--debounce`` seconds, ``CatalogWatcher.refresh``
+rebuilds only the products whose rows or images changed:
+
+- ``FeedSnapshot`` holds the feed as segments of about ``SEGMENT_BYTES``,
+  each starting on a record boundary. Segments that still match the file at
+  the same offset from its start or its end are kept. Only the bytes
+  between them are parsed again.
+- While the name order is unchanged, products keep their ids. Ingredient ids,
+  related lists, search postings, encoded catalog entries and shards are
+  then updated for the changed products only. An edit that renumbers
+  products (a new, removed or renamed product) rebuilds these from
+  per-product caches instead of from the rows.
+
+Every output is written to a temp file and renamed over the old one. Then
+``<output>.generation`` is bumped, which server.js and catalog_query.py
+poll to reload:
+
+    python3 catalog_adapter.py --watch
+    python3 catalog_watch.py check                   # random edits vs a full build after each
+    python3 catalog_watch.py compare --rows 100000   # refresh time per edit on a synthetic feed
+"""
+import argparse
+import bisect
+import collections
+import contextlib
+import csv
+import io
+import mmap
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from catalog_adapter import (
+    CSV_PATH,
+    IMAGES_ROOT,
+    DerivationCache,
+    build,
+    build_fingerprint,
+    build_group,
+    build_image_index,
+    build_incremental,
+    build_ingredient_index,
+    bump_generation,
+    clear_vocabularies,
+    compact,
+    derivation_cache_path_for,
+    encode_products,
+    flush_derivation_cache,
+    hash_row,
+    hash_text,
+    ingredient_index_path_for,
+    load_previous_build,
+    normalize_inline,
+    parse_args,
+    prime_text,
+    product_ingredients,
+    related_features,
+    related_lists,
+    rename_columns,
+    row_key,
+    search_entry,
+    search_index_document,
+    search_index_path_for,
+    search_postings,
+    set_derivation_cache,
+    set_ingredient_ids,
+    set_normalizer,
+    set_prompt_summary,
+    set_related,
+    write_encoded,
+    write_ingredient_index,
+    write_manifest,
+    write_search_index,
+)
+from catalog_shards import ShardWriter, shards_dir_for
+from csv_chunks import as_dicts, next_record, record_boundaries
+
+SEGMENT_BYTES = 64 * 1024
+POLL_SECONDS = 0.5
+EDITS = ["price", "description", "rating", "multiline", "rename", "duplicate", "delete", "move"]
+CHECK_SEGMENT_BYTES = 4096
+
+
+class Segment:
+    """Whole records of the feed: their bytes, their rows and each row's product key."""
+
+    def __init__(self, data: bytes, rows: list):
+        self.data = data
+        self.rows = rows
+        self.keys = [row_key(row) for row in rows]
+
+
+def _matches(segment: Segment, view: memoryview, position: int) -> bool:
+    window = view[position : position + len(segment.data)]
+    return len(window) == len(segment.data) and segment.data.startswith(window)
+
+
+class FeedSnapshot:
+    """The feed's header and rows as ``Segment``s, compared against the file on every ``refresh``.
+
+    A feed whose header is not one clean record, or whose changed bytes
+    cannot be parsed on their own, is read again whole, the way
+    ``read_rows`` reads it.
+    """
+
+    def __init__(self, path: Path, segment_bytes: int = SEGMENT_BYTES):
+        self.path = Path(path)
+        self.segment_bytes = segment_bytes
+        self.header = None
+        self.fieldnames = []
+        self.segments = []
+
+    def load(self) -> list:
+        """Parse the whole feed; returns its segments."""
+        data = self.path.read_bytes()
+        header_end = next_record(data, 0)[0]
+        self.header = data[:header_end]
+        try:
+            header = list(csv.reader(io.StringIO(self.header.decode("utf-8"), newline=""), strict=True))
+        except csv.Error:
+            header = []
+        if len(header) == 1:
+            self.fieldnames = rename_columns(header[0])
+            try:
+                self.segments = self._parse(data[header_end:])
+                return self.segments
+            except csv.Error:
+                pass
+        self.header = None
+        reader = csv.DictReader(io.StringIO(data.decode("utf-8"), newline=""))
+        if reader.fieldnames:
+            reader.fieldnames = rename_columns(reader.fieldnames)
+        self.segments = [Segment(data, list(reader))]
+        return self.segments
+
+    def _parse(self, data: bytes) -> list:
+        """Segments of ``data``; raises ``csv.Error`` if a split lands inside a quoted cell."""
+        boundaries = record_boundaries(data, 0, self.segment_bytes)
+        segments = []
+        for start, end in zip(boundaries, boundaries[1:]):
+            if start < end:
+                chunk = data[start:end]
+                rows = csv.reader(io.StringIO(chunk.decode("utf-8"), newline=""), strict=True)
+                segments.append(Segment(chunk, list(as_dicts(rows, self.fieldnames))))
+        return segments
+
+    def _reload(self) -> tuple:
+        removed = self.segments
+        return removed, self.load()
+
+    def refresh(self):
+        """Re-read the feed; returns ``(removed, added)`` segments, or None if its bytes are unchanged."""
+        with open(self.path, "rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            if self.header is None or size < len(self.header) or not size:
+                return self._reload()
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                view = memoryview(data)
+                try:
+                    return self._splice(view, size)
+                finally:
+                    view.release()
+
+    def _splice(self, view: memoryview, size: int):
+        if not self.header.startswith(view[: len(self.header)]):
+            return self._reload()
+        segments = self.segments
+        first, start = 0, len(self.header)
+        while first < len(segments) and _matches(segments[first], view, start):
+            start += len(segments[first].data)
+            first += 1
+        if first == len(segments) and start == size:
+            return None
+        if first and first == len(segments) and not segments[-1].data.endswith(b"\n"):
+            # The last record had no final newline, so new bytes may continue it.
+            first -= 1
+            start -= len(segments[first].data)
+        last, end = len(segments), size
+        while last > first and end - len(segments[last - 1].data) >= start:
+            if not _matches(segments[last - 1], view, end - len(segments[last - 1].data)):
+                break
+            last -= 1
+            end -= len(segments[last].data)
+        # The changed bytes must end a record outside quotes for the kept segments after them to still parse.
+        region = bytes(view[start:end])
+        while last < len(segments) and region and not (region.endswith(b"\n") and region.count(b'"') % 2 == 0):
+            region += segments[last].data
+            last += 1
+        try:
+            added = self._parse(region)
+        except csv.Error:
+            return self._reload()
+        removed = segments[first:last]
+        segments[first:last] = added
+        return removed, added
+
+
+class CatalogWatcher:
+    """In-memory build state for ``--watch``: the feed's rows by product key, and each output's per-product parts."""
+
+    def __init__(self, args, segment_bytes: int = SEGMENT_BYTES):
+        self.args = args
+        self.feed = FeedSnapshot(args.csv, segment_bytes)
+        self.image_index = {}
+        self.segments_by_key = {}
+        self.order = []
+        self.products = {}
+        self.ingredient_names = {}
+        self.ingredient_counts = collections.Counter()
+        self.ingredient_ids = {}
+        self.ingredient_index = None
+        self.features = {}
+        self.related = {}
+        self.search_entries = {}
+        self.postings = {}
+        self.facets = {}
+        self.encoded = {}
+        self.shards = ShardWriter(shards_dir_for(args.output)) if args.format == "json" else None
+        self.generation = 0
+
+    def start(self) -> dict:
+        """Build every product, reusing the last build's output when its manifest still matches."""
+        self.image_index = build_image_index(self.args.images, use_cache=not self.args.full)
+        fingerprint = build_fingerprint(self.image_index)
+        previous = None
+        if not self.args.full and self.args.format == "json":
+            previous = load_previous_build(self.args.output, fingerprint)
+        self._index_segments([], self.feed.load())
+        positions = self.positions()
+        groups = {key: self.rows_for(key, positions) for key in self.first_appearance()}
+        built, row_hashes, key_hashes, stats = build_incremental(
+            groups, self.image_index, previous or {}, self.args.workers
+        )
+        self.publish(built)
+        if self.args.format == "json":
+            write_manifest(self.args.output, fingerprint, self.finalized(), row_hashes, key_hashes)
+        set_normalizer(self.args.normalizer)
+        clear_vocabularies()
+        flush_derivation_cache()
+        return stats
+
+    def close(self, save: bool = True):
+        """Leave a build manifest for the current output, so the next build reuses its products.
+
+        ``save=False`` leaves none, for a watcher whose last refresh failed
+        part-way: its rows and products may no longer match the output.
+        """
+        if not save or self.args.format != "json" or not self.generation:
+            return
+        positions = self.positions()
+        row_hashes = {key: [hash_row(row) for row in self.rows_for(key, positions)] for key in self.order}
+        key_hashes = {key: hash_text("".join(hashes)) for key, hashes in row_hashes.items()}
+        fingerprint = build_fingerprint(self.image_index)
+        write_manifest(self.args.output, fingerprint, self.finalized(), row_hashes, key_hashes)
+
+    def finalized(self) -> list:
+        return [(key, self.products[key]) for key in self.order]
+
+    def signature(self) -> tuple:
+        """Stat of the feed and mtimes of every image directory; any change means there may be work."""
+        found = []
+        try:
+            stat = os.stat(self.args.csv)
+            found.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        except OSError:
+            found.append(None)
+        for directory, _, _ in os.walk(self.args.images):
+            with contextlib.suppress(OSError):
+                found.append((directory, os.stat(directory).st_mtime_ns))
+        return tuple(found)
+
+    def _index_segments(self, removed: list, added: list):
+        for segment in removed:
+            for key in segment.keys:
+                segments = self.segments_by_key.get(key)
+                if segments is not None:
+                    segments.discard(segment)
+                    if not segments:
+                        del self.segments_by_key[key]
+        for segment in added:
+            for key in segment.keys:
+                if key:
+                    self.segments_by_key.setdefault(key, set()).add(segment)
+
+    def positions(self) -> dict:
+        return {segment: position for position, segment in enumerate(self.feed.segments)}
+
+    def rows_for(self, key, positions: dict) -> list:
+        """A key's rows in file order; ``positions`` maps each segment to its place in the feed."""
+        segments = self.segments_by_key.get(key, ())
+        if len(segments) > 1:
+            segments = sorted(segments, key=positions.__getitem__)
+        return [row for segment in segments for row, row_key in zip(segment.rows, segment.keys) if row_key == key]
+
+    def first_appearance(self) -> list:
+        return list(dict.fromkeys(key for segment in self.feed.segments for key in segment.keys if key))
+
+    def _keys_with_images(self, names: set) -> set:
+        keys = set()
+        for segment in self.feed.segments:
+            for row, key in zip(segment.rows, segment.keys):
+                saved_to = normalize_inline(row.get("URL_Saved_To"))
+                if key and saved_to and Path(saved_to).name in names:
+                    keys.add(key)
+        return keys
+
+    def refresh(self) -> dict:
+        """Fold feed and image changes into the outputs; returns what changed and per-phase seconds."""
+        started = time.perf_counter()
+        positions = self.positions()
+        changes = self.feed.refresh()
+        keys = set()
+        old_rows = {}
+        if changes:
+            removed, added = changes
+            keys = {key for segment in removed for key in segment.keys if key}
+            old_rows = {key: self.rows_for(key, positions) for key in keys}
+            self._index_segments(removed, added)
+            keys |= {key for segment in added for key in segment.keys if key}
+        positions = self.positions()
+        rows_by_key = {key: self.rows_for(key, positions) for key in keys}
+        rows_by_key = {key: rows for key, rows in rows_by_key.items() if rows != old_rows.get(key)}
+        image_index = build_image_index(self.args.images)
+        if image_index != self.image_index:
+            names = {name for name in image_index.keys() | self.image_index.keys()
+                     if image_index.get(name) != self.image_index.get(name)}
+            self.image_index = image_index
+            for key in self._keys_with_images(names) - rows_by_key.keys():
+                rows_by_key[key] = self.rows_for(key, positions)
+        read = time.perf_counter()
+
+        prime_text([row for rows in rows_by_key.values() for row in rows])
+        built = {key: build_group(rows, self.image_index) if rows else None for key, rows in rows_by_key.items()}
+        # The text memo only speeds up one batch; dropping it keeps memory flat between rebuilds.
+        set_normalizer(self.args.normalizer)
+        rebuilt = time.perf_counter()
+        stats = self.publish(built)
+        # Interned values only serve one batch too; kept, they would retain every value ever deleted or edited.
+        clear_vocabularies()
+        # Flushed per batch, as the streaming build does per chunk: the size bound holds and a kill loses one batch.
+        flush_derivation_cache()
+        stats["seconds"].update(read=read - started, build=rebuilt - read, total=time.perf_counter() - started)
+        return stats
+
+    def publish(self, built: dict) -> dict:
+        """Fold rebuilt products (None for a removed key) into every output, then bump the generation."""
+        args = self.args
+        started = time.perf_counter()
+        previous = {key: self.products.pop(key, None) for key in built}
+        removed = [key for key, product in built.items() if product is None]
+        order = sorted(
+            self.first_appearance(),
+            key=lambda key: (built.get(key) or self.products[key]).get("name", ""),
+        )
+        renumbered = order != self.order
+        dirty = set()
+        for ordinal, key in enumerate(order):
+            product_id = f"{args.id_prefix}{ordinal + 1}"
+            if key in built:
+                built[key]["id"] = product_id
+                self.products[key] = compact(set_prompt_summary(built[key], args.prompt_tokens))
+                dirty.add(key)
+            elif self.products[key]["id"] != product_id:
+                self.products[key]["id"] = product_id
+                dirty.add(key)
+
+        ingredients_changed = self._link_ingredients(built, order, renumbered, dirty)
+        self._link_related(built, order, renumbered, dirty)
+        search_changed = self._update_search(built, order, renumbered)
+        for key in removed:
+            self.encoded.pop(key, None)
+        dirty -= {key for key in built if key in self.products and self.products[key] == previous[key]}
+        self.order = order
+        linked = time.perf_counter()
+
+        stats = {"rebuilt": len(built) - len(removed), "removed": len(removed), "renumbered": renumbered}
+        if not dirty and not removed and self.generation:
+            stats.update(generation=self.generation, seconds={"link": linked - started, "write": 0.0})
+            return stats
+        for key in dirty:
+            self.encoded[key] = next(encode_products([self.products[key]], args.format, args.serializer, args.compact))
+        write_encoded((self.encoded[key] for key in order), args.output, args.format, args.compact)
+        if search_changed or not search_index_path_for(args.output).exists():
+            index = search_index_document([self.products[key]["id"] for key in order], self.postings, self.facets)
+            write_search_index(index, args.output, args.serializer)
+        if ingredients_changed or not ingredient_index_path_for(args.output).exists():
+            write_ingredient_index(self.ingredient_index, args.output, args.serializer)
+        if self.shards is not None:
+            changed = None if renumbered else {str(self.products[key]["id"]) for key in dirty}
+            self.shards.write([self.products[key] for key in order], changed)
+        self.generation = bump_generation(args.output)
+        stats.update(
+            generation=self.generation, seconds={"link": linked - started, "write": time.perf_counter() - linked}
+        )
+        return stats
+
+    def _link_ingredients(self, built: dict, order: list, renumbered: bool, dirty: set) -> bool:
+        """Ingredient ids are positions in the sorted vocabulary, so they only move when it changes."""
+        changed = renumbered
+        vocabulary_changed = False
+        for key in built:
+            old = self.ingredient_names.pop(key, None)
+            names = product_ingredients(self.products[key]) if key in self.products else None
+            changed = changed or names != old
+            for name in set(old or ()):
+                self.ingredient_counts[name] -= 1
+                if not self.ingredient_counts[name]:
+                    del self.ingredient_counts[name]
+                    vocabulary_changed = True
+            for name in set(names or ()):
+                vocabulary_changed = vocabulary_changed or name not in self.ingredient_counts
+                self.ingredient_counts[name] += 1
+            if names is not None:
+                self.ingredient_names[key] = names
+        if vocabulary_changed:
+            self.ingredient_ids = {name: position for position, name in enumerate(sorted(self.ingredient_counts))}
+        for key in order:
+            product = self.products[key]
+            names = self.ingredient_names[key]
+            if key in built:
+                set_ingredient_ids(product, names, self.ingredient_ids)
+            elif vocabulary_changed and names:
+                ids = [self.ingredient_ids[name] for name in names]
+                if ids != product["ingredient_ids"]:
+                    # Assigned in place so the field keeps its position ahead of the related lists.
+                    product["ingredient_ids"] = ids
+                    dirty.add(key)
+        if changed or vocabulary_changed:
+            self.ingredient_index = build_ingredient_index(
+                [(self.products[key]["id"], self.ingredient_names[key]) for key in order]
+            )
+        return changed or vocabulary_changed
+
+    def _link_related(self, built: dict, order: list, renumbered: bool, dirty: set):
+        changed = renumbered
+        for key in built:
+            old = self.features.pop(key, None)
+            feature = related_features(self.products[key]) if key in self.products else None
+            if feature is not None:
+                self.features[key] = feature
+            changed = changed or feature != old
+        if not changed:
+            for key in built:
+                if key in self.products:
+                    set_related(self.products[key], self.related[key])
+            return
+        for key in order:
+            self.features[key]["id"] = self.products[key]["id"]
+        self.related = dict(zip(order, related_lists([self.features[key] for key in order])))
+        for key in order:
+            product = self.products[key]
+            lists = self.related[key]
+            if key in built or any(product.get(field, []) != ids for field, ids in lists.items()):
+                set_related(product, lists)
+                dirty.add(key)
+
+    def _update_search(self, built: dict, order: list, renumbered: bool) -> bool:
+        """Patch the postings of products that kept their ordinal; a renumbering rebuilds them from the entries."""
+        changed = renumbered
+        updates = []
+        for key in built:
+            old = self.search_entries.pop(key, None)
+            entry = search_entry(self.products[key]) if key in self.products else None
+            if entry is not None:
+                self.search_entries[key] = entry
+            if entry != old:
+                changed = True
+                updates.append((key, old, entry))
+        if renumbered:
+            self.postings, self.facets = search_postings([self.search_entries[key] for key in order])
+            return True
+        ordinals = {key: ordinal for ordinal, key in enumerate(order)} if updates else {}
+        for key, old, entry in updates:
+            self._patch_postings(ordinals[key], old, entry)
+        return changed
+
+    def _patch_postings(self, ordinal: int, old: tuple, entry: tuple):
+        old_flags, old_facets = old
+        flags, facets = entry
+        for token in old_flags.keys() - flags.keys():
+            pairs = self.postings[token]
+            slot = _posting_slot(pairs, ordinal)
+            del pairs[slot : slot + 2]
+            if not pairs:
+                del self.postings[token]
+        for token, mask in flags.items():
+            if old_flags.get(token) == mask:
+                continue
+            pairs = self.postings.setdefault(token, [])
+            slot = _posting_slot(pairs, ordinal)
+            if slot < len(pairs) and pairs[slot] == ordinal:
+                pairs[slot + 1] = mask
+            else:
+                pairs[slot:slot] = (ordinal, mask)
+        for facet, label in set(old_facets) - set(facets):
+            members = self.facets[facet][label]
+            members.remove(ordinal)
+            if not members:
+                del self.facets[facet][label]
+        for facet, label in set(facets) - set(old_facets):
+            bisect.insort(self.facets[facet].setdefault(label, []), ordinal)
+
+
+def _posting_slot(pairs: list, ordinal: int) -> int:
+    """Index of ``ordinal`` in a flat ``[ordinal, flags, ...]`` list, or where its pair would go."""
+    low, high = 0, len(pairs) // 2
+    while low < high:
+        middle = (low + high) // 2
+        if pairs[2 * middle] < ordinal:
+            low = middle + 1
+        else:
+            high = middle
+    return 2 * low
+
+
+def describe(stats: dict) -> str:
+    seconds = stats["seconds"]
+    phases = ", ".join(f"{phase} {seconds[phase]:.3f}" for phase in ("read", "build", "link", "write"))
+    renumbered = ", renumbered" if stats["renumbered"] else ""
+    return (
+        f"generation {stats['generation']}: {stats['rebuilt']} rebuilt, {stats['removed']} removed{renumbered} "
+        f"in {seconds['total']:.3f}s ({phases})"
+    )
+
+
+def start_watcher(args, started: float):
+    """A new ``CatalogWatcher`` after its first build, which is reported."""
+    watcher = CatalogWatcher(args)
+    stats = watcher.start()
+    print(
+        f"Wrote {len(watcher.order)} products to {args.output} ({stats['rebuilt']} rebuilt, {stats['reused']} reused) "
+        f"in {time.perf_counter() - started:.1f}s, generation {watcher.generation}; watching {args.csv} and {args.images}"
+    )
+    return watcher
+
+
+def restart_watcher(args):
+    """``start_watcher`` after a failure, or None if it fails too; the caller retries on the next poll."""
+    try:
+        return start_watcher(args, time.perf_counter())
+    except Exception as error:
+        print(f"Build failed, retrying: {type(error).__name__}: {error}")
+        return None
+
+
+def watch(args):
+    """Build, then rebuild after every settled change to the feed or image directory until interrupted."""
+    watcher = start_watcher(args, time.perf_counter())
+    seen = watcher.signature()
+    try:
+        while True:
+            time.sleep(POLL_SECONDS)
+            if watcher is None:
+                watcher = restart_watcher(args)
+                seen = watcher.signature() if watcher else None
+                continue
+            current = watcher.signature()
+            if current == seen:
+                continue
+            # Wait out a burst of saves so it becomes one rebuild.
+            while True:
+                time.sleep(args.debounce)
+                settled = watcher.signature()
+                if settled == current:
+                    break
+                current = settled
+            seen = current
+            try:
+                print(f"Rebuilt {describe(watcher.refresh())}")
+            except Exception as error:
+                # A half-written feed can fail in many ways. State may be half-applied, so the watcher is
+                # dropped without a manifest and a new one rebuilds everything from the files.
+                print(f"Rebuild failed, keeping the last outputs: {type(error).__name__}: {error}")
+                watcher.close(save=False)
+                watcher = restart_watcher(args)
+                seen = watcher.signature() if watcher else None
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+
+def split_records(data: bytes) -> list:
+    """Whole records of ``data``, each with its line ending."""
+    records = []
+    position = 0
+    while position < len(data):
+        end = next_record(data, position)[0]
+        records.append(data[position:end])
+        position = end
+    return records
+
+
+def edit_record(record: bytes, fieldnames: list, changes: dict) -> bytes:
+    """``record`` with ``changes[column](cell)`` applied, re-quoted by the ``csv`` module."""
+    cells = next(csv.reader(io.StringIO(record.decode("utf-8"), newline="")))
+    for column, change in changes.items():
+        position = fieldnames.index(column)
+        cells[position] = change(cells[position])
+    ending = "\r\n" if record.endswith(b"\r\n") else "\n"
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator=ending).writerow(cells)
+    text = buffer.getvalue()
+    return (text if record.endswith(b"\n") else text[: -len(ending)]).encode("utf-8")
+
+
+def pick_record(watcher: CatalogWatcher, rng: random.Random, first_row: bool) -> tuple:
+    """``(segment, record)`` indexes of a random record, or of a random product's first row.
+
+    Only a product's first row sets most of its fields, so edits elsewhere may publish nothing.
+    """
+    segments = watcher.feed.segments
+    if not first_row:
+        segment = rng.randrange(len(segments))
+        return segment, rng.randrange(len(split_records(segments[segment].data)))
+    key = rng.choice(watcher.order)
+    positions = watcher.positions()
+    segment = min(watcher.segments_by_key[key], key=positions.__getitem__)
+    # Blank records have no row, so the row index is counted over the others.
+    records = [number for number, record in enumerate(split_records(segment.data)) if record.strip(b"\r\n")]
+    return positions[segment], records[segment.keys.index(key)]
+
+
+def edit_feed(path: Path, watcher: CatalogWatcher, rng: random.Random, kind: str, first_row: bool = False):
+    """Write the watched feed back to ``path`` with one ``kind`` edit (see ``EDITS``) to a single record."""
+    feed = watcher.feed
+    chunks = [segment.data for segment in feed.segments]
+    segment, position = pick_record(watcher, rng, first_row)
+    records = split_records(chunks[segment])
+    record = records[position]
+    ingredient = rng.choice(["retinol", "SPF 30", "hyaluronic acid"])
+    changes = {
+        "price": {"price_current": lambda cell: f"${rng.randint(5, 300)}.00"},
+        "description": {"Description": lambda cell: f"{cell} Now with {ingredient}."},
+        "rating": {"star_rating": lambda cell: str(rng.randint(1, 5))},
+        "multiline": {"how_to_use": lambda cell: f'{cell}\n"Shake" well,\nthen apply.'},
+        "rename": {"product_title": lambda cell: f"{cell.strip()} II", "Name": lambda cell: f"{cell.strip()} II"},
+        "duplicate": {"Name_URL": lambda cell: f"{cell}#copy-{rng.randrange(10**6)}"},
+    }
+    if kind == "duplicate":
+        copy = edit_record(record, feed.fieldnames, changes[kind])
+        records.insert(position, copy if copy.endswith(b"\n") else copy + b"\n")
+    elif kind in ("delete", "move"):
+        del records[position]
+    else:
+        records[position] = edit_record(record, feed.fieldnames, changes[kind])
+    chunks[segment] = b"".join(records)
+    if kind == "move" and record.endswith(b"\n"):
+        target = rng.randrange(len(chunks))
+        moved = split_records(chunks[target])
+        # Inserted ahead of a record, so a final record without a newline stays last.
+        moved.insert(rng.randrange(len(moved)) if moved else 0, record)
+        chunks[target] = b"".join(moved)
+    path.write_bytes(feed.header + b"".join(chunks))
+
+
+def link_images(source: Path, target: Path) -> Path:
+    """Mirror ``source`` as directories of symlinks, so images can be removed without touching it."""
+    for directory, _, files in os.walk(source):
+        mirrored = target / Path(directory).relative_to(source)
+        mirrored.mkdir(parents=True, exist_ok=True)
+        for name in files:
+            os.symlink(Path(directory, name).absolute(), mirrored / name)
+    return target
+
+
+def same_outputs(left: Path, right: Path) -> list:
+    """Names of the outputs of two builds whose bytes differ."""
+    differ = []
+    for name, path_for in (("catalog", Path), ("search index", search_index_path_for),
+                           ("ingredient index", ingredient_index_path_for)):
+        if path_for(left).read_bytes() != path_for(right).read_bytes():
+            differ.append(name)
+    files = [sorted(str(path.relative_to(directory)) for path in directory.rglob("*"))
+             for directory in (shards_dir_for(left), shards_dir_for(right))]
+    if files[0] != files[1] or any(
+        (shards_dir_for(left) / name).read_bytes() != (shards_dir_for(right) / name).read_bytes()
+        for name in files[0] if (shards_dir_for(left) / name).is_file()
+    ):
+        differ.append("shards")
+    return differ
+
+
+def check(edits: int = 60, seed: int = 0, cache_mb: float = 0) -> int:
+    """Apply random feed and image edits under a watcher and compare every output with a full build; returns mismatches.
+
+    With ``cache_mb``, the watcher runs with a derivation cache of that size,
+    which must be flushed after every refresh.
+    """
+    rng = random.Random(seed)
+    mismatches = 0
+    with tempfile.TemporaryDirectory(prefix="catalog-watch-") as tmp_dir, contextlib.ExitStack() as stack:
+        tmp = Path(tmp_dir)
+        feed = tmp / "feed.csv"
+        shutil.copyfile(CSV_PATH, feed)
+        images = link_images(IMAGES_ROOT, tmp / "images")
+        common = ["--csv", str(feed), "--images", str(images), "--derivation-cache-mb", "0"]
+        args = parse_args([*common, "--output", str(tmp / "watch.json"), "--watch"])
+        cache = None
+        if cache_mb > 0:
+            cache = DerivationCache(derivation_cache_path_for(args.output), int(cache_mb * 2**20))
+            stack.callback(cache.close)
+        stack.callback(set_derivation_cache, set_derivation_cache(cache))
+        watcher = CatalogWatcher(args, CHECK_SEGMENT_BYTES)
+        watcher.start()
+        hidden = []
+        kinds = collections.Counter()
+        for number in range(edits):
+            kind = rng.choice([*EDITS, "image"])
+            kinds[kind] += 1
+            if kind == "image":
+                if hidden and rng.random() < 0.5:
+                    os.symlink(*hidden.pop(rng.randrange(len(hidden))))
+                else:
+                    link = rng.choice([path for path in images.rglob("*") if path.is_symlink()])
+                    hidden.append((os.readlink(link), link))
+                    link.unlink()
+            else:
+                edit_feed(feed, watcher, rng, kind, first_row=rng.random() < 0.5)
+            stats = watcher.refresh()
+            reference = tmp / "full.json"
+            # The reference derives every field afresh, without the watcher's cache.
+            set_derivation_cache(None)
+            with contextlib.redirect_stdout(io.StringIO()):
+                build(parse_args([*common, "--output", str(reference), "--full"]))
+            set_derivation_cache(cache)
+            differ = same_outputs(args.output, reference)
+            if cache is not None and (cache.added or cache.touched):
+                differ.append("derivation cache (not flushed)")
+            if differ:
+                mismatches += 1
+                print(f"Mismatch after edit {number} ({kind}): {', '.join(differ)} differ; {describe(stats)}")
+        if cache is not None:
+            print(cache.report(cache.flush()))
+    summary = ", ".join(f"{count} {kind}" for kind, count in sorted(kinds.items()))
+    print(f"Checked {edits} edits ({summary}) against full builds: {mismatches} mismatches")
+    return mismatches
+
+
+def compare(rows: int, edits: int, seed: int = 0):
+    """Seconds per ``refresh`` after edits to a product's first row in a synthetic feed of ``rows`` rows."""
+    from benchmarks.synthetic import write_synthetic_csv
+
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory(prefix="catalog-watch-") as tmp_dir:
+        feed = write_synthetic_csv(Path(tmp_dir) / "feed.csv", rows, seed)
+        args = parse_args([
+            "--csv", str(feed), "--output", str(Path(tmp_dir) / "catalog.json"), "--derivation-cache-mb", "0", "--watch",
+        ])
+        started = time.perf_counter()
+        watcher = CatalogWatcher(args)
+        watcher.start()
+        print(
+            f"{rows} rows, {feed.stat().st_size / 2**20:.0f} MB, {len(watcher.order)} products, "
+            f"{len(watcher.feed.segments)} segments; first build {time.perf_counter() - started:.1f}s"
+        )
+        print(f"{'edit':<12} {'median s':>9} {'max s':>7} {'read':>6} {'build':>6} {'link':>6} {'write':>6} renumbered")
+        for kind in EDITS:
+            results = []
+            for _ in range(edits):
+                edit_feed(feed, watcher, rng, kind, first_row=True)
+                results.append(watcher.refresh())
+            totals = [result["seconds"]["total"] for result in results]
+            phases = " ".join(
+                f"{statistics.median(result['seconds'][phase] for result in results):>6.3f}"
+                for phase in ("read", "build", "link", "write")
+            )
+            renumbered = sum(result["renumbered"] for result in results)
+            print(f"{kind:<12} {statistics.median(totals):>9.3f} {max(totals):>7.3f} {phases} {renumbered}/{edits}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check or benchmark incremental --watch rebuilds.")
+    parser.add_argument("command", choices=("check", "compare"))
+    parser.add_argument("--edits", type=int, default=None, help="edits to check, or per kind to compare")
+    parser.add_argument("--rows", type=int, default=100000, help="synthetic feed rows for compare")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--derivation-cache-mb", type=float, default=0, help="check with the watcher's derivation cache at this size"
+    )
+    args = parser.parse_args(argv)
+    if args.command == "check":
+        raise SystemExit(1 if check(args.edits or 60, args.seed, args.derivation_cache_mb) else 0)
+    compare(args.rows, args.edits or 5, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 """Remove 'KEY BENEFITS' and variants from overview and overview_summary columns in the CSV."""
-import csv
 import re
 from pathlib import Path
 
+from csv_transforms import CleanColumns, run_pipeline
+
 ROOT = Path(__file__).resolve().parent
 CSV_PATH = ROOT / "Skincare _ SHISEIDO.csv"
 
@@ -49,36 +50,12 @@ def clean_key_benefits(text: str) -> str:
     return result
 
 
+def build_stage():
+    return CleanColumns(["overview", "overview_summary"], clean_key_benefits)
+
+
 def main():
-    with open(CSV_PATH, newline="", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        rows = list(reader)
-    if not rows:
-        return
-    header = rows[0]
-    try:
-        overview_idx = header.index("overview")
-        overview_summary_idx = header.index("overview_summary")
-    except ValueError as e:
-        print("Column not found:", e)
-        return
-    updated = 0
-    for row in rows[1:]:
-        if len(row) > max(overview_idx, overview_summary_idx):
-            if row[overview_idx]:
-                new_val = clean_key_benefits(row[overview_idx])
-                if new_val != row[overview_idx]:
-                    row[overview_idx] = new_val
-                    updated += 1
-            if row[overview_summary_idx]:
-                new_val = clean_key_benefits(row[overview_summary_idx])
-                if new_val != row[overview_summary_idx]:
-                    row[overview_summary_idx] = new_val
-                    updated += 1
-    with open(CSV_PATH, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerows(rows)
-    print(f"Done. Cleaned overview/overview_summary in {updated} cells.")
+    run_pipeline(CSV_PATH, [build_stage()])
 
 
 if __name__ == "__main__":
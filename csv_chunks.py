@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Parse a CSV feed in parallel byte-range chunks, with ``csv.DictReader`` results.
+
+Feed cells hold newlines, so a byte offset is only a safe split point when
+it follows a newline outside quotes. ``record_boundaries`` finds these
+points in one pass. It counts quote bytes between newlines with
+``bytes.count``, so the scan runs at close to memory speed. A newline is outside
+quotes when the number of quotes before it is even. Each chunk of about
+``CHUNK_BYTES`` is then decoded and parsed from its own ``mmap`` slice in a
+worker process. Chunks are yielded in file order, and only a few are in
+flight at once.
+
+Counting parity is exact for any file the ``csv`` module writes. A stray
+quote inside an unquoted cell is one the ``csv`` module reads as text but
+the parity scan would count. Workers parse with ``strict=True``, so the
+first chunk split inside a quoted cell raises. Its start offset is still
+exact, and the rest of the file is read sequentially from there:
+
+    python3 csv_chunks.py check             # pathological quoting and the real feed vs DictReader
+    python3 csv_chunks.py compare --rows 100000 --workers 1 2 4
+"""
+import argparse
+import collections
+import csv
+import io
+import itertools
+import mmap
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+CSV_PATH = ROOT / "Skincare _ SHISEIDO.csv"
+CHUNK_BYTES = 8 * 1024 * 1024
+IN_FLIGHT_PER_WORKER = 2
+CHECK_CHUNK_BYTES = [1, 2, 3, 5, 8, 13, 64, 1024]
+CHECK_CELLS = ["", " ", "a", "ab,c", '"', '""', 'say "hi"', "x\ny", "x\r\ny", "\r", "\n\n", "\t", "é", "日本", ","]
+CHECK_MALFORMED = [
+    'a,b\n1,x"y\n2,z\n',  # stray quote inside an unquoted cell
+    'a,b\n1,x"y\n2,"multi\nline"\n3,z\n',
+    'a,b\n1,"q"tail\n2,z\n',  # text after a closing quote
+    'a,b\n1,"never closed\n2,z\n',
+    'a,b\n1,"x""\n',
+    '"a\nb",c\n1,2\n',  # quoted newline in the header
+    "\na,b\n1,2\n",  # blank first line: no field names
+    "a,b\r1,2\r3,4\r",  # CR-only line endings
+    "a,b\n1,2,3\n4\n\n5,6",  # ragged rows, a blank line, no final newline
+    "",
+]
+
+
+def next_record(data, position: int, quotes: int = 0) -> tuple:
+    """``(offset, quotes)``: just past the first newline after ``position`` outside quotes, or ``len(data)``.
+
+    ``quotes`` is the number of quote bytes before ``position``, counted from a record start.
+    """
+    while True:
+        newline = data.find(b"\n", position)
+        if newline < 0:
+            return len(data), quotes
+        quotes += data[position:newline].count(b'"')
+        position = newline + 1
+        if quotes % 2 == 0:
+            return position, quotes
+
+
+def record_boundaries(data, start: int, chunk_bytes: int) -> list:
+    """Record starts from ``start`` to ``len(data)``, about ``chunk_bytes`` apart."""
+    boundaries = [start]
+    quotes = 0
+    position = start
+    while position + chunk_bytes < len(data):
+        target = position + chunk_bytes
+        # Slices copy, but mmap has no count(); each copy is one chunk at most.
+        quotes += data[position:target].count(b'"')
+        position, quotes = next_record(data, target, quotes)
+        if position < len(data):
+            boundaries.append(position)
+    boundaries.append(len(data))
+    return boundaries
+
+
+def parse_range(path, start: int, end: int) -> list:
+    """Rows of ``path[start:end]``; raises ``csv.Error`` if the range ends inside a quoted cell."""
+    with open(path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode("utf-8")
+    return list(csv.reader(io.StringIO(text, newline=""), strict=True))
+
+
+def as_dicts(rows, fieldnames: list):
+    """``csv.DictReader`` semantics: blank rows skipped, missing cells None, extra cells under the None key."""
+    width = len(fieldnames)
+    for row in rows:
+        if not row:
+            continue
+        record = dict(zip(fieldnames, row))
+        if len(row) > width:
+            record[None] = row[width:]
+        elif len(row) < width:
+            for name in fieldnames[len(row) :]:
+                record[name] = None
+        yield record
+
+
+class ChunkedDictReader:
+    """Drop-in for ``csv.DictReader(open(path, newline="", encoding="utf-8"))`` that parses chunks in parallel.
+
+    ``workers=1`` parses the chunks in this process, which is only useful to
+    test boundaries. ``fallback_offset`` is set when a chunk could not be
+    parsed alone and the rest of the file was read sequentially.
+    """
+
+    def __init__(self, path, workers: int = os.cpu_count() or 1, chunk_bytes: int = CHUNK_BYTES):
+        self.path = Path(path)
+        self.workers = workers
+        self.chunk_bytes = chunk_bytes
+        self.fallback_offset = None
+        self.fieldnames = None
+        self.boundaries = []
+        size = self.path.stat().st_size
+        if not size:
+            return
+        with open(self.path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header_end = next_record(data, 0)[0]
+            try:
+                header = list(csv.reader(io.StringIO(data[:header_end].decode("utf-8"), newline=""), strict=True))
+            except csv.Error:
+                header = []
+            if len(header) != 1:
+                # The header is not one clean record; the whole file is read sequentially.
+                self.boundaries = [0]
+                return
+            self.fieldnames = header[0]
+            self.boundaries = record_boundaries(data, header_end, chunk_bytes)
+
+    def _sequential(self, start: int):
+        with open(self.path, "rb") as handle:
+            handle.seek(start)
+            reader = csv.reader(io.TextIOWrapper(handle, encoding="utf-8", newline=""))
+            if self.fieldnames is None:
+                self.fieldnames = next(reader, None)
+                if self.fieldnames is None:
+                    return
+            yield from as_dicts(reader, self.fieldnames)
+
+    def _chunks(self):
+        """Parsed chunks in order, then None and the offset to read on from if one failed."""
+        ranges = list(zip(self.boundaries, self.boundaries[1:]))
+        if self.workers <= 1 or len(ranges) < 2:
+            for start, end in ranges:
+                try:
+                    yield parse_range(self.path, start, end), None
+                except csv.Error:
+                    yield None, start
+                    return
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = collections.deque()
+            queued = iter(ranges)
+            for start, end in itertools.islice(queued, self.workers * IN_FLIGHT_PER_WORKER):
+                pending.append((start, pool.submit(parse_range, self.path, start, end)))
+            while pending:
+                start, future = pending.popleft()
+                try:
+                    rows = future.result()
+                except csv.Error:
+                    for _, later in pending:
+                        later.cancel()
+                    yield None, start
+                    return
+                for next_start, next_end in itertools.islice(queued, 1):
+                    pending.append((next_start, pool.submit(parse_range, self.path, next_start, next_end)))
+                yield rows, None
+
+    def __iter__(self):
+        if self.boundaries == [0]:
+            yield from self._sequential(0)
+            return
+        for rows, fallback in self._chunks():
+            if rows is None:
+                self.fallback_offset = fallback
+                yield from self._sequential(fallback)
+                return
+            yield from as_dicts(rows, self.fieldnames)
+
+
+def dict_reader_rows(path) -> tuple:
+    with open(path, newline="", encoding="utf-8") as handle:
+        reader = csv.DictReader(handle)
+        return reader.fieldnames, list(reader)
+
+
+def chunked_rows(path, workers: int, chunk_bytes: int) -> tuple:
+    reader = ChunkedDictReader(path, workers, chunk_bytes)
+    rows = list(reader)
+    return reader.fieldnames, rows, reader.fallback_offset
+
+
+def fuzz_document(rng: random.Random) -> str:
+    buffer = io.StringIO()
+    quoting = rng.choice([csv.QUOTE_MINIMAL, csv.QUOTE_ALL])
+    writer = csv.writer(buffer, quoting=quoting, lineterminator=rng.choice(["\n", "\r\n"]))
+    width = rng.randint(1, 4)
+    writer.writerow([f"col{index}" for index in range(width)])
+    for _ in range(rng.randint(0, 12)):
+        cells = width + rng.choice([0, 0, 0, -1, 1])
+        writer.writerow(["".join(rng.choices(CHECK_CELLS, k=rng.randint(0, 3))) for _ in range(max(cells, 0))])
+    return buffer.getvalue()
+
+
+def check(documents: int = 300, seed: int = 0) -> int:
+    """Compare against DictReader on fuzzed and malformed files at every chunk size; returns mismatches."""
+    rng = random.Random(seed)
+    texts = [fuzz_document(rng) for _ in range(documents)] + CHECK_MALFORMED
+    mismatches = fallbacks = 0
+    with tempfile.TemporaryDirectory(prefix="csv-chunks-") as tmp_dir:
+        path = Path(tmp_dir) / "feed.csv"
+        for number, text in enumerate(texts):
+            path.write_bytes(text.encode("utf-8"))
+            expected = dict_reader_rows(path)
+            for chunk_bytes in CHECK_CHUNK_BYTES:
+                fieldnames, rows, fallback = chunked_rows(path, 1, chunk_bytes)
+                fallbacks += fallback is not None
+                if (fieldnames, rows) != expected:
+                    mismatches += 1
+                    print(f"Mismatch: document {number} at {chunk_bytes}-byte chunks: {text[:80]!r}")
+        expected = dict_reader_rows(CSV_PATH)
+        for workers, chunk_bytes in ((1, 4096), (2, 64 * 1024)):
+            fieldnames, rows, _ = chunked_rows(CSV_PATH, workers, chunk_bytes)
+            if (fieldnames, rows) != expected:
+                mismatches += 1
+                print(f"Mismatch: {CSV_PATH.name} with {workers} workers at {chunk_bytes}-byte chunks")
+    print(
+        f"Checked {len(texts)} files at {len(CHECK_CHUNK_BYTES)} chunk sizes and the feed: "
+        f"{mismatches} mismatches, {fallbacks} sequential fallbacks"
+    )
+    return mismatches
+
+
+def compare(rows: int, workers_list: list, chunk_bytes: int, seed: int = 0):
+    """Rows/sec and MB/s of DictReader and the chunked reader on a synthetic feed."""
+    from benchmarks.synthetic import write_synthetic_csv
+
+    with tempfile.TemporaryDirectory(prefix="csv-chunks-") as tmp_dir:
+        path = write_synthetic_csv(Path(tmp_dir) / "feed.csv", rows, seed)
+        size_mb = path.stat().st_size / 2**20
+        print(f"{rows} rows, {size_mb:.0f} MB, {os.cpu_count()} CPUs")
+        print(f"{'reader':<18} {'seconds':>8} {'rows/sec':>10} {'MB/s':>7} identical")
+        started = time.perf_counter()
+        expected = dict_reader_rows(path)
+        elapsed = time.perf_counter() - started
+        print(f"{'DictReader':<18} {elapsed:>8.2f} {rows / elapsed:>10.0f} {size_mb / elapsed:>7.1f} -")
+        for workers in workers_list:
+            started = time.perf_counter()
+            reader = ChunkedDictReader(path, workers, chunk_bytes)
+            scan = time.perf_counter() - started
+            found = (reader.fieldnames, list(reader))
+            elapsed = time.perf_counter() - started
+            label = f"chunked x{workers}"
+            print(
+                f"{label:<18} {elapsed:>8.2f} {rows / elapsed:>10.0f} {size_mb / elapsed:>7.1f} "
+                f"{found == expected} (boundary scan {scan:.2f}s, {len(reader.boundaries) - 1} chunks)"
+            )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check or benchmark the parallel chunked CSV reader.")
+    parser.add_argument("command", choices=("check", "compare"))
+    parser.add_argument("--rows", type=int, default=100000, help="synthetic feed rows for compare")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument("--chunk-bytes", type=int, default=CHUNK_BYTES)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "check":
+        raise SystemExit(1 if check(seed=args.seed) else 0)
+    compare(args.rows, sorted(set(args.workers)), args.chunk_bytes, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""Single-pass column transform pipeline for Skincare _ SHISEIDO.csv.
+
+The column scripts (add_coupon_column.py, add_promotions_column.py,
+clean_overview_columns.py) each describe one stage. ``run_pipeline`` streams
+the CSV row by row through every stage and writes a temp file next to the
+source, which replaces the source with one atomic rename. Chaining the
+nightly scripts therefore costs one parse and one write, with memory bounded
+by a single row:
+
+    python3 csv_transforms.py                       # the nightly chain
+    python3 csv_transforms.py clean_overview_columns
+
+Stages that need the total row count up front (exact-count distributions)
+get it from a counting pass that parses the file without holding it. A
+seeded distribution also keeps one integer sort key per row from that pass.
+"""
+import argparse
+import bisect
+import collections
+import csv
+import hashlib
+import importlib
+import itertools
+import os
+import random
+import shutil
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+CSV_PATH = ROOT / "Skincare _ SHISEIDO.csv"
+NIGHTLY_STAGES = ["add_coupon_column", "add_promotions_column", "clean_overview_columns"]
+
+TRANSFORMS = {}
+
+
+def register_transform(kind: str):
+    def register(cls):
+        cls.kind = kind
+        TRANSFORMS[kind] = cls
+        return cls
+
+    return register
+
+
+def build_transform(kind: str, **options):
+    return TRANSFORMS[kind](**options)
+
+
+class Transform:
+    """One pipeline stage.
+
+    ``bind`` receives the header as produced by earlier stages and returns
+    the header for later ones; ``apply`` edits a row (a list padded to the
+    header width) in place. A stage that finds nothing to do sets ``noop``;
+    when every stage does, the file is not rewritten. A stage that sets
+    ``scans_rows`` sees every source row through ``scan`` in the counting
+    pass, before ``start``.
+    """
+
+    kind = ""
+    needs_row_count = False
+    scans_rows = False
+    noop = False
+
+    def bind(self, header: list) -> list:
+        return header
+
+    def scan(self, row: list):
+        pass
+
+    def start(self, row_count):
+        pass
+
+    def apply(self, row: list):
+        raise NotImplementedError
+
+    def summary(self) -> str:
+        return ""
+
+
+@register_transform("add_column")
+class AddColumn(Transform):
+    """Add ``column`` filled by ``value(row, header)``; ``if_exists`` is "skip" or "overwrite"."""
+
+    def __init__(self, column: str, value, if_exists: str = "skip"):
+        self.column = column
+        self.value = value
+        self.if_exists = if_exists
+        self.skipped = False
+        self.updated = 0
+
+    def bind(self, header: list) -> list:
+        self.header = header
+        if self.column in header:
+            self.skipped = self.noop = self.if_exists == "skip"
+            self.index = header.index(self.column)
+            return header
+        self.index = len(header)
+        return header + [self.column]
+
+    def apply(self, row: list):
+        if self.skipped:
+            return
+        row[self.index] = self.value(row, self.header)
+        self.updated += 1
+
+    def summary(self) -> str:
+        if self.skipped:
+            return f"{self.column} column already exists"
+        return f"Set {self.column} on {self.updated} rows"
+
+
+@register_transform("clean_column")
+class CleanColumns(Transform):
+    """Run ``clean`` over the non-empty cells of ``columns``."""
+
+    def __init__(self, columns, clean):
+        self.columns = list(columns)
+        self.clean = clean
+        self.indexes = []
+        self.changed = 0
+        self.missing = []
+
+    def bind(self, header: list) -> list:
+        self.missing = [column for column in self.columns if column not in header]
+        self.noop = bool(self.missing)
+        self.indexes = [] if self.missing else [header.index(column) for column in self.columns]
+        return header
+
+    def apply(self, row: list):
+        for index in self.indexes:
+            value = row[index]
+            if value:
+                cleaned = self.clean(value)
+                if cleaned != value:
+                    row[index] = cleaned
+                    self.changed += 1
+
+    def summary(self) -> str:
+        if self.missing:
+            return f"Column not found: {', '.join(self.missing)}"
+        return f"Cleaned {'/'.join(self.columns)} in {self.changed} cells"
+
+
+def distribution_counts(distribution, total: int) -> list:
+    """Exact per-value counts for ``total`` rows; the last bucket takes the rounding remainder."""
+    counts = []
+    remainder = total
+    for value, ratio in distribution[:-1]:
+        count = round(total * ratio)
+        counts.append((value, count))
+        remainder -= count
+    counts.append((distribution[-1][0], remainder))
+    return counts
+
+
+@register_transform("assign_distribution")
+class AssignFromDistribution(AddColumn):
+    """Fill ``column`` so values hit the exact ``distribution_counts`` over all rows.
+
+    Without a ``seed``, uses sequential selection sampling: each row draws a
+    value with probability ``remaining[value] / rows_left``, which needs only
+    the remaining counts rather than a shuffled list of every value.
+
+    With a ``seed``, the counting pass ranks every row by a hash of the seed
+    and its ``key_column``, then by how many earlier rows share that key. The
+    ranks are cut at the ``distribution_counts`` boundaries. A row's value
+    then depends only on its rank, so adding or removing other rows moves
+    only the rows near a boundary. The key is read from the source row, so
+    an earlier stage must not change it.
+    """
+
+    needs_row_count = True
+
+    def __init__(
+        self, column: str, distribution, rng=None, if_exists: str = "overwrite", seed=None, key_column=None
+    ):
+        super().__init__(column, self.draw, if_exists)
+        self.distribution = distribution
+        self.rng = rng or random.Random()
+        self.seed = seed
+        self.key_column = key_column
+        self.key_index = None
+        self.counts = []
+        self.remaining = {}
+        self.rows_left = 0
+        self.scans_rows = seed is not None
+        self.ranks = []
+        self.ends = []
+        self.occurrences = collections.Counter()
+
+    def bind(self, header: list) -> list:
+        header = super().bind(header)
+        self.key_index = header.index(self.key_column) if self.key_column in header else None
+        return header
+
+    def scan(self, row: list):
+        self.ranks.append(self.rank_key(row))
+
+    def start(self, row_count):
+        self.counts = distribution_counts(self.distribution, row_count)
+        self.remaining = dict(self.counts)
+        self.rows_left = row_count
+        self.ranks.sort()
+        self.ends = list(itertools.accumulate(count for _, count in self.counts))
+        # Occurrences are counted again for the rows as they are written.
+        self.occurrences.clear()
+
+    def row_key(self, row: list) -> str:
+        if self.key_index is not None:
+            return row[self.key_index]
+        # No key column: every other cell, so the value being assigned doesn't feed back in.
+        return "\x1f".join(value for index, value in enumerate(row) if index != self.index)
+
+    def rank_key(self, row: list) -> int:
+        """The row key's seeded hash, then its occurrence among rows with that key, packed in one int."""
+        key = self.row_key(row)
+        occurrence = self.occurrences[key]
+        self.occurrences[key] += 1
+        digest = hashlib.blake2b(f"{self.seed}\0{key}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") << 32 | occurrence
+
+    def draw(self, row: list, header: list) -> str:
+        if self.seed is not None:
+            rank = bisect.bisect_left(self.ranks, self.rank_key(row))
+            return self.counts[min(bisect.bisect_right(self.ends, rank), len(self.counts) - 1)][0]
+        if self.rows_left <= 0:
+            return ""
+        pick = self.rng.random() * self.rows_left
+        self.rows_left -= 1
+        for value, remaining in self.remaining.items():
+            if pick < remaining:
+                self.remaining[value] -= 1
+                return value
+            pick -= remaining
+        # Float rounding at the very top of the range: take the last non-empty bucket.
+        value = next(value for value, remaining in reversed(self.remaining.items()) if remaining)
+        self.remaining[value] -= 1
+        return value
+
+    def summary(self) -> str:
+        total = sum(count for _, count in self.counts)
+        lines = [super().summary(), f"Total data rows: {total}"]
+        for value, count in self.counts:
+            label = repr(value) if value else "(blank)"
+            lines.append(f"  {label}: {count} ({100 * count / total:.1f}%)" if total else f"  {label}: 0")
+        return "\n".join(lines)
+
+
+def detect_line_terminator(csv_path: Path) -> str:
+    """Keep the source's line endings so an unchanged pass rewrites identical bytes."""
+    with open(csv_path, "rb") as handle:
+        first_line = handle.readline()
+    return "\r\n" if first_line.endswith(b"\r\n") else "\n"
+
+
+def count_rows(csv_path: Path, scanners=(), width: int = 0) -> int:
+    """Data rows in ``csv_path``; each is also passed, padded to ``width``, to every ``scanners`` stage."""
+    with open(csv_path, newline="", encoding="utf-8") as handle:
+        reader = csv.reader(handle)
+        next(reader, None)
+        if not scanners:
+            return sum(1 for _ in reader)
+        count = 0
+        for row in reader:
+            if len(row) < width:
+                row.extend([""] * (width - len(row)))
+            for transform in scanners:
+                transform.scan(row)
+            count += 1
+        return count
+
+
+def run_pipeline(csv_path: Path, transforms: list) -> int:
+    """Stream ``csv_path`` through ``transforms`` and atomically replace it; returns data rows written."""
+    csv_path = Path(csv_path)
+    with open(csv_path, newline="", encoding="utf-8") as source:
+        reader = csv.reader(source)
+        header = next(reader, None)
+        if header is None:
+            print("CSV is empty")
+            return 0
+        for transform in transforms:
+            header = transform.bind(header)
+        row_count = None
+        if any(transform.needs_row_count for transform in transforms):
+            scanners = [transform for transform in transforms if transform.scans_rows]
+            row_count = count_rows(csv_path, scanners, len(header))
+        for transform in transforms:
+            transform.start(row_count)
+        if all(transform.noop for transform in transforms):
+            print_summaries(transforms)
+            return 0
+
+        handle, tmp_name = tempfile.mkstemp(prefix=f".{csv_path.name}.", dir=csv_path.parent)
+        written = 0
+        try:
+            with os.fdopen(handle, "w", newline="", encoding="utf-8") as target:
+                writer = csv.writer(target, lineterminator=detect_line_terminator(csv_path))
+                writer.writerow(header)
+                width = len(header)
+                for row in reader:
+                    if len(row) < width:
+                        row.extend([""] * (width - len(row)))
+                    for transform in transforms:
+                        transform.apply(row)
+                    writer.writerow(row)
+                    written += 1
+            shutil.copymode(csv_path, tmp_name)
+            os.replace(tmp_name, csv_path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    print_summaries(transforms)
+    return written
+
+
+def print_summaries(transforms: list):
+    for transform in transforms:
+        summary = transform.summary()
+        if summary:
+            print(summary)
+
+
+def load_stages(names) -> list:
+    """``build_stage()`` from each named column script module."""
+    return [importlib.import_module(name).build_stage() for name in names]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply column scripts to the CSV in one streaming pass.")
+    parser.add_argument(
+        "stages", nargs="*", default=NIGHTLY_STAGES, help=f"column script modules (default: {' '.join(NIGHTLY_STAGES)})"
+    )
+    parser.add_argument("--csv", type=Path, default=CSV_PATH)
+    args = parser.parse_args(argv)
+    rows = run_pipeline(args.csv, load_stages(args.stages))
+    print(f"Rewrote {args.csv} ({rows} rows) in one pass")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,13 @@ const OPENAI_MODEL = process.env.OPENAI_MODEL || "gpt-4o-mini";
 const JSON_CATALOG_PATH = path.join(ROOT_DIR, "shiseido-catalog.json");
 const CSV_CATALOG_PATH = path.join(ROOT_DIR, "Skincare _ SHISEIDO.csv");
 const FALLBACK_CATALOG_PATH = path.join(ROOT_DIR, "mock-beauty-catalog.json");
+// Bumped by catalog_adapter.py after every build, including each `--watch` rebuild.
+const CATALOG_GENERATION_PATH = path.join(ROOT_DIR, "shiseido-catalog.generation");
+const CATALOG_POLL_MS = 1000;
+// Optional catalog_query.py service; rankings fall back to getRankedCandidates when unset or down.
+const CATALOG_QUERY_URL = (process.env.CATALOG_QUERY_URL || "").replace(/\/+$/, "");
+// A service that hangs rather than refusing the connection must not hold up /api/chat.
+const CATALOG_QUERY_TIMEOUT_MS = Number(process.env.CATALOG_QUERY_TIMEOUT_MS) || 300;
 
 const AGENT_RESPONSE_SCHEMA = {
   type: "object",
@@ -389,9 +396,30 @@ function loadCatalog() {
   };
 }
 
-const catalogPayload = loadCatalog();
-const catalog = catalogPayload.products;
-const catalogById = new Map(catalog.map((product) => [product.id, product]));
+let catalogPayload = loadCatalog();
+let catalog = catalogPayload.products;
+let catalogById = new Map(catalog.map((product) => [product.id, product]));
+
+function reloadCatalog() {
+  try {
+    const payload = loadCatalog();
+    catalogPayload = payload;
+    catalog = payload.products;
+    catalogById = new Map(catalog.map((product) => [product.id, product]));
+    console.log(`Reloaded ${catalog.length} products from ${catalogPayload.source}`);
+  } catch (error) {
+    console.error("Catalog reload failed; keeping the loaded catalog", error?.message);
+  }
+}
+
+function watchCatalogGeneration() {
+  // Outputs are renamed into place before the generation changes, so a reload never sees a partial file.
+  fs.watchFile(CATALOG_GENERATION_PATH, { interval: CATALOG_POLL_MS }, (current, previous) => {
+    if (current.mtimeMs !== previous.mtimeMs) {
+      reloadCatalog();
+    }
+  });
+}
 
 function tokenize(value) {
   return cleanText(value)
@@ -636,8 +664,36 @@ function getRankedCandidates(options) {
     .slice(0, 12);
 }
 
+async function rankCandidates(options) {
+  if (!CATALOG_QUERY_URL) return getRankedCandidates(options);
+
+  try {
+    const response = await fetch(`${CATALOG_QUERY_URL}/candidates`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        query: options.query,
+        activeFilter: options.activeFilter,
+        refinementIds: options.refinementIds,
+        intentFilters: options.intentFilters,
+      }),
+      signal: AbortSignal.timeout(CATALOG_QUERY_TIMEOUT_MS),
+    });
+    if (!response.ok) throw new Error(`status ${response.status}`);
+    const { ids } = await response.json();
+    return ids.map((id) => catalogById.get(id)).filter(Boolean);
+  } catch (error) {
+    console.error("Catalog query service failed, ranking locally", { message: error?.message });
+    return getRankedCandidates(options);
+  }
+}
+
 function buildPromptCandidates(products) {
-  return products.slice(0, 12).map((product) => ({
+  return products.slice(0, 12).map(buildPromptCandidate);
+}
+
+function buildPromptCandidate(product) {
+  return {
     id: product.id,
     name: product.name,
     category: product.category,
@@ -649,8 +705,9 @@ function buildPromptCandidates(products) {
     collections: product.collections,
     coupon: product.coupon_applicable,
     promotions: product.promotions,
-    description: product.description,
-  }));
+    // catalog_adapter.py cuts the long text to a token budget as prompt_summary; CSV and mock catalogs have none.
+    description: product.prompt_summary || product.description,
+  };
 }
 
 function inferSentimentFromQuery(query) {
@@ -690,7 +747,7 @@ function buildFallbackResponse(options, candidates, reason) {
 }
 
 async function buildAgentResponse(options) {
-  const rankedCandidates = getRankedCandidates(options);
+  const rankedCandidates = await rankCandidates(options);
 
   if (!openai) {
     return buildFallbackResponse(options, rankedCandidates, "agent key not configured");
@@ -803,7 +860,7 @@ app.post("/api/chat", async (request, response) => {
       type: error?.type,
       name: error?.name,
     });
-    const rankedCandidates = getRankedCandidates({
+    const rankedCandidates = await rankCandidates({
       query,
       activeFilter: cleanText(request.body?.activeFilter),
       refinementIds: Array.isArray(request.body?.refinementIds) ? request.body.refinementIds : [],
@@ -815,13 +872,23 @@ app.post("/api/chat", async (request, response) => {
   }
 });
 
-app.use(express.static(ROOT_DIR));
+app.use(
+  express.static(ROOT_DIR, {
+    setHeaders(response, filePath) {
+      // Listing and detail shard names carry a content hash (see catalog_shards.py).
+      if (/\.shards[\\/](listing|detail)[\\/]/.test(filePath)) {
+        response.setHeader("Cache-Control", "public, max-age=31536000, immutable");
+      }
+    },
+  })
+);
 
 app.use((_request, response) => {
   response.sendFile(path.join(ROOT_DIR, "index.html"));
 });
 
 if (require.main === module) {
+  watchCatalogGeneration();
   app.listen(PORT, () => {
     console.log(
       `Shopper agent server running on http://localhost:${PORT} using ${catalogPayload.source}${
@@ -831,4 +898,4 @@ if (require.main === module) {
   });
 }
 
-module.exports = { app };
+module.exports = { app, getRankedCandidates, rankCandidates };